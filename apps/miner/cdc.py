@@ -0,0 +1,85 @@
+"""Content-defined chunking: cut a byte stream where a rolling hash says so.
+
+Cut points depend only on the bytes around them, so an insertion or deletion in a
+large file only changes the fragments next to the edit, and content that repeats
+across files produces identical, deduplicable fragments.
+"""
+
+from __future__ import annotations
+
+import hashlib
+from collections import deque
+
+import numpy as np
+
+WINDOW = 48
+
+# fixed random table, derived rather than stored so cut points never change
+GEAR = np.frombuffer(
+    b"".join(hashlib.sha256(bytes([i])).digest()[:8] for i in range(256)), dtype="<u8"
+)
+
+
+class ContentChunker:
+    """Split a stream fed in arbitrary pieces into fragments of about *avg_size* bytes.
+
+    The rolling hash at a boundary is the sum of ``GEAR[b]`` over the ``WINDOW``
+    bytes before it (mod 2**64), computed for a whole buffer at once from a cumulative
+    sum. A boundary is a candidate cut when the top ``log2(avg_size)`` bits of the
+    hash are zero; fragments are kept between ``avg_size // 4`` and
+    ``avg_size * 4`` bytes. The fragments produced do not depend on how the
+    stream was split into ``feed`` calls.
+    """
+
+    def __init__(self, avg_size: int) -> None:
+        bits = max(1, avg_size.bit_length() - 1)
+        self.shift = np.uint64(64 - bits)
+        self.min_size = max(WINDOW, avg_size // 4)
+        self.max_size = max(self.min_size, avg_size * 4)
+        self._tail = b""  # last WINDOW - 1 bytes fed
+        self._pos = 0  # stream offset of the end of the data fed so far
+        self._start = 0  # stream offset of the first pending byte
+        self._pending = bytearray()
+        self._cands: deque[int] = deque()
+
+    def feed(self, data: bytes) -> list[bytes]:
+        """Add *data*; return the fragments it completes."""
+        if not data:
+            return []
+        win = self._tail + data
+        sums = np.zeros(len(win) + 1, dtype=np.uint64)
+        np.cumsum(GEAR[np.frombuffer(win, dtype=np.uint8)], out=sums[1:])
+        # boundary k of `win` (after k bytes); those up to len(tail) were seen last call
+        lo = max(WINDOW, len(self._tail) + 1)
+        if len(win) >= lo:
+            h = sums[lo:] - sums[lo - WINDOW : len(win) + 1 - WINDOW]
+            hits = np.flatnonzero((h >> self.shift) == 0) + (lo + self._pos - len(self._tail))
+            self._cands.extend(hits.tolist())
+        self._pos += len(data)
+        self._tail = win[-(WINDOW - 1) :]
+        self._pending += data
+        return self._cut(final=False)
+
+    def finish(self) -> list[bytes]:
+        """Return the remaining fragments once the stream has ended."""
+        return self._cut(final=True)
+
+    def _cut(self, final: bool) -> list[bytes]:
+        out = []
+        while self._pending:
+            end = self._start + len(self._pending)
+            while self._cands and self._cands[0] < self._start + self.min_size:
+                self._cands.popleft()
+            if self._cands and self._cands[0] <= self._start + self.max_size:
+                cut = self._cands.popleft()
+            elif end >= self._start + self.max_size:
+                cut = self._start + self.max_size
+            elif final:
+                cut = end
+            else:
+                break
+            n = cut - self._start
+            out.append(bytes(self._pending[:n]))
+            del self._pending[:n]
+            self._start = cut
+        return out
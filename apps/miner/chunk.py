@@ -4,9 +4,94 @@ from __future__ import annotations
 
 import argparse
 from pathlib import Path
+from typing import Iterator
+
+import blake3
+import pyarrow as pa
+import pyarrow.parquet as pq
+import zstandard
+from rag_soup.chunking import chunk_spans
 
 import utils
 
+CHUNKS_SCHEMA = pa.schema(
+    [
+        ("chunk_id", pa.string()),  # blake3(text + recipe_v)
+        ("norm_cid", pa.string()),
+        ("span_start", pa.int64()),  # character offsets into the normalized text
+        ("span_end", pa.int64()),
+        ("text", pa.string()),
+        ("norm_hash", pa.string()),  # blake3(text)
+    ]
+)
+
+
+def chunk_document(
+    norm_cid: str,
+    text: str,
+    recipe_v: str,
+    target_tokens: int = 800,
+    overlap_tokens: int = 200,
+    max_chars: int | None = 8000,
+    splitter: str = "semantic",
+) -> Iterator[dict]:
+    """Yield the chunks.parquet rows of one normalized text, lazily."""
+    spans = chunk_spans(
+        text,
+        target_tokens=target_tokens,
+        overlap_tokens=overlap_tokens,
+        max_chars=max_chars,
+        splitter=splitter,
+    )
+    for span in spans:
+        piece = text[span.start : span.end]
+        data = piece.encode("utf-8")
+        yield {
+            "chunk_id": blake3.blake3(data + recipe_v.encode()).hexdigest(),
+            "norm_cid": norm_cid,
+            "span_start": span.start,
+            "span_end": span.end,
+            "text": piece,
+            "norm_hash": blake3.blake3(data).hexdigest(),
+        }
+
+
+def iter_chunks(
+    src: Path,
+    recipe_v: str,
+    seen: set[str] | None = None,
+    batch_rows: int = 1_000,
+    **opts,
+) -> Iterator[dict]:
+    """Yield chunks.parquet rows for normalized_extractions.parquet *src*, in order.
+
+    The table is read *batch_rows* rows at a time and each text is chunked lazily,
+    so only one batch of texts is held in memory. norm_cid is a hash of the text, so
+    exact copies share it: each norm_cid is chunked once and added to *seen*, and
+    later rows with a norm_cid already in *seen* are skipped. *opts* go to
+    ``chunk_document``.
+    """
+    seen = set() if seen is None else seen
+    dctx = zstandard.ZstdDecompressor()
+    pf = pq.ParquetFile(src)
+    cols = ["norm_cid", "text" if "text" in pf.schema_arrow.names else "text_uri"]
+    for batch in pf.iter_batches(batch_size=batch_rows, columns=cols):
+        cids = batch.column("norm_cid").to_pylist()
+        for cid, text in zip(cids, utils.batch_texts(batch, dctx)):
+            if cid not in seen:
+                seen.add(cid)
+                yield from chunk_document(cid, text, recipe_v, **opts)
+
+
+def chunk_options(chunk_cfg: dict) -> dict:
+    """``chunk_document`` keyword arguments from the ``chunk`` config section."""
+    return {
+        "target_tokens": chunk_cfg.get("target_tokens", 800),
+        "overlap_tokens": chunk_cfg.get("overlap_tokens", 200),
+        "max_chars": chunk_cfg.get("max_chars", 8000),
+        "splitter": chunk_cfg.get("splitter", "semantic"),
+    }
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(description=__doc__)
@@ -18,9 +103,29 @@ def main() -> None:
     cfg = utils.load_config(args.config)
     processed = Path(cfg["paths"]["processed_dir"])
     utils.ensure_dir(processed)
+    chunk_cfg = cfg.get("chunk", {})
+    recipe_v = cfg.get("normalize", {}).get("recipe_v", "v1")
 
-    utils.touch_parquet(processed / "chunks.parquet")
-    utils.log_run(Path(cfg["paths"]["logs_dir"]), "chunk", {"config": str(args.config)})
+    src = processed / "normalized_extractions.parquet"
+    stats = {}
+    if src.exists() and src.stat().st_size:
+        seen: set[str] = set()
+        rows = iter_chunks(src, recipe_v, seen=seen, **chunk_options(chunk_cfg))
+        with utils.ParquetBatchWriter(
+            processed / "chunks.parquet",
+            CHUNKS_SCHEMA,
+            chunk_cfg.get("batch_rows", 10_000),
+        ) as out:
+            for row in rows:
+                out.write(row)
+        stats = {"chunks": out.rows, "documents": len(seen)}
+    else:  # upstream stage has not produced a table yet
+        utils.touch_parquet(processed / "chunks.parquet")
+    utils.log_run(
+        Path(cfg["paths"]["logs_dir"]),
+        "chunk",
+        {"config": str(args.config), **stats},
+    )
 
 
 if __name__ == "__main__":
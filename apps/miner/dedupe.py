@@ -3,10 +3,377 @@
 from __future__ import annotations
 
 import argparse
+import shutil
 from pathlib import Path
 
+import blake3
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import zstandard
+
 import utils
 
+SIGN_BYTES = 8 << 20  # text bytes signed per vectorized pass
+_POLY = np.uint64(1000003)
+_POLY_INV = np.uint64(pow(1000003, -1, 2**64))
+SPILL_DTYPE = np.dtype([("key", "<u8"), ("idx", "<u8")])
+# per bucket: bounds verification cost on huge boilerplate buckets. A member that matches
+# none of the leaders once the cap is reached is not compared with the later members, so
+# a near duplicate of it is only found through another band (exact copies always are)
+MAX_LEADERS = 16
+
+DEDUPE_SCHEMA = pa.schema(
+    [
+        ("norm_cid", pa.string()),
+        ("norm_hash", pa.string()),
+        ("simhash64", pa.uint64()),
+        ("canonical_norm_cid", pa.string()),
+        ("match", pa.string()),  # "self" | "exact" | "near"
+        ("jaccard", pa.float32()),  # MinHash estimate against the canonical
+    ]
+)
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    """Mix uint64 values into well-spread 64-bit hashes (vectorized, wraps mod 2**64)."""
+    with np.errstate(over="ignore"):
+        x = x + np.uint64(0x9E3779B97F4A7C15)
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _is_word_byte(b: np.ndarray) -> np.ndarray:
+    # ASCII letters, digits and "_", plus every byte of a multi-byte UTF-8 character
+    return (
+        ((b >= 48) & (b <= 57))
+        | ((b >= 65) & (b <= 90))
+        | ((b >= 97) & (b <= 122))
+        | (b == 95)
+        | (b >= 128)
+    )
+
+
+def word_hashes(texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """64-bit hashes of the lowercased words of *texts*, and the text each belongs to.
+
+    The texts are joined into one byte buffer and every word is hashed at once: with
+    ``G[i] = sum(v[j] * P**j for j < i)`` over the bytes ``v``, the word spanning
+    ``[s, e)`` hashes to ``(G[e] - G[s]) * P**-s`` (mod 2**64, P odd), which does not
+    depend on where the word sits in the buffer.
+    """
+    data = "\x00".join(t.replace("\x00", " ") for t in texts).lower().encode("utf-8")
+    if not data:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    b = np.frombuffer(data, dtype=np.uint8)
+    edges = np.diff(np.concatenate(([0], _is_word_byte(b).view(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+    with np.errstate(over="ignore"):
+        powers = np.full(len(b) + 1, _POLY, dtype=np.uint64)
+        powers[0] = 1
+        np.cumprod(powers, out=powers)
+        inverse = np.full(len(b) + 1, _POLY_INV, dtype=np.uint64)
+        inverse[0] = 1
+        np.cumprod(inverse, out=inverse)
+        g = np.zeros(len(b) + 1, dtype=np.uint64)
+        np.cumsum((b + np.uint64(1)) * powers[:-1], out=g[1:])
+        h = _splitmix64((g[ends] - g[starts]) * inverse[starts])
+    doc = np.searchsorted(np.flatnonzero(b == 0), starts)
+    return h, doc
+
+
+def shingle_hashes(
+    words: np.ndarray, doc: np.ndarray, n_docs: int, k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """32-bit hashes of every k-word shingle, and the doc each belongs to (doc order).
+
+    A document shorter than *k* words is a single shingle; an empty one gets a
+    single zero shingle so that every document has at least one.
+    """
+    counts = np.bincount(doc, minlength=n_docs)
+    first = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    i = np.arange(len(words))
+    end = (first + counts)[doc]
+    acc = np.zeros(len(words), dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for j in range(k):
+            take = i + j < end
+            nxt = words[np.minimum(i + j, max(len(words) - 1, 0))]
+            acc = np.where(take, acc * _POLY + nxt, acc)
+    keep = (i + k <= end) | ((counts[doc] < k) & (i == first[doc]))
+    empty = np.flatnonzero(counts == 0)
+    x = np.concatenate(
+        (_splitmix64(acc[keep]) >> np.uint64(32), np.zeros(len(empty), np.uint64))
+    )
+    owner = np.concatenate((doc[keep], empty))
+    order = np.argsort(owner, kind="stable")
+    return x[order], owner[order]
+
+
+class Signer:
+    """MinHash signatures and 64-bit SimHashes for batches of documents.
+
+    Both are computed for a whole batch at once: MinHash runs one vectorized pass
+    per permutation over the concatenated shingles of the batch and reduces each
+    document's segment with ``np.minimum.reduceat``; SimHash sums the bit columns
+    of every word hash per document with ``np.add.reduceat``.
+    """
+
+    def __init__(self, num_perm: int, shingle: int = 5, seed: int = 1) -> None:
+        rng = np.random.default_rng(seed)
+        # multiply-shift hashing: the top 32 bits of (a * x + b) mod 2**64, a odd
+        self.a = rng.integers(0, 2**64, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2**64, num_perm, dtype=np.uint64)
+        self.shingle = shingle
+
+    def sign(self, texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        """Return (minhash uint32[len(texts), num_perm], simhash uint64[len(texts)])."""
+        sig = np.empty((len(texts), len(self.a)), dtype=np.uint32)
+        sim = np.empty(len(texts), dtype=np.uint64)
+        # bound the per-byte working arrays of word_hashes
+        lo, size = 0, 0
+        for hi, t in enumerate(texts, 1):
+            size += len(t)
+            if size >= SIGN_BYTES or hi == len(texts):
+                sig[lo:hi], sim[lo:hi] = self._sign(texts[lo:hi])
+                lo, size = hi, 0
+        return sig, sim
+
+    def _sign(self, texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        words, doc = word_hashes(texts)
+        x, owner = shingle_hashes(words, doc, len(texts), self.shingle)
+        starts = np.searchsorted(owner, np.arange(len(texts)))
+        sig = np.empty((len(texts), len(self.a)), dtype=np.uint32)
+        with np.errstate(over="ignore"):
+            for i, (a, b) in enumerate(zip(self.a, self.b)):
+                sig[:, i] = np.minimum.reduceat((a * x + b) >> np.uint64(32), starts)
+        return sig, simhash64(words, doc, len(texts))
+
+
+def simhash64(words: np.ndarray, doc: np.ndarray, n_docs: int) -> np.ndarray:
+    """64-bit SimHash per document over its word hashes (0 for one without words)."""
+    counts = np.bincount(doc, minlength=n_docs)
+    present = np.flatnonzero(counts)
+    out = np.zeros(n_docs, dtype=np.uint64)
+    if not len(present):
+        return out
+    starts = np.searchsorted(doc, present)
+    half = counts[present]
+    acc = np.zeros(len(present), dtype=np.uint64)
+    # one flat reduceat per bit is several times faster than one over a (words, 64) matrix
+    for i in range(64):
+        bit = np.uint64(i)
+        ones = np.add.reduceat(((words >> bit) & np.uint64(1)).astype(np.int32), starts)
+        acc |= (2 * ones > half).astype(np.uint64) << bit
+    out[present] = acc
+    return out
+
+
+def band_keys(sig: np.ndarray, bands: int, rows: int) -> np.ndarray:
+    """One uint64 bucket key per (document, band) from that band's signature rows."""
+    keys = np.broadcast_to(
+        np.arange(bands, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15),
+        (len(sig), bands),
+    ).copy()
+    s = sig[:, : bands * rows].astype(np.uint64).reshape(len(sig), bands, rows)
+    for r in range(rows):
+        keys = _splitmix64(keys ^ s[:, :, r])
+    return keys
+
+
+class UnionFind:
+    """Disjoint sets over 0..n-1 whose root is always the smallest member."""
+
+    def __init__(self, n: int) -> None:
+        self.parent = np.arange(n, dtype=np.int64)
+
+    def find(self, i: int) -> int:
+        p = self.parent
+        root = i
+        while p[root] != root:
+            root = p[root]
+        while p[i] != root:
+            p[i], i = root, p[i]
+        return int(root)
+
+    def union(self, i: int, j: int) -> None:
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+    def roots(self) -> np.ndarray:
+        """Root of every element, by vectorized pointer jumping."""
+        p = self.parent.copy()
+        while True:
+            pp = p[p]
+            if np.array_equal(pp, p):
+                return p
+            p = pp
+
+
+def dedupe_table(
+    src: Path,
+    dst: Path,
+    work_dir: Path,
+    bands: int = 32,
+    rows: int = 4,
+    threshold: float = 0.88,
+    shingle: int = 5,
+    batch_rows: int = 10_000,
+    partitions: int = 64,
+) -> dict:
+    """Map every row of normalized_extractions.parquet *src* to its canonical row.
+
+    Rows are read a batch at a time. Each batch's MinHash signatures go to a
+    ``np.memmap`` under *work_dir* and its LSH band keys are spilled to
+    *partitions* files by key; only a few numbers per row stay in memory. Each
+    partition is then sorted by bucket key; rows sharing a bucket are verified
+    against the bucket's canonical candidates by estimated Jaccard similarity
+    (>= *threshold*) and merged with union-find, whose root (the earliest row)
+    becomes the canonical one. No pair outside a shared bucket is ever compared.
+    Rows with the same norm_hash are merged directly, whatever their buckets.
+    """
+    num_perm = bands * rows
+    pf = pq.ParquetFile(src)
+    n = pf.metadata.num_rows
+    if work_dir.exists():
+        shutil.rmtree(work_dir)
+    utils.ensure_dir(work_dir)
+    signer = Signer(num_perm, shingle)
+    sigs = np.lib.format.open_memmap(
+        work_dir / "minhash.npy",
+        mode="w+",
+        dtype=np.uint32,
+        shape=(max(n, 1), num_perm),
+    )
+    simhashes = np.zeros(n, dtype=np.uint64)
+    # 64-bit hash of norm_hash: exact copies are joined on it, not through LSH buckets
+    exact = np.zeros(n, dtype=np.uint64)
+    spills = [open(work_dir / f"part-{p:04d}.bin", "wb") for p in range(partitions)]
+    dctx = zstandard.ZstdDecompressor()
+    cols = [
+        c
+        for c in ("norm_cid", "norm_hash", "text", "text_uri")
+        if c in pf.schema_arrow.names
+    ]
+    try:
+        pos = 0
+        for batch in pf.iter_batches(batch_size=batch_rows, columns=cols):
+            texts = utils.batch_texts(batch, dctx)
+            sig, sim = signer.sign(texts)
+            m = len(texts)
+            sigs[pos : pos + m] = sig
+            simhashes[pos : pos + m] = sim
+            hashes = _norm_hashes(batch, texts)
+            exact[pos : pos + m] = [_hash64(h) for h in hashes]
+            keys = band_keys(sig, bands, rows)
+            spill = np.empty(keys.size, dtype=SPILL_DTYPE)
+            spill["key"] = keys.ravel()
+            spill["idx"] = np.repeat(np.arange(pos, pos + m, dtype=np.uint64), bands)
+            part = spill["key"] % np.uint64(partitions)
+            for p in np.unique(part):
+                spills[p].write(spill[part == p].tobytes())
+            pos += m
+    finally:
+        for f in spills:
+            f.close()
+
+    uf = UnionFind(n)
+    order = np.argsort(exact, kind="stable")
+    for i in np.flatnonzero(exact[order][1:] == exact[order][:-1]).tolist():
+        uf.union(int(order[i]), int(order[i + 1]))
+    for p in range(partitions):
+        entries = np.fromfile(work_dir / f"part-{p:04d}.bin", dtype=SPILL_DTYPE)
+        if not len(entries):
+            continue
+        # band is mixed into the key and rows were spilled in idx order, so a stable
+        # sort on the key alone groups each bucket with its members in idx order
+        entries = entries[np.argsort(entries["key"], kind="stable")]
+        same = (entries["key"][1:] == entries["key"][:-1]).view(np.int8)
+        bounds = np.flatnonzero(np.diff(np.concatenate(([0], same, [0]))))
+        for start, end in zip(bounds[::2], bounds[1::2] + 1):
+            _verify_bucket(entries["idx"][start:end], sigs, uf, threshold)
+
+    roots = uf.roots()
+    last = np.arange(n)
+    np.maximum.at(last, roots, np.arange(n))  # last member of each cluster
+    stats = {"rows": n, "exact": 0, "near": 0}
+    canonical_cid: dict[int, str] = {}
+    with utils.ParquetBatchWriter(dst, DEDUPE_SCHEMA, batch_rows) as out:
+        pos = 0
+        for batch in pf.iter_batches(batch_size=batch_rows, columns=cols):
+            texts = None if "norm_hash" in cols else utils.batch_texts(batch, dctx)
+            hashes = _norm_hashes(batch, texts)
+            cids = batch.column("norm_cid").to_pylist()
+            for idx, cid, h in zip(range(pos, pos + len(cids)), cids, hashes):
+                root = int(roots[idx])
+                if root == idx:
+                    match, jac, canonical = "self", 1.0, cid
+                    if last[idx] > idx:
+                        canonical_cid[idx] = cid
+                else:
+                    # "exact" only against the canonical row's own text: a cluster
+                    # can hold exact copies of a member that is itself only near it
+                    match = "exact" if exact[idx] == exact[root] else "near"
+                    jac = float(np.mean(sigs[idx] == sigs[root]))
+                    canonical = canonical_cid[root]
+                    stats[match] += 1
+                out.write(
+                    {
+                        "norm_cid": cid,
+                        "norm_hash": h,
+                        "simhash64": int(simhashes[idx]),
+                        "canonical_norm_cid": canonical,
+                        "match": match,
+                        "jaccard": jac,
+                    }
+                )
+            pos += len(cids)
+            # a canonical id is only needed until its cluster's last member is written
+            canonical_cid = {k: v for k, v in canonical_cid.items() if last[k] >= pos}
+    del sigs
+    shutil.rmtree(work_dir)
+    return stats
+
+
+def _norm_hashes(batch: pa.RecordBatch, texts: list[str] | None) -> list[str]:
+    if "norm_hash" in batch.schema.names:
+        return batch.column("norm_hash").to_pylist()
+    return [blake3.blake3(t.encode("utf-8")).hexdigest() for t in texts]
+
+
+def _hash64(norm_hash: str) -> int:
+    """A stable 64-bit hash of *norm_hash* (unlike ``hash``, not salted per process)."""
+    return int.from_bytes(blake3.blake3(norm_hash.encode("utf-8")).digest(8), "little")
+
+
+def _verify_bucket(
+    members: np.ndarray, sigs: np.ndarray, uf: UnionFind, threshold: float
+) -> None:
+    """Attach each bucket member to the first leader it matches, else make it a leader.
+
+    At most ``MAX_LEADERS`` members become leaders; a later member that matches none
+    of them is left for its other bands to join.
+    """
+    rows = np.asarray(sigs[members])  # one gather instead of a memmap read per compare
+    need = threshold * rows.shape[1]
+    leaders: list[int] = []
+    for m, idx in enumerate(members.tolist()):
+        root = uf.find(idx)
+        for lead in leaders:
+            lead_idx = int(members[lead])
+            # already joined through another band: nothing to verify
+            if (
+                uf.find(lead_idx) == root
+                or np.count_nonzero(rows[lead] == rows[m]) >= need
+            ):
+                uf.union(lead_idx, idx)
+                break
+        else:
+            if len(leaders) < MAX_LEADERS:
+                leaders.append(m)
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(description=__doc__)
@@ -18,10 +385,27 @@ def main() -> None:
     cfg = utils.load_config(args.config)
     processed = Path(cfg["paths"]["processed_dir"])
     utils.ensure_dir(processed)
+    near = cfg.get("dedupe", {}).get("near_dup", {})
 
-    utils.touch_parquet(processed / "dedupe_map.parquet")
+    src = processed / "normalized_extractions.parquet"
+    if src.exists() and src.stat().st_size:
+        stats = dedupe_table(
+            src,
+            processed / "dedupe_map.parquet",
+            processed / "_dedupe_work",
+            bands=near.get("minhash_bands", 32),
+            rows=near.get("minhash_rows", 4),
+            threshold=near.get("threshold", 0.88),
+            shingle=near.get("shingle_words", 5),
+            partitions=near.get("spill_partitions", 64),
+        )
+    else:  # upstream stage has not produced a table yet
+        utils.touch_parquet(processed / "dedupe_map.parquet")
+        stats = {}
     utils.log_run(
-        Path(cfg["paths"]["logs_dir"]), "dedupe", {"config": str(args.config)}
+        Path(cfg["paths"]["logs_dir"]),
+        "dedupe",
+        {"config": str(args.config), **stats},
     )
 
 
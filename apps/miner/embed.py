@@ -3,10 +3,309 @@
 from __future__ import annotations
 
 import argparse
+import json
+import os
+import re
+import zlib
 from pathlib import Path
+from typing import Protocol
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 import utils
 
+DTYPES = {"fp16": np.float16, "fp32": np.float32}
+MODEL_ALIASES = {
+    "bge-small": "BAAI/bge-small-en-v1.5",
+    "bge-base": "BAAI/bge-base-en-v1.5",
+}
+
+EMBEDDINGS_SCHEMA = pa.schema(
+    [
+        ("obj_type", pa.string()),  # "chunk"
+        ("obj_id", pa.string()),
+        ("model", pa.string()),
+        ("dim", pa.int32()),
+        ("dtype", pa.string()),
+        ("store", pa.string()),  # VectorCache directory holding the vector
+        ("row", pa.int64()),  # row of the vector in <store>/vectors.bin
+    ]
+)
+
+
+class Embedder(Protocol):
+    """Anything that turns a batch of texts into an ``(n, dim)`` float array."""
+
+    name: str
+    dim: int
+
+    def embed(self, texts: list[str]) -> np.ndarray: ...
+
+
+class HashEmbedder:
+    """Feature-hashed bag of words: no model, no dependencies, stable across runs.
+
+    Meant for tests and dry runs of the pipeline, not for retrieval quality.
+    """
+
+    _WORD = re.compile(r"\w+")
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim = dim
+        self.name = f"hash-{dim}"
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for w in self._WORD.findall(text.lower()):
+                h = zlib.crc32(w.encode())
+                out[i, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+
+class SentenceTransformerEmbedder:
+    """A sentence-transformers model, normalized vectors, encoded a batch at a time."""
+
+    def __init__(self, model: str, device: str | None = None) -> None:
+        from sentence_transformers import SentenceTransformer
+
+        self.name = model
+        self._model = SentenceTransformer(
+            MODEL_ALIASES.get(model, model), device=device
+        )
+        self.dim = self._model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        return self._model.encode(
+            texts,
+            batch_size=len(texts),
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+
+
+class LlamaCppEmbedder:
+    """A GGUF embedding model through llama-cpp-python, one request per batch."""
+
+    def __init__(self, model_path: str, n_threads: int | None = None) -> None:
+        from llama_cpp import Llama
+
+        self.name = Path(model_path).stem
+        self._llm = Llama(
+            model_path=model_path,
+            embedding=True,
+            n_threads=n_threads,
+            verbose=False,
+        )
+        self.dim = self._llm.n_embd()
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        resp = self._llm.create_embedding(texts)
+        return np.asarray([d["embedding"] for d in resp["data"]], dtype=np.float32)
+
+
+def load_embedder(embed_cfg: dict) -> Embedder:
+    """Build the embedder named by ``embed.backend`` (default sentence-transformers)."""
+    backend = embed_cfg.get("backend", "sentence-transformers")
+    if backend == "hash":
+        return HashEmbedder(int(embed_cfg.get("dim", 256)))
+    if backend == "sentence-transformers":
+        return SentenceTransformerEmbedder(embed_cfg["model"], embed_cfg.get("device"))
+    if backend == "llama-cpp":
+        return LlamaCppEmbedder(embed_cfg["model_path"], embed_cfg.get("threads"))
+    raise ValueError(f"unknown embed backend: {backend!r}")
+
+
+class VectorCache:
+    """Append-only on-disk vectors for one model, keyed by chunk_id.
+
+    ``vectors.bin`` is a headerless row-major ``(rows, dim)`` array that
+    ``np.memmap`` can open directly (see ``vectors``); ``keys.txt`` holds the key
+    of each row, one per line; ``meta.json`` records the model, dim and dtype.
+    Vectors are written before their keys, so after a crash the shorter of the two
+    files decides how many rows survive and the rest is cut off on open.
+    """
+
+    def __init__(
+        self, directory: Path, model: str, dim: int, dtype: str = "fp16"
+    ) -> None:
+        utils.ensure_dir(directory)
+        self.directory = directory
+        self.dim = dim
+        self.dtype_name = dtype
+        self.dtype = np.dtype(DTYPES[dtype])
+        meta = {"model": model, "dim": dim, "dtype": dtype}
+        meta_path = directory / "meta.json"
+        if meta_path.exists():
+            stored = json.loads(meta_path.read_text(encoding="utf-8"))
+            if stored != meta:
+                raise ValueError(f"{directory} holds {stored}, not {meta}")
+        else:
+            meta_path.write_text(json.dumps(meta), encoding="utf-8")
+        self._vec_path = directory / "vectors.bin"
+        self._key_path = directory / "keys.txt"
+        self._row_bytes = dim * self.dtype.itemsize
+        keys = (
+            self._key_path.read_text(encoding="utf-8").splitlines()
+            if self._key_path.exists()
+            else []
+        )
+        size = self._vec_path.stat().st_size if self._vec_path.exists() else 0
+        n = min(len(keys), size // self._row_bytes)
+        self._rows = {k: i for i, k in enumerate(keys[:n])}
+        self._vecs = open(self._vec_path, "ab")
+        self._keys = open(self._key_path, "a", encoding="utf-8")
+        if size != n * self._row_bytes:
+            self._vecs.truncate(n * self._row_bytes)
+        if len(keys) != n:
+            self._keys.truncate(0)
+            self._keys.writelines(k + "\n" for k in keys[:n])
+            self._keys.flush()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    def row(self, key: str) -> int:
+        return self._rows[key]
+
+    def add(self, keys: list[str], vectors: np.ndarray) -> None:
+        """Append one vector per key; keys already cached are ignored."""
+        vectors = np.ascontiguousarray(vectors, dtype=self.dtype)
+        if vectors.shape != (len(keys), self.dim):
+            raise ValueError(
+                f"expected {(len(keys), self.dim)} vectors, got {vectors.shape}"
+            )
+        new = [i for i, k in enumerate(keys) if k not in self._rows]
+        if not new:
+            return
+        self._vecs.write(vectors[new].tobytes())
+        self._vecs.flush()
+        for i in new:
+            self._rows[keys[i]] = len(self._rows)
+            self._keys.write(keys[i] + "\n")
+        self._keys.flush()
+
+    def vectors(self) -> np.ndarray:
+        """Read-only memory map of all cached vectors, indexed by ``row``."""
+        self._vecs.flush()
+        if not self._rows:
+            return np.empty((0, self.dim), dtype=self.dtype)
+        return np.memmap(
+            self._vec_path,
+            dtype=self.dtype,
+            mode="r",
+            shape=(len(self._rows), self.dim),
+        )
+
+    def close(self) -> None:
+        self._vecs.close()
+        self._keys.close()
+
+    def __enter__(self) -> VectorCache:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name)
+
+
+def embed_rows(
+    ids: list[str],
+    texts: list[str],
+    cache: VectorCache,
+    embedder: Embedder,
+    batch_size: int = 128,
+) -> tuple[list[dict], int]:
+    """embeddings.parquet rows for a batch of chunks, and how many were embedded.
+
+    Only chunk_ids missing from *cache* (each one once, however many rows share it)
+    go to the embedder, *batch_size* texts per call.
+    """
+    todo: dict[str, str] = {}
+    for cid, text in zip(ids, texts):
+        if cid not in cache and cid not in todo:
+            todo[cid] = text or ""
+    keys = list(todo)
+    for i in range(0, len(keys), batch_size):
+        part = keys[i : i + batch_size]
+        cache.add(part, embedder.embed([todo[k] for k in part]))
+    rows = [
+        {
+            "obj_type": "chunk",
+            "obj_id": cid,
+            "model": embedder.name,
+            "dim": embedder.dim,
+            "dtype": cache.dtype_name,
+            "store": str(cache.directory),
+            "row": cache.row(cid),
+        }
+        for cid in ids
+    ]
+    return rows, len(keys)
+
+
+def open_cache(cache_dir: Path, embedder: Embedder, dtype: str = "fp16") -> VectorCache:
+    """The embedder's VectorCache under *cache_dir*."""
+    return VectorCache(
+        cache_dir / _slug(embedder.name), embedder.name, embedder.dim, dtype
+    )
+
+
+def embed_chunks(
+    src: Path,
+    dst: Path,
+    cache_dir: Path,
+    embedder: Embedder,
+    dtype: str = "fp16",
+    batch_size: int = 128,
+    batch_rows: int = 10_000,
+) -> dict:
+    """Embed chunks.parquet *src* into the model's cache and write embeddings.parquet *dst*.
+
+    Chunks are read *batch_rows* at a time (see ``embed_rows``); chunk_id is a
+    content hash, so after re-chunking only chunks whose text changed are embedded
+    again.
+    """
+    stats = {"rows": 0, "embedded": 0, "cached": 0}
+    pf = pq.ParquetFile(src)
+    with open_cache(cache_dir, embedder, dtype) as cache:
+        with utils.ParquetBatchWriter(dst, EMBEDDINGS_SCHEMA, batch_rows) as out:
+            for batch in pf.iter_batches(
+                batch_size=batch_rows, columns=["chunk_id", "text"]
+            ):
+                ids = batch.column("chunk_id").to_pylist()
+                texts = batch.column("text").to_pylist()
+                rows, embedded = embed_rows(ids, texts, cache, embedder, batch_size)
+                for row in rows:
+                    out.write(row)
+                stats["embedded"] += embedded
+                stats["rows"] += len(ids)
+    stats["cached"] = stats["rows"] - stats["embedded"]
+    return stats
+
+
+def load_vectors(store: Path) -> np.ndarray:
+    """Memory-map the vectors of a cache directory (the ``store`` column)."""
+    meta = json.loads((store / "meta.json").read_text(encoding="utf-8"))
+    dtype = np.dtype(DTYPES[meta["dtype"]])
+    path = store / "vectors.bin"
+    rows = (
+        os.path.getsize(path) // (meta["dim"] * dtype.itemsize) if path.exists() else 0
+    )
+    if not rows:
+        return np.empty((0, meta["dim"]), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(rows, meta["dim"]))
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(description=__doc__)
@@ -18,9 +317,26 @@ def main() -> None:
     cfg = utils.load_config(args.config)
     processed = Path(cfg["paths"]["processed_dir"])
     utils.ensure_dir(processed)
+    embed_cfg = cfg.get("embed", {})
 
-    utils.touch_parquet(processed / "embeddings.parquet")
-    utils.log_run(Path(cfg["paths"]["logs_dir"]), "embed", {"config": str(args.config)})
+    src = processed / "chunks.parquet"
+    stats = {}
+    if src.exists() and src.stat().st_size:
+        stats = embed_chunks(
+            src,
+            processed / "embeddings.parquet",
+            processed / "vectors",
+            load_embedder(embed_cfg),
+            dtype=embed_cfg.get("dtype", "fp16"),
+            batch_size=int(embed_cfg.get("batch_size", 128)),
+        )
+    else:  # upstream stage has not produced a table yet
+        utils.touch_parquet(processed / "embeddings.parquet")
+    utils.log_run(
+        Path(cfg["paths"]["logs_dir"]),
+        "embed",
+        {"config": str(args.config), **stats},
+    )
 
 
 if __name__ == "__main__":
@@ -3,10 +3,63 @@
 from __future__ import annotations
 
 import argparse
+import json
+import re
 from pathlib import Path
 
+import blake3
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import ingest
 import utils
 
+EXTRACTIONS_SCHEMA = pa.schema(
+    [
+        ("ext_cid", pa.string()),  # blake3(text + recipe_v)
+        ("blob_cid", pa.string()),
+        ("recipe_v", pa.string()),
+        ("text_stats", pa.string()),  # json: chars, tokens, lang
+        ("text", pa.string()),
+    ]
+)
+TEXT_MIMES = {"application/json", "application/xml", "application/javascript"}
+HTML_MIMES = {"text/html", "application/xhtml+xml"}
+
+_SCRIPT_RE = re.compile(r"<(script|style)[\s\S]*?</\1>", re.I)
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def extract_text(data: bytes, mime: str) -> str | None:
+    """Text of a blob, or None for formats without an extractor yet (PDF, email, ...)."""
+    if not (mime.startswith("text/") or mime in TEXT_MIMES or mime in HTML_MIMES):
+        return None
+    text = data.decode("utf-8", errors="replace").replace("\r\n", "\n")
+    if mime in HTML_MIMES:
+        text = _TAG_RE.sub(" ", _SCRIPT_RE.sub(" ", text))
+    return text
+
+
+def extract_batch(blobs: list[dict], objects: Path, recipe_v: str) -> list[dict]:
+    """extractions.parquet rows for a batch of blobs.parquet rows."""
+    out = []
+    for blob in blobs:
+        data = ingest.read_blob(objects, blob["blob_cid"])
+        text = extract_text(data, blob["mime"] or "")
+        if text is None:
+            continue
+        stats = {"chars": len(text), "tokens": len(text.split()), "lang": None}
+        out.append(
+            {
+                "ext_cid": blake3.blake3((text + recipe_v).encode()).hexdigest(),
+                "blob_cid": blob["blob_cid"],
+                "recipe_v": recipe_v,
+                "text_stats": json.dumps(stats),
+                "text": text,
+            }
+        )
+    return out
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(description=__doc__)
@@ -18,11 +71,25 @@ def main() -> None:
     cfg = utils.load_config(args.config)
     processed = Path(cfg["paths"]["processed_dir"])
     utils.ensure_dir(processed)
+    objects = Path(cfg["paths"]["object_store"])
+    recipe_v = cfg.get("normalize", {}).get("recipe_v", "v1")
 
-    # Placeholder: read blobs and create text extractions.
-    utils.touch_parquet(processed / "extractions.parquet")
+    src = processed / "blobs.parquet"
+    stats = {}
+    if src.exists() and src.stat().st_size:
+        with utils.ParquetBatchWriter(
+            processed / "extractions.parquet", EXTRACTIONS_SCHEMA
+        ) as out:
+            for batch in pq.ParquetFile(src).iter_batches(batch_size=1_000):
+                for row in extract_batch(batch.to_pylist(), objects, recipe_v):
+                    out.write(row)
+        stats = {"extractions": out.rows}
+    else:  # upstream stage has not produced a table yet
+        utils.touch_parquet(processed / "extractions.parquet")
     utils.log_run(
-        Path(cfg["paths"]["logs_dir"]), "extract", {"config": str(args.config)}
+        Path(cfg["paths"]["logs_dir"]),
+        "extract",
+        {"config": str(args.config), **stats},
     )
 
 
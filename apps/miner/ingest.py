@@ -4,10 +4,203 @@ from __future__ import annotations
 
 import argparse
 import hashlib
+import json
+import mimetypes
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import partial
 from pathlib import Path
+from typing import Iterator
 
+import blake3
+import pyarrow as pa
+import zstandard
+
+import cdc
 import utils
 
+BUFSIZE = 1 << 20
+ZSTD_LEVEL = 3
+
+SOURCES_SCHEMA = pa.schema(
+    [
+        ("source_id", pa.string()),
+        ("uri", pa.string()),
+        ("collected_at", pa.int64()),
+        ("mime", pa.string()),
+        ("size_bytes", pa.int64()),
+        ("sha256", pa.string()),
+        ("blob_cid", pa.string()),
+        ("headers", pa.string()),
+        ("license", pa.string()),
+        ("labels", pa.string()),
+    ]
+)
+BLOBS_SCHEMA = pa.schema(
+    [
+        ("blob_cid", pa.string()),
+        ("sha256", pa.string()),
+        ("size_bytes", pa.int64()),
+        ("mime", pa.string()),
+        ("storage_uri", pa.string()),
+    ]
+)
+
+
+def _publish(tmp: Path, dst: Path) -> None:
+    """Move a finished temp file to its content address, unless already stored."""
+    if dst.exists():
+        tmp.unlink()
+    else:
+        os.replace(tmp, dst)
+
+
+def _tmp_path(objects: Path) -> Path:
+    tmp_dir = objects / "tmp"
+    utils.ensure_dir(tmp_dir)
+    return tmp_dir / f"{uuid.uuid4().hex}.part"
+
+
+def store_fragment(objects: Path, data: bytes) -> tuple[str, int]:
+    """Store one CDC fragment at ``frags/<frag_cid>.zst``; returns (frag_cid, size)."""
+    cid = blake3.blake3(data).hexdigest()
+    dst = objects / "frags" / f"{cid}.zst"
+    if not dst.exists():
+        tmp = _tmp_path(objects)
+        tmp.write_bytes(zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data))
+        _publish(tmp, dst)
+    return cid, len(data)
+
+
+def store_blob(path: Path, objects: Path, cdc_avg: int | None = None) -> dict:
+    """Stream *path* into the object store and return its blobs.parquet row.
+
+    The file is read in ``BUFSIZE`` pieces that feed blake3 (the blob_cid), sha256
+    and either a streaming zstd writer (``blobs/<blob_cid>.zst``) or, with
+    *cdc_avg*, a content-defined chunker whose fragments are stored once each under
+    ``frags/`` with a manifest at ``manifests/<blob_cid>.json`` to rebuild the blob.
+    """
+    b3, sha, size = blake3.blake3(), hashlib.sha256(), 0
+    fragments: list[tuple[str, int]] = []
+    chunker = cdc.ContentChunker(cdc_avg) if cdc_avg else None
+    tmp = _tmp_path(objects)
+    try:
+        with open(path, "rb") as f, ExitStack() as stack:
+            if chunker is None:
+                cctx = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+                zw = stack.enter_context(cctx.stream_writer(open(tmp, "wb")))
+            while buf := f.read(BUFSIZE):
+                b3.update(buf)
+                sha.update(buf)
+                size += len(buf)
+                if chunker is None:
+                    zw.write(buf)
+                else:
+                    frags = chunker.feed(buf)
+                    fragments.extend(store_fragment(objects, fr) for fr in frags)
+            if chunker is not None:
+                frags = chunker.finish()
+                fragments.extend(store_fragment(objects, fr) for fr in frags)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    cid = b3.hexdigest()
+    if cdc_avg:
+        dst = objects / "manifests" / f"{cid}.json"
+        manifest = {"blob_cid": cid, "size_bytes": size, "fragments": fragments}
+        tmp.write_text(json.dumps(manifest), encoding="utf-8")
+    else:
+        dst = objects / "blobs" / f"{cid}.zst"
+    _publish(tmp, dst)
+    mime, _ = mimetypes.guess_type(str(path))
+    return {
+        "blob_cid": cid,
+        "sha256": sha.hexdigest(),
+        "size_bytes": size,
+        "mime": mime or "application/octet-stream",
+        "storage_uri": str(dst),
+    }
+
+
+def read_blob(objects: Path, blob_cid: str) -> bytes:
+    """Reassemble a stored blob, whether it was stored whole or as CDC fragments."""
+    dctx = zstandard.ZstdDecompressor()
+    whole = objects / "blobs" / f"{blob_cid}.zst"
+    if whole.exists():
+        with open(whole, "rb") as f:
+            return dctx.stream_reader(f).read()
+    manifest = json.loads((objects / "manifests" / f"{blob_cid}.json").read_text())
+    return b"".join(
+        dctx.decompress(
+            (objects / "frags" / f"{cid}.zst").read_bytes(), max_output_size=n
+        )
+        for cid, n in manifest["fragments"]
+    )
+
+
+def iter_files(base: Path, include: list[str], exclude: list[str]) -> Iterator[Path]:
+    """Walk *base* with ``os.scandir``, pruning excluded directories before descending.
+
+    Globs are matched against paths relative to *base*; a file is yielded if it
+    matches an include glob (or there are none) and no exclude glob. Directory
+    symlinks are not followed. Entries are visited in sorted order.
+    """
+    inc = [utils.glob_regex(g) for g in include]
+    exc = [utils.glob_regex(g) for g in exclude]
+    stack = [(str(base), "")]
+    while stack:
+        path, rel = stack.pop()
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError:
+            continue
+        subdirs = []
+        for entry in entries:
+            rel_path = f"{rel}{entry.name}"
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    # "x/" matches "**/x/**" patterns: nothing below it can be kept
+                    if not any(rx.match(rel_path + "/") for rx in exc):
+                        subdirs.append((entry.path, rel_path + "/"))
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+            if inc and not any(rx.match(rel_path) for rx in inc):
+                continue
+            if any(rx.match(rel_path) for rx in exc):
+                continue
+            yield Path(entry.path)
+        stack.extend(reversed(subdirs))
+
+
+def ingest_file(
+    path: Path, objects: Path, cdc_avg: int | None
+) -> tuple[dict, dict] | None:
+    """Store one file's blob and build its sources.parquet and blobs.parquet rows."""
+    try:
+        blob = store_blob(path, objects, cdc_avg)
+    except OSError:
+        return None
+    source = {
+        "source_id": str(uuid.uuid4()),
+        "uri": str(path),
+        "collected_at": int(time.time() * 1000),
+        "mime": blob["mime"],
+        "size_bytes": blob["size_bytes"],
+        "sha256": blob["sha256"],
+        "blob_cid": blob["blob_cid"],
+        "headers": "{}",
+        "license": None,
+        "labels": "[]",
+    }
+    return source, blob
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(description=__doc__)
@@ -18,21 +211,59 @@ def main() -> None:
 
     cfg = utils.load_config(args.config)
     paths = cfg["paths"]
+    ingest_cfg = cfg.get("ingest", {})
     processed = Path(paths["processed_dir"])
     objects = Path(paths["object_store"])
     utils.ensure_dir(processed)
-    utils.ensure_dir(objects)
-
-    # Placeholder: walk input directories and hash files.
-    for base in paths.get("input_dirs", []):
-        for file in Path(base).rglob("*"):
-            if file.is_file():
-                data = file.read_bytes()
-                hashlib.sha256(data).hexdigest()
-
-    utils.touch_parquet(processed / "sources.parquet")
-    utils.touch_parquet(processed / "blobs.parquet")
-    utils.log_run(Path(paths["logs_dir"]), "ingest", {"config": str(args.config)})
+    for sub in ("blobs", "frags", "manifests"):
+        utils.ensure_dir(objects / sub)
+    cdc_cfg = ingest_cfg.get("cdc", {})
+    cdc_avg = (
+        int(cdc_cfg.get("avg_size_kb", 128) * 1024) if cdc_cfg.get("enabled") else None
+    )
+    # hashing and zstd release the GIL, and on network shares most time is spent waiting
+    workers = int(ingest_cfg.get("workers", 8))
+    batch_rows = int(ingest_cfg.get("batch_rows", 10_000))
+
+    files = (
+        f
+        for base in paths.get("input_dirs", [])
+        for f in iter_files(
+            Path(base),
+            ingest_cfg.get("include_globs", []),
+            ingest_cfg.get("exclude_globs", []),
+        )
+    )
+    seen: set[str] = set()
+    pool = ThreadPoolExecutor(workers) if workers > 1 else None
+    try:
+        with utils.ParquetBatchWriter(
+            processed / "sources.parquet", SOURCES_SCHEMA, batch_rows
+        ) as sources, utils.ParquetBatchWriter(
+            processed / "blobs.parquet", BLOBS_SCHEMA, batch_rows
+        ) as blobs:
+            work = partial(ingest_file, objects=objects, cdc_avg=cdc_avg)
+            for res in utils.imap_ordered(pool, work, files, 4 * workers):
+                if res is None:
+                    continue
+                source, blob = res
+                sources.write(source)
+                if blob["blob_cid"] not in seen:
+                    seen.add(blob["blob_cid"])
+                    blobs.write(blob)
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    utils.log_run(
+        Path(paths["logs_dir"]),
+        "ingest",
+        {
+            "config": str(args.config),
+            "cdc": bool(cdc_avg),
+            "sources": sources.rows,
+            "blobs": blobs.rows,
+        },
+    )
 
 
 if __name__ == "__main__":
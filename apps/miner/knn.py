@@ -0,0 +1,125 @@
+"""Index chunk embeddings and write the kNN similarity graph, without a graph database."""
+
+from __future__ import annotations
+
+import argparse
+import re
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from rag_soup.ann import ANNIndex, add_embeddings
+
+import utils
+
+KNN_EDGES_SCHEMA = pa.schema(
+    [
+        ("model", pa.string()),
+        ("src_chunk_id", pa.string()),
+        ("dst_chunk_id", pa.string()),
+        ("score", pa.float32()),  # dot product of the two (unit) vectors
+    ]
+)
+KNN_DENSITY_SCHEMA = pa.schema(
+    [
+        ("model", pa.string()),
+        ("chunk_id", pa.string()),
+        ("knn_density", pa.float64()),  # mean score of the chunk's outgoing edges
+    ]
+)
+
+
+def _slug(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", name)
+
+
+def build_knn(
+    embeddings: Path,
+    index_root: Path,
+    edges_path: Path,
+    density_path: Path,
+    k: int = 20,
+    nprobe: int = 8,
+) -> dict:
+    """Update one ANN index per model under *index_root* and write the kNN tables.
+
+    The indexes follow embeddings.parquet *embeddings*: chunks new to it are added,
+    chunks no longer in it are dropped. Every chunk gets an edge to each of its *k*
+    nearest chunks (the SIMILAR_TO edges of ``gds.knn.write``) and a ``knn_density``.
+    """
+    emb = pd.read_parquet(
+        embeddings, columns=["obj_type", "obj_id", "model", "dim", "store", "row"]
+    )
+    emb = emb[emb.obj_type == "chunk"].drop_duplicates(["model", "obj_id"])
+    stats = {"chunks": 0, "added": 0, "deleted": 0, "edges": 0}
+    with utils.ParquetBatchWriter(edges_path, KNN_EDGES_SCHEMA) as edges_out:
+        with utils.ParquetBatchWriter(density_path, KNN_DENSITY_SCHEMA) as density_out:
+            for model, rows in emb.groupby("model", sort=True):
+                index = ANNIndex(index_root / _slug(model), int(rows.dim.iloc[0]))
+                stats["deleted"] += index.delete(
+                    set(index.live_keys()) - set(rows.obj_id)
+                )
+                stats["added"] += add_embeddings(index, rows)
+                src, dst, score = index.knn_graph(k, nprobe)
+                keys = np.array(index.keys, dtype=object)
+                edges_out.write_table(
+                    pa.table(
+                        {
+                            "model": [model] * len(src),
+                            "src_chunk_id": keys[src],
+                            "dst_chunk_id": keys[dst],
+                            "score": score,
+                        }
+                    )
+                )
+                live = np.flatnonzero(index.live)
+                density_out.write_table(
+                    pa.table(
+                        {
+                            "model": [model] * len(live),
+                            "chunk_id": keys[live],
+                            "knn_density": index.knn_density(src, score)[live],
+                        }
+                    )
+                )
+                stats["chunks"] += len(live)
+                stats["edges"] += len(src)
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--config", type=Path, required=True, help="Path to YAML config"
+    )
+    args = parser.parse_args()
+
+    cfg = utils.load_config(args.config)
+    processed = Path(cfg["paths"]["processed_dir"])
+    utils.ensure_dir(processed)
+    knn_cfg = cfg.get("knn", {})
+
+    src = processed / "embeddings.parquet"
+    stats = {}
+    if src.exists() and src.stat().st_size:
+        stats = build_knn(
+            src,
+            processed / "ann",
+            processed / "knn_edges.parquet",
+            processed / "knn_density.parquet",
+            k=int(knn_cfg.get("k", 20)),
+            nprobe=int(knn_cfg.get("nprobe", 8)),
+        )
+    else:  # upstream stage has not produced a table yet
+        for name in ("knn_edges.parquet", "knn_density.parquet"):
+            utils.touch_parquet(processed / name)
+    utils.log_run(
+        Path(cfg["paths"]["logs_dir"]),
+        "knn",
+        {"config": str(args.config), **stats},
+    )
+
+
+if __name__ == "__main__":
+    main()
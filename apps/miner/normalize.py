@@ -3,10 +3,60 @@
 from __future__ import annotations
 
 import argparse
+import re
+import unicodedata
 from pathlib import Path
 
+import blake3
+import pyarrow as pa
+import pyarrow.parquet as pq
+
 import utils
 
+NORMALIZED_SCHEMA = pa.schema(
+    [
+        ("norm_cid", pa.string()),  # blake3(text + recipe_v)
+        ("ext_cid", pa.string()),
+        ("norm_hash", pa.string()),  # blake3(text)
+        ("lang", pa.string()),
+        ("text", pa.string()),
+    ]
+)
+
+_SPACES_RE = re.compile(r"[^\S\n]+")
+_BLANK_LINES_RE = re.compile(r"\n\s*\n\s*")
+
+
+def normalize_text(text: str, norm_cfg: dict) -> str:
+    """Apply the normalize recipe; paragraph breaks survive as a single blank line."""
+    text = unicodedata.normalize(norm_cfg.get("unicode_nf", "NFKC"), text)
+    if norm_cfg.get("lower", False):
+        text = text.lower()
+    if norm_cfg.get("collapse_whitespace", True):
+        text = _SPACES_RE.sub(" ", text)
+        text = _BLANK_LINES_RE.sub("\n\n", text)
+        text = text.replace(" \n", "\n").replace("\n ", "\n")
+    return text.strip()
+
+
+def normalize_batch(rows: list[dict], norm_cfg: dict) -> list[dict]:
+    """normalized_extractions.parquet rows for a batch of extractions.parquet rows."""
+    recipe_v = norm_cfg.get("recipe_v", "v1")
+    out = []
+    for row in rows:
+        norm = normalize_text(row["text"] or "", norm_cfg)
+        data = norm.encode()
+        out.append(
+            {
+                "norm_cid": blake3.blake3(data + recipe_v.encode()).hexdigest(),
+                "ext_cid": row["ext_cid"],
+                "norm_hash": blake3.blake3(data).hexdigest(),
+                "lang": None,
+                "text": norm,
+            }
+        )
+    return out
+
 
 def main() -> None:
     parser = argparse.ArgumentParser(description=__doc__)
@@ -18,10 +68,24 @@ def main() -> None:
     cfg = utils.load_config(args.config)
     processed = Path(cfg["paths"]["processed_dir"])
     utils.ensure_dir(processed)
+    norm_cfg = cfg.get("normalize", {})
 
-    utils.touch_parquet(processed / "normalized_extractions.parquet")
+    src = processed / "extractions.parquet"
+    stats = {}
+    if src.exists() and src.stat().st_size:
+        with utils.ParquetBatchWriter(
+            processed / "normalized_extractions.parquet", NORMALIZED_SCHEMA
+        ) as out:
+            for batch in pq.ParquetFile(src).iter_batches(batch_size=1_000):
+                for row in normalize_batch(batch.to_pylist(), norm_cfg):
+                    out.write(row)
+        stats = {"normalized": out.rows}
+    else:  # upstream stage has not produced a table yet
+        utils.touch_parquet(processed / "normalized_extractions.parquet")
     utils.log_run(
-        Path(cfg["paths"]["logs_dir"]), "normalize", {"config": str(args.config)}
+        Path(cfg["paths"]["logs_dir"]),
+        "normalize",
+        {"config": str(args.config), **stats},
     )
 
 
@@ -0,0 +1,478 @@
+"""Run ingest → extract → normalize → dedupe → chunk → embed as one streaming DAG."""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterable, Iterator
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import chunk
+import dedupe
+import embed
+import extract
+import ingest
+import normalize
+import utils
+
+_END = object()  # end of a stream of batches
+
+
+class Aborted(Exception):
+    """Raised in a stage when another stage has failed."""
+
+
+@dataclass
+class Output:
+    """A table a stage writes, batch by batch, to ``<processed_dir>/<table>.parquet``.
+
+    With *unique*, rows whose values in those columns were already written (in this
+    run or, on resume, in a checkpointed batch) are dropped.
+    """
+
+    table: str
+    schema: pa.Schema
+    unique: tuple[str, ...] = ()
+
+
+@dataclass
+class Stage:
+    """Maps each input batch (a list of rows or items) to rows of its outputs.
+
+    Input comes from *source* (an iterable of batches, for the first stage) or
+    from the batches written to the *upstream* table.
+    """
+
+    name: str
+    fn: Callable[[list], dict[str, list[dict]]]
+    outputs: list[Output]
+    upstream: str | None = None
+    source: Callable[[], Iterable[list]] | None = None
+
+
+@dataclass
+class Barrier:
+    """Runs *fn* once, after the whole *upstream* table has been published."""
+
+    name: str
+    upstream: str
+    fn: Callable[[], dict]
+
+
+@dataclass
+class _StageState:
+    batches: int = 0  # input batches whose outputs are checkpointed
+    done: bool = False
+    rows: dict[str, int] = field(default_factory=dict)
+    seconds: float = 0.0
+
+
+class Pipeline:
+    """Runs stages concurrently, one thread each, joined by bounded queues.
+
+    Every stage writes each batch's output to a part file under
+    ``<work_dir>/<stage>/<table>/`` and then records the batch in its
+    ``checkpoint.json``. On resume a stage replays its checkpointed parts to its
+    consumers instead of recomputing them and carries on from the next input
+    batch; the parts are concatenated into the final tables as each stage ends.
+    A stage's inputs must come in the same order on every run.
+    """
+
+    def __init__(
+        self,
+        stages: list[Stage | Barrier],
+        processed: Path,
+        work_dir: Path,
+        depth: int = 4,
+    ) -> None:
+        self.stages = stages
+        self.processed = processed
+        self.work_dir = work_dir
+        self.depth = depth
+        self._abort = threading.Event()
+        self._published: dict[str, threading.Event] = {}
+        self._queues: dict[str, list[queue.Queue]] = {}
+        self._states: dict[str, _StageState] = {}
+        self._errors: list[BaseException] = []
+        for st in stages:
+            if isinstance(st, Stage):
+                for out in st.outputs:
+                    self._published[out.table] = threading.Event()
+                    self._queues[out.table] = []
+        self._inboxes: dict[str, queue.Queue] = {}
+        for st in stages:
+            if isinstance(st, Stage) and st.upstream is not None:
+                q: queue.Queue = queue.Queue(depth)
+                self._queues[st.upstream].append(q)
+                self._inboxes[st.name] = q
+
+    # -- checkpoints -------------------------------------------------------------
+
+    def _state_path(self, name: str) -> Path:
+        return self.work_dir / name / "checkpoint.json"
+
+    def _load_state(self, name: str) -> _StageState:
+        path = self._state_path(name)
+        if path.exists():
+            return _StageState(**json.loads(path.read_text(encoding="utf-8")))
+        return _StageState()
+
+    def _save_state(self, name: str, state: _StageState) -> None:
+        path = self._state_path(name)
+        utils.ensure_dir(path.parent)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state.__dict__), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def _part(self, stage: str, table: str, i: int) -> Path:
+        return self.work_dir / stage / table / f"{i:08d}.parquet"
+
+    # -- queues --------------------------------------------------------------------
+
+    def _put(self, q: queue.Queue, item) -> None:
+        while True:
+            if self._abort.is_set():
+                raise Aborted
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _consume(self, q: queue.Queue) -> Iterator[list]:
+        while True:
+            if self._abort.is_set():
+                raise Aborted
+            try:
+                item = q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _END:
+                return
+            yield item
+
+    # -- stages --------------------------------------------------------------------
+
+    def _run_stage(self, st: Stage) -> None:
+        state = self._states[st.name]
+        t0 = time.perf_counter()
+        seen = {o.table: set() for o in st.outputs if o.unique}
+        inputs = st.source() if st.source else self._consume(self._inboxes[st.name])
+        for i, batch in enumerate(inputs):
+            if self._abort.is_set():
+                raise Aborted
+            if i < state.batches:
+                # checkpointed: replay the stored output, only to rebuild `seen`
+                out = {
+                    o.table: pq.read_table(self._part(st.name, o.table, i)).to_pylist()
+                    for o in st.outputs
+                }
+                for o in st.outputs:
+                    if o.unique:
+                        seen[o.table].update(
+                            tuple(r[c] for c in o.unique) for r in out[o.table]
+                        )
+            else:
+                res = st.fn(batch)
+                out = {}
+                for o in st.outputs:
+                    rows = res.get(o.table, [])
+                    if o.unique:
+                        rows = _drop_seen(rows, o.unique, seen[o.table])
+                    out[o.table] = rows
+                    part = self._part(st.name, o.table, i)
+                    utils.ensure_dir(part.parent)
+                    tmp = part.with_suffix(".tmp")
+                    pq.write_table(pa.Table.from_pylist(rows, schema=o.schema), tmp)
+                    os.replace(tmp, part)
+                    state.rows[o.table] = state.rows.get(o.table, 0) + len(rows)
+                state.batches = i + 1
+                self._save_state(st.name, state)
+            for o in st.outputs:
+                for q in self._queues[o.table]:
+                    self._put(q, out[o.table])
+        for o in st.outputs:
+            for q in self._queues[o.table]:
+                self._put(q, _END)
+            self._publish(st.name, o, state.batches)
+        state.done = True
+        state.seconds += time.perf_counter() - t0
+        self._save_state(st.name, state)
+
+    def _publish(self, stage: str, out: Output, batches: int) -> None:
+        """Concatenate a stage's part files into ``<processed>/<table>.parquet``."""
+        with utils.ParquetBatchWriter(
+            self.processed / f"{out.table}.parquet", out.schema
+        ) as w:
+            for i in range(batches):
+                w.write_table(pq.read_table(self._part(stage, out.table, i)))
+        self._published[out.table].set()
+
+    def _run_barrier(self, st: Barrier) -> None:
+        state = self._states[st.name]
+        while not self._published[st.upstream].wait(0.1):
+            if self._abort.is_set():
+                raise Aborted
+        if state.done:
+            return
+        t0 = time.perf_counter()
+        state.rows = st.fn()
+        state.done = True
+        state.seconds = time.perf_counter() - t0
+        self._save_state(st.name, state)
+
+    def _thread(self, st: Stage | Barrier, finished: threading.Event) -> None:
+        try:
+            if isinstance(st, Barrier):
+                self._run_barrier(st)
+            else:
+                self._run_stage(st)
+        except Aborted:
+            pass
+        except Exception as exc:
+            self._errors.append(exc)
+            self._abort.set()
+        except BaseException:
+            # e.g. SystemExit in a stage function: not a stage failure; stop the rest
+            self._abort.set()
+            raise
+        finally:
+            finished.set()
+
+    def run(self, resume: bool = False) -> dict:
+        """Run every stage to completion; returns per-stage rows and seconds.
+
+        Without *resume* earlier checkpoints are discarded. The work directory is
+        removed once every stage has finished.
+        """
+        if not resume and self.work_dir.exists():
+            shutil.rmtree(self.work_dir)
+        utils.ensure_dir(self.work_dir)
+        self._states = {st.name: self._load_state(st.name) for st in self.stages}
+        finished = [threading.Event() for _ in self.stages]
+        threads = [
+            threading.Thread(
+                target=self._thread, args=(st, done), name=f"stage-{st.name}"
+            )
+            for st, done in zip(self.stages, finished)
+        ]
+        try:
+            for t in threads:
+                t.start()
+            for done in finished:
+                done.wait()
+        except BaseException:
+            # Ctrl-C arrives in this (main) thread, not in the stages: stop them and
+            # wait, so the pools and caches they use are not closed under them. (An
+            # interrupted Thread.join can mark a running thread stopped: use events.)
+            self._abort.set()
+            for t, done in zip(threads, finished):
+                if t.ident is not None:
+                    done.wait()
+            raise
+        for t in threads:
+            t.join()
+        if self._errors:
+            raise self._errors[0]
+        if self._abort.is_set():
+            raise Aborted(
+                "a stage was interrupted; its checkpoints are kept for resume"
+            )
+        shutil.rmtree(self.work_dir)
+        return {
+            name: {"rows": s.rows, "seconds": round(s.seconds, 3)}
+            for name, s in self._states.items()
+        }
+
+
+def _drop_seen(rows: list[dict], cols: tuple[str, ...], seen: set) -> list[dict]:
+    kept = []
+    for r in rows:
+        key = tuple(r[c] for c in cols)
+        if key not in seen:
+            seen.add(key)
+            kept.append(r)
+    return kept
+
+
+def _batched(items: Iterable, n: int) -> Iterator[list]:
+    it = iter(items)
+    while batch := list(itertools.islice(it, n)):
+        yield batch
+
+
+def build_stages(
+    cfg: dict, stack: ExitStack, batch_rows: int = 256
+) -> list[Stage | Barrier]:
+    """The miner stages wired as a DAG, with their resources entered on *stack*.
+
+    normalize feeds both dedupe (which needs the whole table) and chunk, so
+    chunking and embedding are not held up by dedupe. Content addressing makes
+    exact copies collapse on their own: blobs and extractions are kept once per
+    cid, and a norm_cid is chunked once.
+    """
+    paths = cfg["paths"]
+    processed = Path(paths["processed_dir"])
+    objects = Path(paths["object_store"])
+    ingest_cfg = cfg.get("ingest", {})
+    norm_cfg = cfg.get("normalize", {})
+    recipe_v = norm_cfg.get("recipe_v", "v1")
+    near = cfg.get("dedupe", {}).get("near_dup", {})
+    embed_cfg = cfg.get("embed", {})
+    for sub in ("blobs", "frags", "manifests"):
+        utils.ensure_dir(objects / sub)
+    cdc_cfg = ingest_cfg.get("cdc", {})
+    cdc_avg = (
+        int(cdc_cfg.get("avg_size_kb", 128) * 1024) if cdc_cfg.get("enabled") else None
+    )
+    workers = int(ingest_cfg.get("workers", 8))
+    pool = ThreadPoolExecutor(workers) if workers > 1 else None
+    if pool is not None:
+        stack.callback(pool.shutdown, cancel_futures=True)
+    embedder = embed.load_embedder(embed_cfg)
+    cache = stack.enter_context(
+        embed.open_cache(
+            processed / "vectors", embedder, embed_cfg.get("dtype", "fp16")
+        )
+    )
+    chunk_opts = chunk.chunk_options(cfg.get("chunk", {}))
+
+    def files() -> Iterable[list]:
+        found = (
+            f
+            for base in paths.get("input_dirs", [])
+            for f in ingest.iter_files(
+                Path(base),
+                ingest_cfg.get("include_globs", []),
+                ingest_cfg.get("exclude_globs", []),
+            )
+        )
+        return _batched(found, batch_rows)
+
+    def ingest_batch(batch: list[Path]) -> dict[str, list[dict]]:
+        work = partial(ingest.ingest_file, objects=objects, cdc_avg=cdc_avg)
+        res = [r for r in utils.imap_ordered(pool, work, batch, 4 * workers) if r]
+        return {"sources": [s for s, _ in res], "blobs": [b for _, b in res]}
+
+    def chunk_batch(rows: list[dict]) -> dict[str, list[dict]]:
+        out = []
+        for r in rows:
+            out.extend(
+                chunk.chunk_document(r["norm_cid"], r["text"], recipe_v, **chunk_opts)
+            )
+        return {"chunks": out}
+
+    def embed_batch(rows: list[dict]) -> dict[str, list[dict]]:
+        ids = [r["chunk_id"] for r in rows]
+        texts = [r["text"] for r in rows]
+        out, _ = embed.embed_rows(
+            ids, texts, cache, embedder, int(embed_cfg.get("batch_size", 128))
+        )
+        return {"embeddings": out}
+
+    def run_dedupe() -> dict:
+        src = processed / "normalized_extractions.parquet"
+        if not pq.ParquetFile(src).metadata.num_rows:
+            utils.touch_parquet(processed / "dedupe_map.parquet")
+            return {}
+        return dedupe.dedupe_table(
+            src,
+            processed / "dedupe_map.parquet",
+            processed / "_dedupe_work",
+            bands=near.get("minhash_bands", 32),
+            rows=near.get("minhash_rows", 4),
+            threshold=near.get("threshold", 0.88),
+            shingle=near.get("shingle_words", 5),
+            partitions=near.get("spill_partitions", 64),
+        )
+
+    return [
+        Stage(
+            "ingest",
+            ingest_batch,
+            [
+                Output("sources", ingest.SOURCES_SCHEMA),
+                Output("blobs", ingest.BLOBS_SCHEMA, unique=("blob_cid",)),
+            ],
+            source=files,
+        ),
+        Stage(
+            "extract",
+            lambda rows: {
+                "extractions": extract.extract_batch(rows, objects, recipe_v)
+            },
+            [Output("extractions", extract.EXTRACTIONS_SCHEMA, unique=("ext_cid",))],
+            upstream="blobs",
+        ),
+        Stage(
+            "normalize",
+            lambda rows: {
+                "normalized_extractions": normalize.normalize_batch(rows, norm_cfg)
+            },
+            [Output("normalized_extractions", normalize.NORMALIZED_SCHEMA)],
+            upstream="extractions",
+        ),
+        Barrier("dedupe", "normalized_extractions", run_dedupe),
+        Stage(
+            "chunk",
+            chunk_batch,
+            [Output("chunks", chunk.CHUNKS_SCHEMA, unique=("norm_cid", "span_start"))],
+            upstream="normalized_extractions",
+        ),
+        Stage(
+            "embed",
+            embed_batch,
+            [Output("embeddings", embed.EMBEDDINGS_SCHEMA)],
+            upstream="chunks",
+        ),
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--config", type=Path, required=True, help="Path to YAML config"
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue a failed run from its last checkpointed batches",
+    )
+    args = parser.parse_args()
+
+    cfg = utils.load_config(args.config)
+    processed = Path(cfg["paths"]["processed_dir"])
+    utils.ensure_dir(processed)
+    pipe_cfg = cfg.get("pipeline", {})
+
+    with ExitStack() as stack:
+        stages = build_stages(cfg, stack, int(pipe_cfg.get("batch_rows", 256)))
+        pipeline = Pipeline(
+            stages,
+            processed,
+            processed / "_pipeline",
+            depth=int(pipe_cfg.get("queue_depth", 4)),
+        )
+        stats = pipeline.run(resume=args.resume)
+    utils.log_run(
+        Path(cfg["paths"]["logs_dir"]),
+        "pipeline",
+        {"config": str(args.config), "resume": args.resume, "stages": stats},
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -3,11 +3,21 @@
 from __future__ import annotations
 
 import json
+import os
+import re
+from collections import deque
+from concurrent.futures import Executor
 from datetime import datetime
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
 
+import pyarrow as pa
+import pyarrow.parquet as pq
 import yaml
 
+if TYPE_CHECKING:
+    import zstandard
+
 
 def load_config(path: Path) -> dict:
     """Load a YAML configuration file."""
@@ -38,3 +48,111 @@ def log_run(logs_dir: Path, kind: str, params: dict) -> None:
     }
     with (logs_dir / "runs.jsonl").open("a", encoding="utf-8") as f:
         f.write(json.dumps(entry) + "\n")
+
+
+def glob_regex(pattern: str) -> re.Pattern:
+    """Compile a ``**``-style glob matched against ``/``-separated relative paths.
+
+    ``**/`` matches any number of leading directories (including none), ``**`` any
+    run of characters, ``*`` and ``?`` stay within one path component.
+    """
+    i, out = 0, []
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile("".join(out) + r"\Z")
+
+
+def imap_ordered(
+    pool: Executor | None, fn: Callable, items: Iterable, depth: int
+) -> Iterator:
+    """``map(fn, items)`` on *pool* with at most *depth* tasks in flight, in order."""
+    if pool is None:
+        yield from map(fn, items)
+        return
+    pending: deque = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def batch_texts(batch: pa.RecordBatch, dctx: zstandard.ZstdDecompressor) -> list[str]:
+    """Texts of a record batch, from its ``text`` column or the zstd files at ``text_uri``."""
+    if "text" in batch.schema.names:
+        return [t or "" for t in batch.column("text").to_pylist()]
+    out = []
+    for uri in batch.column("text_uri").to_pylist():
+        if not uri:
+            out.append("")
+            continue
+        with open(uri, "rb") as f:
+            out.append(dctx.stream_reader(f).read().decode("utf-8", errors="replace"))
+    return out
+
+
+class ParquetBatchWriter:
+    """Write rows to *path* in row groups of *batch_rows*, publishing it on close.
+
+    The table is written under a temporary name and renamed into place when the
+    writer is closed, so a crashed run never leaves a truncated table behind.
+    """
+
+    def __init__(self, path: Path, schema: pa.Schema, batch_rows: int = 50_000) -> None:
+        ensure_dir(path.parent)
+        self.path = path
+        self.schema = schema
+        self.batch_rows = batch_rows
+        self.rows = 0
+        self._tmp = path.with_name(f".{path.name}.tmp")
+        self._writer = pq.ParquetWriter(self._tmp, schema, compression="zstd")
+        self._buf: list[dict] = []
+
+    def write(self, row: dict) -> None:
+        self._buf.append(row)
+        self.rows += 1
+        if len(self._buf) >= self.batch_rows:
+            self.flush()
+
+    def write_table(self, table: pa.Table) -> None:
+        """Append a whole table after any buffered rows, keeping its row groups."""
+        self.flush()
+        self._writer.write_table(table.cast(self.schema))
+        self.rows += table.num_rows
+
+    def flush(self) -> None:
+        if self._buf:
+            self._writer.write_table(
+                pa.Table.from_pylist(self._buf, schema=self.schema)
+            )
+            self._buf = []
+
+    def close(self) -> None:
+        self.flush()
+        self._writer.close()
+        os.replace(self._tmp, self.path)
+
+    def __enter__(self) -> ParquetBatchWriter:
+        return self
+
+    def __exit__(self, exc_type, *exc) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self._writer.close()
+            self._tmp.unlink(missing_ok=True)
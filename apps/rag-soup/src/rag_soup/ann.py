@@ -0,0 +1,392 @@
+"""Per-zone approximate nearest-neighbour index over chunk embeddings (IVF, fp16, memory-mapped).
+
+Like the BM25 index, each zone gets its own under `<root>/<zone>/ann/`:
+
+- `vectors.bin`: headerless row-major `(rows, dim)` fp16 array, appended to and memory-mapped
+- `keys.txt`: the chunk_id of each row, one per line, and after a tab the version of
+  its vector (where it came from in the embeddings stores, `store:row`)
+- `lists.bin`: the inverted list (int32) of each row, -1 before the index is trained
+- `centroids.npy`: the list centroids, `meta.json`: dim, lists and training size
+- `deleted.npy`: rows whose chunk has left the catalog
+
+Similarity is the dot product, i.e. cosine for the unit vectors the embedders write.
+Below `MIN_TRAIN` vectors every search is exact; from there on the vectors are
+clustered into about `4 * sqrt(n)` lists by spherical k-means and a query scans
+only its `nprobe` nearest lists. New vectors join their nearest list, and the
+lists are retrained once the index has grown `RETRAIN_GROWTH` times since.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+MIN_TRAIN = 4096
+RETRAIN_GROWTH = 4
+KMEANS_ITERS = 10
+QUERY_BLOCK = 8192  # queries scored at once
+ROW_BLOCK = 65536  # vectors scored at once by the exact search
+
+_DTYPES = {"fp16": np.float16, "fp32": np.float32}
+
+
+def _concat(xs: List[np.ndarray], dtype) -> np.ndarray:
+    return np.concatenate(xs) if xs else np.zeros(0, dtype=dtype)
+
+
+def _topk(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column indices and values of the `k` best per row, best first (ties: lower index)."""
+    k = min(k, scores.shape[1])
+    if not k:
+        return np.zeros((len(scores), 0), dtype=np.int64), scores[:, :0]
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    vals = np.take_along_axis(scores, part, axis=1)
+    order = np.lexsort((part, -vals), axis=1)
+    return np.take_along_axis(part, order, axis=1), np.take_along_axis(vals, order, axis=1)
+
+
+def _merge(idx_a, val_a, idx_b, val_b, k):
+    idx, val = np.concatenate([idx_a, idx_b], axis=1), np.concatenate([val_a, val_b], axis=1)
+    cols, vals = _topk(val, k)
+    return np.take_along_axis(idx, cols, axis=1), vals
+
+
+def kmeans(x: np.ndarray, n_lists: int, iters: int = KMEANS_ITERS, seed: int = 0) -> np.ndarray:
+    """Spherical k-means centroids (unit rows) of the rows of `x`."""
+    rng = np.random.default_rng(seed)
+    cent = x[rng.choice(len(x), n_lists, replace=False)].astype(np.float32)
+    cent /= np.maximum(np.linalg.norm(cent, axis=1, keepdims=True), 1e-12)
+    for _ in range(iters):
+        assign = _nearest(x, cent)
+        order = np.argsort(assign, kind="stable")
+        starts = np.searchsorted(assign[order], np.arange(n_lists))
+        sums = np.add.reduceat(x[order], np.minimum(starts, len(x) - 1), axis=0)
+        sums[np.diff(np.r_[starts, len(x)]) == 0] = 0
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        moved = norms[:, 0] > 0  # an empty list keeps its centroid
+        cent[moved] = sums[moved] / norms[moved]
+    return cent
+
+
+def _nearest(x: np.ndarray, cent: np.ndarray) -> np.ndarray:
+    out = np.empty(len(x), dtype=np.int32)
+    for lo in range(0, len(x), ROW_BLOCK):
+        out[lo : lo + ROW_BLOCK] = np.argmax(
+            x[lo : lo + ROW_BLOCK].astype(np.float32) @ cent.T, axis=1
+        )
+    return out
+
+
+class ANNIndex:
+    """The vector index in `directory`; an empty one for `dim`-d vectors if there is none."""
+
+    def __init__(self, directory: Path, dim: int | None = None):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        meta_path = self.dir / "meta.json"
+        if meta_path.exists():
+            self.meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if dim is not None and dim != self.meta["dim"]:
+                raise ValueError(f"{self.dir} holds {self.meta['dim']}-d vectors, not {dim}-d")
+        elif dim is None:
+            raise ValueError(f"no index in {self.dir}; pass dim to create one")
+        else:
+            self.meta = {"dim": dim, "lists": 0, "trained_on": 0}
+            self._save_meta()
+        self.dim = self.meta["dim"]
+        self._row_bytes = self.dim * 2
+        vec_path, key_path, list_path = (
+            self.dir / "vectors.bin",
+            self.dir / "keys.txt",
+            self.dir / "lists.bin",
+        )
+        lines = key_path.read_text(encoding="utf-8").splitlines() if key_path.exists() else []
+        keys = [line.partition("\t")[0] for line in lines]
+        vec_size = vec_path.stat().st_size if vec_path.exists() else 0
+        list_size = list_path.stat().st_size if list_path.exists() else 0
+        # rows are appended vectors, then lists, then keys: cut a torn tail off all three
+        n = min(len(keys), vec_size // self._row_bytes, list_size // 4)
+        for path, size in ((vec_path, n * self._row_bytes), (list_path, n * 4)):
+            if path.exists() and path.stat().st_size != size:
+                os.truncate(path, size)
+        if len(keys) != n:
+            key_path.write_text("".join(line + "\n" for line in lines[:n]), encoding="utf-8")
+        self.keys: List[str] = keys[:n]
+        # rows written before versions were kept have none
+        self.versions: List[str | None] = [line.partition("\t")[2] or None for line in lines[:n]]
+        self._rows = {k: i for i, k in enumerate(self.keys)}
+        self.live = np.ones(n, dtype=bool)
+        if (self.dir / "deleted.npy").exists():
+            deleted = np.load(self.dir / "deleted.npy")
+            self.live[deleted[deleted < n]] = False
+        self.centroids = (
+            np.load(self.dir / "centroids.npy") if self.meta["lists"] else np.zeros((0, self.dim))
+        )
+        self._load()
+
+    def _save_meta(self):
+        tmp = self.dir / "meta.json.tmp"
+        tmp.write_text(json.dumps(self.meta), encoding="utf-8")
+        os.replace(tmp, self.dir / "meta.json")
+
+    def _load(self):
+        n = len(self.keys)
+        self.vectors = (
+            np.memmap(self.dir / "vectors.bin", dtype=np.float16, mode="r", shape=(n, self.dim))
+            if n
+            else np.zeros((0, self.dim), dtype=np.float16)
+        )
+        self.lists = (
+            np.fromfile(self.dir / "lists.bin", dtype=np.int32) if n else np.zeros(0, np.int32)
+        )
+        # rows grouped by list: list l is _order[_indptr[l]:_indptr[l + 1]]
+        self._order = np.argsort(self.lists, kind="stable")
+        self._indptr = np.searchsorted(self.lists[self._order], np.arange(self.meta["lists"] + 1))
+
+    def __len__(self) -> int:
+        return int(self.live.sum())
+
+    def __contains__(self, key: str) -> bool:
+        row = self._rows.get(key)
+        return row is not None and bool(self.live[row])
+
+    def live_keys(self) -> List[str]:
+        return [k for k, ok in zip(self.keys, self.live) if ok]
+
+    def version(self, key: str) -> str | None:
+        """The version the live `key` was added with (None if it had none)."""
+        return self.versions[self._rows[key]]
+
+    @property
+    def trained(self) -> bool:
+        return self.meta["lists"] > 0
+
+    # ---- updates ----------------------------------------------------------------------------
+
+    def add(self, keys: List[str], vectors, versions: List[str] | None = None) -> int:
+        """Append one vector per key; keys already indexed and live are skipped.
+
+        `versions` are kept per row, so a caller can tell when a key's vector has
+        changed and replace it (delete, then add again).
+        """
+        vectors = np.asarray(vectors)
+        if versions is None:
+            versions = [None] * len(keys)
+        if vectors.shape != (len(keys), self.dim):
+            raise ValueError(f"expected {(len(keys), self.dim)} vectors, got {vectors.shape}")
+        new = list({k: i for i, k in enumerate(keys) if k not in self}.values())
+        if not new:
+            return 0
+        vecs = np.ascontiguousarray(vectors[new], dtype=np.float16)
+        lists = _nearest(vecs, self.centroids) if self.trained else np.full(len(new), -1, np.int32)
+        with open(self.dir / "vectors.bin", "ab") as f:
+            f.write(vecs.tobytes())
+        with open(self.dir / "lists.bin", "ab") as f:
+            f.write(lists.astype(np.int32).tobytes())
+        with open(self.dir / "keys.txt", "a", encoding="utf-8") as f:
+            f.writelines(keys[i] + ("\t" + versions[i] if versions[i] else "") + "\n" for i in new)
+        for i in new:
+            # a re-added key gets a new row; its old one stays deleted
+            self._rows[keys[i]] = len(self.keys)
+            self.keys.append(keys[i])
+            self.versions.append(versions[i])
+        self.live = np.r_[self.live, np.ones(len(new), dtype=bool)]
+        n = len(self.keys)
+        if n >= MIN_TRAIN and (not self.trained or n >= RETRAIN_GROWTH * self.meta["trained_on"]):
+            self.train()
+        else:
+            self._load()
+        return len(new)
+
+    def delete(self, keys: Iterable[str]) -> int:
+        rows = [self._rows[k] for k in keys if k in self]
+        if rows:
+            self.live[rows] = False
+            tmp = self.dir / "deleted.tmp.npy"
+            np.save(tmp, np.flatnonzero(~self.live))
+            os.replace(tmp, self.dir / "deleted.npy")
+        return len(rows)
+
+    def train(self, n_lists: int | None = None, sample: int = 64):
+        """Cluster the vectors into lists (about 4 sqrt(n)) and assign every row to one.
+
+        The centroids are fitted on at most `sample` vectors per list.
+        """
+        self._load()
+        n = len(self.keys)
+        n_lists = n_lists or max(1, min(n, int(4 * n**0.5)))
+        rng = np.random.default_rng(0)
+        fit = np.sort(rng.choice(n, min(n, sample * n_lists), replace=False))
+        cent = kmeans(np.asarray(self.vectors[fit], dtype=np.float32), n_lists)
+        lists = _nearest(self.vectors, cent)
+        np.save(self.dir / "centroids.tmp.npy", cent)
+        lists.tofile(self.dir / "lists.tmp")
+        os.replace(self.dir / "centroids.tmp.npy", self.dir / "centroids.npy")
+        os.replace(self.dir / "lists.tmp", self.dir / "lists.bin")
+        self.centroids = cent
+        self.meta.update(lists=n_lists, trained_on=n)
+        self._save_meta()
+        self._load()
+
+    # ---- queries ----------------------------------------------------------------------------
+
+    def exact_search(self, queries, k: int = 10) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact top `k` rows (-1 padded) and dot products per query, by a full scan."""
+        q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        idx = np.full((len(q), 0), -1, dtype=np.int64)
+        val = np.zeros((len(q), 0), dtype=np.float32)
+        for lo in range(0, len(self.keys), ROW_BLOCK):
+            s = q @ np.asarray(self.vectors[lo : lo + ROW_BLOCK], dtype=np.float32).T
+            s[:, ~self.live[lo : lo + ROW_BLOCK]] = -np.inf
+            cols, vals = _topk(s, k)
+            idx, val = _merge(idx, val, cols + lo, vals, k)
+        return self._pad(idx, val, k)
+
+    def search(self, queries, k: int = 10, nprobe: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top `k` rows (-1 padded) and dot products for a batch of queries.
+
+        Each query scans its `nprobe` nearest lists; queries are grouped by list, so
+        every probed list is scored against all its queries with one matrix product.
+        Untrained indexes, and `nprobe` >= lists, fall back to `exact_search`.
+        """
+        if not self.trained or nprobe >= self.meta["lists"]:
+            return self.exact_search(queries, k)
+        q = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        idx, val = [], []
+        for lo in range(0, len(q), QUERY_BLOCK):
+            qb = q[lo : lo + QUERY_BLOCK]
+            probe, _ = _topk(qb @ self.centroids.T, nprobe)
+            # (list, query) pairs grouped by list; a list's candidates for a query go to
+            # columns [p * k, (p + 1) * k) of the query's row, p = the list's probe rank
+            by_list = np.argsort(probe.ravel(), kind="stable")
+            pl = probe.ravel()[by_list]
+            pq, pp = np.divmod(by_list, probe.shape[1])
+            bounds = np.flatnonzero(np.r_[True, pl[1:] != pl[:-1], True])
+            cand = np.full((len(qb), probe.shape[1] * k), -np.inf, dtype=np.float32)
+            rows_of = np.full(cand.shape, -1, dtype=np.int64)
+            for a, b in zip(bounds[:-1], bounds[1:]):
+                rows = self._order[self._indptr[pl[a]] : self._indptr[pl[a] + 1]]
+                rows = rows[self.live[rows]]
+                if not rows.size:
+                    continue
+                s = qb[pq[a:b]] @ np.asarray(self.vectors[rows], dtype=np.float32).T
+                cols, vals = _topk(s, k)
+                at = (pq[a:b, None], pp[a:b, None] * k + np.arange(cols.shape[1]))
+                cand[at] = vals
+                rows_of[at] = rows[cols]
+            cols, vals = _topk(cand, k)
+            idx.append(np.take_along_axis(rows_of, cols, axis=1))
+            val.append(vals)
+        return self._pad(np.concatenate(idx), np.concatenate(val), k)
+
+    def _pad(self, idx, val, k):
+        out_i = np.full((len(idx), k), -1, dtype=np.int64)
+        out_v = np.full((len(idx), k), -np.inf, dtype=np.float32)
+        w = idx.shape[1]
+        out_i[:, :w], out_v[:, :w] = idx, val
+        out_i[~np.isfinite(out_v)] = -1
+        return out_i, out_v
+
+    def recall(self, queries, k: int = 10, nprobe: int = 8) -> float:
+        """Share of the exact top `k` that `search` finds (1.0 when exact)."""
+        approx, _ = self.search(queries, k, nprobe)
+        exact, _ = self.exact_search(queries, k)
+        hits = sum(len(set(a[a >= 0]) & set(e[e >= 0])) for a, e in zip(approx, exact))
+        return hits / max(1, int((exact >= 0).sum()))
+
+    def knn_graph(self, k: int = 20, nprobe: int = 8) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Directed kNN edges between the live rows: (src rows, dst rows, scores).
+
+        Each row links to its `k` most similar other rows, as `gds.knn.write` does.
+        """
+        rows = np.flatnonzero(self.live)
+        src, dst, score = [], [], []
+        for lo in range(0, rows.size, QUERY_BLOCK):
+            part = rows[lo : lo + QUERY_BLOCK]
+            idx, val = self.search(np.asarray(self.vectors[part], dtype=np.float32), k + 1, nprobe)
+            keep = (idx >= 0) & (idx != part[:, None])
+            # drop the self match, or the last neighbour when the row did not find itself
+            keep &= np.cumsum(keep, axis=1) <= k
+            src.append(np.broadcast_to(part[:, None], idx.shape)[keep])
+            dst.append(idx[keep])
+            score.append(val[keep])
+        return _concat(src, np.int64), _concat(dst, np.int64), _concat(score, np.float32)
+
+    def knn_density(self, src: np.ndarray, score: np.ndarray) -> np.ndarray:
+        """Mean score of each row's outgoing kNN edges (NaN for rows without any)."""
+        n = len(self.keys)
+        total = np.bincount(src, score, minlength=n)
+        count = np.bincount(src, minlength=n)
+        with np.errstate(invalid="ignore"):
+            return total / count
+
+
+def load_store(store: Path) -> np.ndarray:
+    """Memory-map the vectors of an embeddings cache directory (the `store` column)."""
+    meta = json.loads((Path(store) / "meta.json").read_text(encoding="utf-8"))
+    dtype = np.dtype(_DTYPES[meta["dtype"]])
+    path = Path(store) / "vectors.bin"
+    rows = path.stat().st_size // (meta["dim"] * dtype.itemsize) if path.exists() else 0
+    if not rows:
+        return np.empty((0, meta["dim"]), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(rows, meta["dim"]))
+
+
+def _versions(emb: pd.DataFrame) -> pd.Series:
+    return emb.store.astype(str) + ":" + emb.row.astype(str)
+
+
+def replace_changed(index: ANNIndex, emb: pd.DataFrame) -> int:
+    """Delete the keys whose embeddings-table row (store, row) is not the indexed one.
+
+    A chunk_id is positional, so a re-chunked chunk keeps its id but gets a new
+    embedding; `add_embeddings` then adds it again.
+    """
+    return index.delete(
+        k for k, v in zip(emb.obj_id, _versions(emb)) if k in index and index.version(k) != v
+    )
+
+
+def add_embeddings(index: ANNIndex, emb: pd.DataFrame) -> int:
+    """Add embeddings-table rows (obj_id, store, row) to `index`; returns how many were new.
+
+    Keys whose (store, row) changed are replaced and count as new.
+    """
+    replace_changed(index, emb)
+    emb = emb[~emb.obj_id.map(index.__contains__)]
+    for store, grp in emb.groupby("store", sort=False):
+        index.add(
+            grp.obj_id.tolist(),
+            load_store(Path(store))[grp.row.to_numpy()],
+            _versions(grp).tolist(),
+        )
+    return len(emb)
+
+
+def index_dir(root: Path, zone: str) -> Path:
+    return Path(root) / zone / "ann"
+
+
+def update_zone_index(root: Path, zone: str, embeddings: Path) -> Dict[str, int]:
+    """Bring `zone`'s vector index in line with catalog/chunks.parquet under `root`.
+
+    `embeddings` is an embeddings table (obj_type, obj_id, dim, store, row) holding
+    vectors for the catalog's chunks; only those of chunks in `zone` are indexed.
+    """
+    chunks = pd.read_parquet(
+        Path(root) / "catalog" / "chunks.parquet", columns=["chunk_id", "zone"]
+    )
+    ids = set(chunks.chunk_id[chunks.zone == zone])
+    emb = pd.read_parquet(embeddings, columns=["obj_type", "obj_id", "dim", "store", "row"])
+    emb = emb[(emb.obj_type == "chunk") & emb.obj_id.isin(ids)].drop_duplicates("obj_id")
+    directory = index_dir(root, zone)
+    if not (directory / "meta.json").exists() and not len(emb):
+        return {"added": 0, "deleted": 0, "replaced": 0, "chunks": 0}
+    index = ANNIndex(directory, int(emb.dim.iloc[0]) if len(emb) else None)
+    deleted = index.delete(set(index.live_keys()) - ids)
+    replaced = replace_changed(index, emb)
+    added = add_embeddings(index, emb)
+    return {"added": added, "deleted": deleted, "replaced": replaced, "chunks": len(index)}
@@ -0,0 +1,524 @@
+"""Per-zone BM25 index over the mined chunks: compressed postings, memory-mapped, incremental.
+
+Each zone gets its own index under `<root>/<zone>/bm25/`, so quarantined text is never
+searched together with clean text. An index is a list of immutable segments plus
+`meta.json`, which names the live segments and is replaced atomically on every change:
+
+- `seg-NNNNN/terms.txt`: the segment's terms, sorted, one per line
+- `seg-NNNNN/terms.npy`: per term (df, first block, blocks, max tf, min doc length)
+- `seg-NNNNN/blocks.npy`: per block of up to `BLOCK` postings (last doc, base doc,
+  start byte, end byte, postings)
+- `seg-NNNNN/postings.bin`: per block the doc-id deltas, then the term frequencies,
+  as LEB128 varints; memory-mapped and decoded a block at a time
+- `seg-NNNNN/docs.parquet`: chunk_id, length (tokens) and version by local doc id; the
+  version is the pack-store key of the text that was indexed
+- `seg-NNNNN/deleted.npy`: local ids of docs whose chunk has left the catalog
+
+`update_zone_index` adds a segment for the chunks a mine run added or re-chunked
+(a chunk_id is positional, so its text can change) and marks the ones it dropped or
+replaced as deleted; past `MAX_SEGMENTS` segments everything is merged into
+one. Like Lucene, N, avgdl and df count deleted docs until the next merge.
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .pack_store import PackStore
+
+TOKEN_RE = re.compile(r"\w+")
+BLOCK = 128  # postings per block: the unit of decoding
+MAX_SEGMENTS = 8
+K1, B = 1.2, 0.75
+_SLACK = 1e-9  # relative slack on score upper bounds, for float rounding
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(text.lower())
+
+
+def encode_varints(values) -> Tuple[np.ndarray, np.ndarray]:
+    """LEB128 bytes of non-negative `values`, and the byte offset of each value."""
+    v = np.asarray(values, dtype=np.uint64)
+    n = np.ones(v.size, dtype=np.int64)
+    for i in range(1, 10):
+        big = v >= np.uint64(1 << (7 * i))
+        if not big.any():
+            break
+        n += big
+    ends = np.cumsum(n)
+    starts = ends - n
+    k = np.arange(int(ends[-1]) if v.size else 0) - np.repeat(starts, n)
+    out = (np.repeat(v, n) >> (7 * k).astype(np.uint64)) & np.uint64(0x7F)
+    out |= (k < np.repeat(n, n) - 1).astype(np.uint64) << np.uint64(7)
+    return out.astype(np.uint8), starts
+
+
+def decode_varints(buf) -> np.ndarray:
+    """Inverse of `encode_varints`: the values of a run of LEB128 bytes."""
+    b = np.asarray(buf, dtype=np.uint8)
+    if not b.size:
+        return np.zeros(0, dtype=np.int64)
+    last = b < 0x80
+    starts = np.flatnonzero(np.r_[True, last[:-1]])
+    k = np.arange(b.size) - np.repeat(starts, np.diff(np.r_[starts, b.size]))
+    parts = (b & 0x7F).astype(np.uint64) << (7 * k).astype(np.uint64)
+    return np.add.reduceat(parts, starts).astype(np.int64)
+
+
+def _ranges(starts, lengths) -> np.ndarray:
+    """Concatenation of arange(s, s + n) for each (s, n)."""
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(starts - offsets, lengths) + np.arange(int(np.sum(lengths)))
+
+
+def _int64(xs) -> np.ndarray:
+    return np.array(xs, dtype=np.int64)
+
+
+def _concat(xs: List[np.ndarray]) -> np.ndarray:
+    return np.concatenate(xs) if xs else np.zeros(0, dtype=np.int64)
+
+
+def _encode_postings(n_terms: int, tids, docs, tfs, lengths):
+    """terms.npy rows, blocks.npy rows and postings bytes of sorted, non-empty postings.
+
+    Every term id in `range(n_terms)` must have at least one posting.
+    """
+    df = np.bincount(tids, minlength=n_terms)
+    tstart = np.cumsum(df) - df
+    n_blocks = (df + BLOCK - 1) // BLOCK
+    first_block = np.cumsum(n_blocks) - n_blocks
+    blk = np.repeat(first_block, df) + (np.arange(docs.size) - np.repeat(tstart, df)) // BLOCK
+    count = np.bincount(blk, minlength=int(n_blocks.sum()))
+    bstart = np.cumsum(count) - count
+    prev = np.r_[0, docs[:-1]]
+    prev[tstart] = 0  # deltas restart at each term
+    j = np.arange(docs.size) - bstart[blk]
+    vals = np.empty(2 * docs.size, dtype=np.int64)
+    vals[2 * bstart[blk] + j] = docs - prev
+    vals[2 * bstart[blk] + count[blk] + j] = tfs
+    data, offsets = encode_varints(vals)
+    start = offsets[2 * bstart]
+    blocks = np.stack(
+        [docs[bstart + count - 1], prev[bstart], start, np.r_[start[1:], data.size], count], axis=1
+    ).astype(np.int64)
+    info = np.stack(
+        [
+            df,
+            first_block,
+            n_blocks,
+            np.maximum.reduceat(tfs, tstart),
+            np.minimum.reduceat(lengths[docs], tstart),
+        ],
+        axis=1,
+    ).astype(np.int64)
+    return info, blocks, data
+
+
+def _write_segment(path: Path, terms: List[str], tids, docs, tfs, chunk_ids, lengths, versions):
+    """Write one segment; postings are (term id into sorted `terms`, local doc, tf) triples.
+
+    Terms without postings (all their docs were deleted before a merge) are left out.
+    """
+    order = np.lexsort((docs, tids))
+    tids, docs, tfs = tids[order], docs[order], tfs[order]
+    lengths = np.asarray(lengths, dtype=np.int64)
+    used = np.unique(tids)
+    terms = [terms[i] for i in used]
+    if docs.size:
+        info, blocks, data = _encode_postings(
+            len(terms), np.searchsorted(used, tids), docs, tfs, lengths
+        )
+    else:  # e.g. a batch of chunks with no word tokens
+        info = blocks = np.zeros((0, 5), dtype=np.int64)
+        data = np.zeros(0, dtype=np.uint8)
+
+    tmp = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+    (tmp / "terms.txt").write_text("".join(t + "\n" for t in terms), encoding="utf-8")
+    np.save(tmp / "terms.npy", info)
+    np.save(tmp / "blocks.npy", blocks.reshape(-1, 5))
+    data.tofile(tmp / "postings.bin")
+    pq.write_table(
+        pa.table(
+            {
+                "chunk_id": pa.array(chunk_ids, pa.string()),
+                "length": lengths,
+                "version": pa.array(versions, pa.string()),
+            }
+        ),
+        tmp / "docs.parquet",
+    )
+    os.replace(tmp, path)
+
+
+def _invert(texts: Iterable[str]):
+    """Sorted terms and (term id, doc, tf) postings of `texts`, plus their lengths."""
+    vocab: Dict[str, int] = {}
+    tids, docs, tfs, lengths = [], [], [], []
+    for d, text in enumerate(texts):
+        toks = tokenize(text)
+        lengths.append(len(toks))
+        for t, n in Counter(toks).items():
+            tids.append(vocab.setdefault(t, len(vocab)))
+            docs.append(d)
+            tfs.append(n)
+    terms = sorted(vocab)
+    rank = np.empty(len(terms), dtype=np.int64)
+    rank[[vocab[t] for t in terms]] = np.arange(len(terms))
+    return terms, rank[_int64(tids)], _int64(docs), _int64(tfs), lengths
+
+
+class _Segment:
+    def __init__(self, path: Path):
+        self.path = path
+        self.term_list = (path / "terms.txt").read_text(encoding="utf-8").splitlines()
+        self.terms = {t: i for i, t in enumerate(self.term_list)}
+        self.info = np.load(path / "terms.npy", mmap_mode="r")
+        self.blocks = np.load(path / "blocks.npy", mmap_mode="r")
+        size = (path / "postings.bin").stat().st_size
+        self.postings = (
+            np.memmap(path / "postings.bin", dtype=np.uint8, mode="r")
+            if size
+            else np.zeros(0, dtype=np.uint8)
+        )
+        docs = pq.read_table(path / "docs.parquet")
+        self.chunk_ids = docs.column("chunk_id").to_pylist()
+        self.lengths = docs.column("length").to_numpy().astype(np.int64)
+        self.versions = (  # segments written before versions were kept have none
+            docs.column("version").to_pylist()
+            if "version" in docs.column_names
+            else [None] * len(self.chunk_ids)
+        )
+        self.live = np.ones(len(self.chunk_ids), dtype=bool)
+        if (path / "deleted.npy").exists():
+            self.live[np.load(path / "deleted.npy")] = False
+
+    def save_deleted(self):
+        tmp = self.path / "deleted.tmp.npy"
+        np.save(tmp, np.flatnonzero(~self.live))
+        os.replace(tmp, self.path / "deleted.npy")
+
+    def read_blocks(self, ids) -> Tuple[np.ndarray, np.ndarray]:
+        """Local doc ids and tfs of the postings in blocks `ids` (ascending), in order."""
+        rows = self.blocks[np.asarray(ids, dtype=np.int64)]
+        if not len(rows):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        _, base, start, end, count = rows.T
+        vals = decode_varints(self.postings[_ranges(start, end - start)])
+        vstart = 2 * (np.cumsum(count) - count)
+        pstart = np.cumsum(count) - count
+        pb = np.repeat(np.arange(len(rows)), count)
+        j = np.arange(pb.size) - pstart[pb]
+        deltas = vals[vstart[pb] + j]
+        tfs = vals[vstart[pb] + count[pb] + j]
+        c = np.cumsum(deltas)
+        docs = base[pb] + c - (c[pstart] - deltas[pstart])[pb]
+        return docs, tfs
+
+
+class _Term(NamedTuple):
+    idf: float
+    ub: float  # upper bound of the term's score in any doc
+    parts: List[Tuple[int, np.ndarray]]  # (segment, terms.npy row) where the term occurs
+
+
+class BM25Index:
+    """The BM25 index in `directory`; an empty one is created if there is none."""
+
+    def __init__(self, directory: Path, k1: float = K1, b: float = B):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        meta_path = self.dir / "meta.json"
+        if meta_path.exists():
+            self.meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        else:
+            self.meta = {"k1": k1, "b": b, "next_segment": 0, "segments": []}
+        self.k1, self.b = self.meta["k1"], self.meta["b"]
+        self.segments = [_Segment(self.dir / name) for name in self.meta["segments"]]
+        self._reload()
+
+    def _reload(self):
+        self._base = np.r_[0, np.cumsum([len(s.chunk_ids) for s in self.segments])].astype(np.int64)
+        self.n_docs = int(self._base[-1])
+        self._lengths = np.concatenate(
+            [np.zeros(0, dtype=np.int64)] + [s.lengths for s in self.segments]
+        )
+        self._live = np.concatenate([np.zeros(0, dtype=bool)] + [s.live for s in self.segments])
+        self._avgdl = float(self._lengths.mean()) if self.n_docs else 1.0
+        self._chunk_ids = [c for s in self.segments for c in s.chunk_ids]
+        self._key = {c: i for i, c in enumerate(self._chunk_ids) if self._live[i]}
+        self._versions = [v for s in self.segments for v in s.versions]
+
+    def _commit(self, segments: List[str]):
+        self.meta["segments"] = segments
+        tmp = self.dir / "meta.json.tmp"
+        tmp.write_text(json.dumps(self.meta), encoding="utf-8")
+        os.replace(tmp, self.dir / "meta.json")
+
+    def __len__(self) -> int:
+        return len(self._key)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._key
+
+    def chunk_ids(self) -> List[str]:
+        return list(self._key)
+
+    def version(self, chunk_id: str) -> str | None:
+        """The version the live `chunk_id` was indexed with (None if it had none)."""
+        return self._versions[self._key[chunk_id]]
+
+    # ---- updates ----------------------------------------------------------------------------
+
+    def add(
+        self, chunk_ids: List[str], texts: Iterable[str], versions: List[str] | None = None
+    ) -> int:
+        """Index new chunks as one new segment; chunk_ids already indexed are skipped.
+
+        `versions` (e.g. the texts' pack-store keys) are kept per chunk, so a caller can
+        tell when a chunk_id's text has changed and replace it.
+        """
+        if versions is None:
+            versions = [None] * len(chunk_ids)
+        new = [(c, t, v) for c, t, v in zip(chunk_ids, texts, versions) if c not in self._key]
+        new = list({c: (c, t, v) for c, t, v in new}.values())
+        if not new:
+            return 0
+        terms, tids, docs, tfs, lengths = _invert(t for _, t, _ in new)
+        name = f"seg-{self.meta['next_segment']:05d}"
+        self.meta["next_segment"] += 1
+        _write_segment(
+            self.dir / name,
+            terms,
+            tids,
+            docs,
+            tfs,
+            [c for c, _, _ in new],
+            lengths,
+            [v for _, _, v in new],
+        )
+        self.segments.append(_Segment(self.dir / name))
+        self._commit(self.meta["segments"] + [name])
+        if len(self.segments) > MAX_SEGMENTS:
+            self.merge()
+        else:
+            self._reload()
+        return len(new)
+
+    def delete(self, chunk_ids: Iterable[str]) -> int:
+        keys = np.array([self._key[c] for c in chunk_ids if c in self._key], dtype=np.int64)
+        if not keys.size:
+            return 0
+        seg = np.searchsorted(self._base, keys, side="right") - 1
+        for s in np.unique(seg):
+            self.segments[s].live[keys[seg == s] - self._base[s]] = False
+            self.segments[s].save_deleted()
+        self._reload()
+        return int(keys.size)
+
+    def merge(self):
+        """Rewrite all segments as one, dropping deleted docs."""
+        vocab = sorted(set().union(*(s.terms for s in self.segments)))
+        vid = {t: i for i, t in enumerate(vocab)}
+        tids, docs, tfs = [], [], []
+        offset = 0
+        for s in self.segments:
+            d, tf = s.read_blocks(np.arange(len(s.blocks)))
+            t = np.repeat(np.array([vid[w] for w in s.term_list], dtype=np.int64), s.info[:, 0])
+            remap = np.cumsum(s.live) - 1 + offset
+            keep = s.live[d]
+            tids.append(t[keep])
+            docs.append(remap[d[keep]])
+            tfs.append(tf[keep])
+            offset += int(s.live.sum())
+        chunk_ids = [c for s in self.segments for c, ok in zip(s.chunk_ids, s.live) if ok]
+        lengths = np.concatenate([s.lengths[s.live] for s in self.segments])
+        versions = [v for s in self.segments for v, ok in zip(s.versions, s.live) if ok]
+        name = f"seg-{self.meta['next_segment']:05d}"
+        self.meta["next_segment"] += 1
+        _write_segment(
+            self.dir / name,
+            vocab,
+            _concat(tids),
+            _concat(docs),
+            _concat(tfs),
+            chunk_ids,
+            lengths,
+            versions,
+        )
+        old = self.segments
+        self.segments = [_Segment(self.dir / name)]
+        self._commit([name])
+        for s in old:
+            shutil.rmtree(s.path, ignore_errors=True)
+        self._reload()
+
+    # ---- queries ----------------------------------------------------------------------------
+
+    def _tf_part(self, tf, dl):
+        return tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * dl / self._avgdl))
+
+    def _term(self, term: str) -> _Term | None:
+        parts = [(i, s.info[s.terms[term]]) for i, s in enumerate(self.segments) if term in s.terms]
+        if not parts:
+            return None
+        df = sum(int(p[0]) for _, p in parts)
+        idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+        max_tf = max(int(p[3]) for _, p in parts)
+        min_len = min(int(p[4]) for _, p in parts)
+        return _Term(idf, idf * self._tf_part(max_tf, min_len) * (1 + _SLACK), parts)
+
+    def _postings(self, term: _Term) -> Tuple[np.ndarray, np.ndarray]:
+        """Live docs (global ids) of a term and the term's score in each."""
+        keys, scores = [], []
+        for s, (_, first, n, _, _) in term.parts:
+            docs, tfs = self.segments[s].read_blocks(np.arange(first, first + n))
+            docs = docs + self._base[s]
+            live = self._live[docs]
+            keys.append(docs[live])
+            scores.append(term.idf * self._tf_part(tfs[live], self._lengths[docs[live]]))
+        return np.concatenate(keys), np.concatenate(scores)
+
+    def _probe(self, term: _Term, keys: np.ndarray) -> np.ndarray:
+        """The term's score in each doc of sorted global ids `keys` (0 where absent).
+
+        Only the blocks whose doc range can hold one of `keys` are decoded.
+        """
+        out = np.zeros(keys.size)
+        for s, (_, first, n, _, _) in term.parts:
+            lo, hi = np.searchsorted(keys, self._base[s : s + 2])
+            local = keys[lo:hi] - self._base[s]
+            if not local.size:
+                continue
+            bi = np.searchsorted(self.segments[s].blocks[first : first + n, 0], local)
+            need = np.unique(bi[bi < n])
+            docs, tfs = self.segments[s].read_blocks(first + need)
+            pos = np.minimum(np.searchsorted(docs, local), max(docs.size - 1, 0))
+            hit = docs[pos] == local if docs.size else np.zeros(local.size, dtype=bool)
+            dl = self.segments[s].lengths[local[hit]]
+            out[lo:hi][hit] = term.idf * self._tf_part(tfs[pos[hit]], dl)
+        return out
+
+    def _query_terms(self, query: str) -> List[_Term]:
+        terms = [self._term(t) for t in dict.fromkeys(tokenize(query))]
+        return sorted((t for t in terms if t), key=lambda t: -t.ub)
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Top `k` (chunk_id, BM25 score), best first; ties go to the earlier indexed chunk.
+
+        MaxScore: terms are taken by decreasing score upper bound and their postings
+        fully decoded only while the bounds of the terms left could still lift a new
+        doc to the k-th best score seen so far. The remaining terms are only probed,
+        block by block, for the candidates whose bound can still reach it.
+        """
+        terms = self._query_terms(query)
+        if k <= 0 or not terms:
+            return []
+        rest = [sum(t.ub for t in terms[i:]) for i in range(len(terms) + 1)]
+        keys, part = np.zeros(0, dtype=np.int64), np.zeros(0)
+        theta = 0.0  # k-th best partial score, a lower bound of the k-th best score
+        i = 0
+        while i < len(terms) and rest[i] >= theta:
+            docs, scores = self._postings(terms[i])
+            keys, inv = np.unique(np.r_[keys, docs], return_inverse=True)
+            part = np.bincount(inv, np.r_[part, scores], minlength=keys.size)
+            i += 1
+            if keys.size >= k:
+                theta = np.partition(part, keys.size - k)[keys.size - k]
+        for j in range(i, len(terms)):
+            keep = part + rest[j] >= theta
+            keys, part = keys[keep], part[keep]
+            part = part + self._probe(terms[j], keys)
+            if keys.size >= k:
+                theta = np.partition(part, keys.size - k)[keys.size - k]
+        top = np.lexsort((keys, -part))[:k]
+        return [(self._chunk_ids[keys[t]], float(part[t])) for t in top]
+
+    def scores(self, query: str, chunk_ids: List[str]) -> np.ndarray:
+        """BM25 score of `query` for each of `chunk_ids` (0 for unknown ones).
+
+        Aligned with `chunk_ids`, so it can be passed as the `bm25` feature column of
+        `rerank.rerank_topk` / `combine_scores_batch`.
+        """
+        keys = np.array([self._key.get(c, -1) for c in chunk_ids], dtype=np.int64)
+        uniq, inv = np.unique(keys[keys >= 0], return_inverse=True)
+        total = np.zeros(uniq.size)
+        for term in self._query_terms(query):
+            total += self._probe(term, uniq)
+        out = np.zeros(keys.size)
+        out[keys >= 0] = total[inv]
+        return out
+
+
+def index_dir(root: Path, zone: str) -> Path:
+    return Path(root) / zone / "bm25"
+
+
+def update_zone_index(root: Path, zone: str) -> Dict[str, int]:
+    """Bring `zone`'s BM25 index in line with catalog/chunks.parquet under `root`."""
+    chunks = pd.read_parquet(
+        Path(root) / "catalog" / "chunks.parquet",
+        columns=["chunk_id", "zone", "segment", "offset", "length"],
+    )
+    chunks = chunks[chunks.zone == zone].drop_duplicates("chunk_id")
+    index = BM25Index(index_dir(root, zone))
+    deleted = index.delete(set(index.chunk_ids()) - set(chunks.chunk_id))
+    with PackStore(Path(root) / zone / "chunks", read_only=True) as store:
+        # chunk_ids are positional: a re-chunked doc keeps its ids, but its texts are
+        # stored under new keys, so a changed key means the indexed text is stale
+        key_at = {loc: key for key, loc in store.index.items()}
+        versions = [
+            key_at.get((r.segment, r.offset, r.length)) for r in chunks.itertuples(index=False)
+        ]
+        replaced = index.delete(
+            [c for c, v in zip(chunks.chunk_id, versions) if c in index and index.version(c) != v]
+        )
+        todo = ~chunks.chunk_id.isin(index.chunk_ids()).to_numpy()
+        new = chunks[todo]
+        texts = [
+            store.read(r.segment, r.offset, r.length).decode("utf-8")
+            for r in new.itertuples(index=False)
+        ]
+    added = index.add(new.chunk_id.tolist(), texts, [v for v, t in zip(versions, todo) if t])
+    return {
+        "added": added,
+        "deleted": deleted,
+        "replaced": replaced,
+        "chunks": len(index),
+        "segments": len(index.segments),
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Update or query a zone's BM25 index.")
+    ap.add_argument("--root", required=True, help="data root (contains catalog/ and the zones)")
+    ap.add_argument("--zone", default="silver_normalized")
+    ap.add_argument("--update", action="store_true", help="index the catalog's new chunks first")
+    ap.add_argument("--query", help="print the top chunks for this query")
+    ap.add_argument("-k", type=int, default=10)
+    args = ap.parse_args()
+    if args.update:
+        print(update_zone_index(Path(args.root), args.zone))
+    if args.query:
+        for chunk_id, score in BM25Index(index_dir(Path(args.root), args.zone)).search(
+            args.query, args.k
+        ):
+            print(f"{score:8.3f}  {chunk_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Arrow schemas for the catalog tables and a row-group-at-a-time Parquet writer."""
+
+import os
+from dataclasses import fields
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ROW_GROUP_SIZE = 50_000
+
+DOCS_SCHEMA = pa.schema(
+    [
+        ("doc_uid", pa.string()),
+        ("dataset_id", pa.string()),
+        ("source_path", pa.string()),
+        ("mime", pa.string()),
+        ("bytes", pa.int64()),
+        ("checksum", pa.string()),
+        ("created_ts", pa.string()),
+        ("modified_ts", pa.string()),
+        ("title", pa.string()),
+        ("author", pa.string()),
+        ("lang", pa.string()),
+        ("charset", pa.string()),
+        ("chunk_count", pa.int64()),
+        ("quarantine", pa.bool_()),
+        ("nsfw_score", pa.float64()),
+        ("toxicity_score", pa.float64()),
+        ("illicit_score", pa.float64()),
+        ("pii_score", pa.float64()),
+        ("risk_tags", pa.list_(pa.string())),
+    ]
+)
+CHUNKS_SCHEMA = pa.schema(
+    [
+        ("doc_uid", pa.string()),
+        ("chunk_id", pa.string()),
+        ("idx", pa.int64()),
+        ("offset_start", pa.int64()),
+        ("offset_end", pa.int64()),
+        ("lang", pa.string()),
+        ("nsfw_score", pa.float64()),
+        ("toxicity_score", pa.float64()),
+        ("illicit_score", pa.float64()),
+        ("pii_score", pa.float64()),
+        ("zone", pa.string()),
+        ("segment", pa.int64()),
+        ("offset", pa.int64()),
+        ("length", pa.int64()),
+    ]
+)
+MANIFEST_SCHEMA = pa.schema(
+    [
+        ("source_path", pa.string()),
+        ("size", pa.int64()),
+        ("mtime_ns", pa.int64()),
+        ("dev", pa.int64()),
+        ("inode", pa.int64()),
+        ("checksum", pa.string()),
+    ]
+)
+
+
+class TableWriter:
+    """Buffer rows column-wise and write them to `path` one row group at a time.
+
+    Rows may be dataclass instances (`write`), dicts (`write_dict`) or whole DataFrames
+    (`write_frame`); they land in the file in call order. The file is written under a
+    temporary name and moved into place by `close`, so readers never see a partial
+    table; leaving the context on an exception discards it instead.
+    """
+
+    def __init__(self, path: Path, schema: pa.Schema, row_group_size: int = ROW_GROUP_SIZE):
+        self.path = Path(path)
+        self.schema = schema
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._tmp = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        self._writer = pq.ParquetWriter(self._tmp, schema, compression="zstd")
+        self._cols = {name: [] for name in schema.names}
+        self._buffered = 0
+
+    def write(self, row):
+        for f in fields(row):
+            self._cols[f.name].append(getattr(row, f.name))
+        self._added(1)
+
+    def write_dict(self, row: dict):
+        for name, col in self._cols.items():
+            col.append(row[name])
+        self._added(1)
+
+    def write_frame(self, df: pd.DataFrame):
+        if not len(df):
+            return
+        self.flush()
+        table = pa.Table.from_pandas(
+            df[self.schema.names], schema=self.schema, preserve_index=False
+        )
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self.rows += len(df)
+
+    def _added(self, n: int):
+        self._buffered += n
+        self.rows += n
+        if self._buffered >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffered:
+            self._writer.write_table(pa.Table.from_pydict(self._cols, schema=self.schema))
+            for col in self._cols.values():
+                col.clear()
+            self._buffered = 0
+
+    def close(self):
+        self.flush()
+        self._writer.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        self._writer.close()
+        self._tmp.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,127 @@
+"""Token-budgeted chunking with exact character offsets, shared by rag_soup and the miner.
+
+Text is scanned once with a tokenizer regex; a chunk is a (start, end) span of the
+original text, so `text[start:end]` is always the chunk's exact content and offsets
+never drift. Only the tokens of the chunk being built are kept in memory, so chunks
+can be streamed from arbitrarily large documents.
+"""
+
+import re
+from collections import deque
+from typing import Iterator, NamedTuple, Tuple
+
+# a token and the whitespace before it
+TOKEN_RE = re.compile(r"(\s*)(\S+)")
+SENT_END = frozenset(".!?")
+CLOSERS = "\"')]"
+
+# strength of the boundary before a token: where a semantic cut may go
+NONE, SENTENCE, PARAGRAPH = 0, 1, 2
+
+
+class Span(NamedTuple):
+    start: int
+    end: int
+    tokens: int
+
+
+class _Tok(NamedTuple):
+    start: int
+    end: int
+    boundary: int
+
+
+def _tokens(text: str, max_chars: int | None) -> Iterator[_Tok]:
+    """Whitespace tokens of `text` with the boundary strength before each one."""
+    prev_sentence = False
+    for m in TOKEN_RE.finditer(text):
+        s, e = m.span(2)
+        if m.group(1).count("\n") >= 2:
+            boundary = PARAGRAPH
+        elif prev_sentence:
+            boundary = SENTENCE
+        else:
+            boundary = NONE
+        prev_sentence = m.group(2).rstrip(CLOSERS)[-1:] in SENT_END
+        if max_chars and e - s > max_chars:
+            # an overlong run without whitespace (base64, minified code, ...)
+            for i in range(s, e, max_chars):
+                yield _Tok(i, min(i + max_chars, e), boundary if i == s else NONE)
+        else:
+            yield _Tok(s, e, boundary)
+
+
+def _cut_point(buf: deque, lo: int) -> int:
+    """Number of tokens to emit: up to the strongest boundary at index >= `lo`, else all."""
+    for level in (PARAGRAPH, SENTENCE):
+        for i in range(len(buf) - 1, lo - 1, -1):
+            if buf[i].boundary >= level:
+                return i
+    return len(buf)
+
+
+def _restart(buf: deque, cut: int, overlap: int) -> int:
+    """Index of the token the next chunk starts at, `overlap` tokens before `cut` at most."""
+    if overlap <= 0:
+        return cut
+    lo = max(1, cut - overlap)
+    for level in (PARAGRAPH, SENTENCE):
+        for i in range(lo, cut):
+            if buf[i].boundary >= level:
+                return i
+    return lo
+
+
+def chunk_spans(
+    text: str,
+    target_tokens: int = 800,
+    overlap_tokens: int = 0,
+    max_chars: int | None = None,
+    splitter: str = "semantic",
+    min_tokens: int | None = None,
+) -> Iterator[Span]:
+    """Yield chunk spans of at most `target_tokens` tokens and `max_chars` characters.
+
+    `splitter="semantic"` ends a chunk at the last paragraph break, else the last
+    sentence end, that leaves it at least `min_tokens` long (default half the target)
+    and starts the next chunk at a sentence or paragraph start within the last
+    `overlap_tokens` tokens when there is one. `splitter="fixed"` cuts at exactly
+    `target_tokens` and overlaps by exactly `overlap_tokens`. Tokens are whitespace
+    separated words.
+    """
+    if splitter not in ("semantic", "fixed"):
+        raise ValueError(f"unknown splitter: {splitter!r}")
+    if min_tokens is None:
+        min_tokens = target_tokens // 2
+    overlap = min(overlap_tokens, target_tokens - 1)
+    buf: deque = deque()
+    emitted = 0  # leading tokens of `buf` already in an emitted chunk (the overlap)
+
+    for tok in _tokens(text, max_chars):
+        while buf and (
+            len(buf) >= target_tokens or (max_chars and tok.end - buf[0].start > max_chars)
+        ):
+            if len(buf) <= emitted:
+                # only overlap is left and it does not fit with the next token
+                buf.popleft()
+                emitted -= 1
+                continue
+            if splitter == "fixed":
+                cut = len(buf)
+                restart = max(1, cut - overlap)
+            else:
+                cut = _cut_point(buf, max(min_tokens, emitted + 1))
+                restart = _restart(buf, cut, overlap)
+            yield Span(buf[0].start, buf[cut - 1].end, cut)
+            for _ in range(restart):
+                buf.popleft()
+            emitted = cut - restart
+        buf.append(tok)
+    if len(buf) > emitted:
+        yield Span(buf[0].start, buf[-1].end, len(buf))
+
+
+def chunk_text(text: str, **kwargs) -> Iterator[Tuple[int, int, str]]:
+    """`chunk_spans` as (start, end, text[start:end]) tuples."""
+    for span in chunk_spans(text, **kwargs):
+        yield span.start, span.end, text[span.start : span.end]
@@ -1,3 +1,8 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+
 def rrf(rankings: list[dict[str, int]], k: int = 60, weights: list[float] | None = None):
     ws = weights or [1 / len(rankings)] * len(rankings)
     scores = {}
@@ -22,3 +27,179 @@ def z_fuse(score_dicts: list[dict[str, float]], weights: list[float] | None = No
             z = (scores[d] - mu) / sigma if d in scores else floor
             fused[d] += w * z
     return sorted(fused.items(), key=lambda x: -x[1])
+
+
+# ---- batched fusion over many queries ------------------------------------------------------
+
+BLOCK_CELLS = 1 << 18  # padded (queries x candidates) cells ranked at once
+
+
+class DocIds:
+    """Dense integer ids for doc ids, assigned in order of first sight."""
+
+    def __init__(self):
+        self.ids: list = []
+        self._index: dict = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def encode(self, docs) -> np.ndarray:
+        index, ids = self._index, self.ids
+        out = np.empty(len(docs), dtype=np.int64)
+        for i, d in enumerate(docs):
+            j = index.get(d)
+            if j is None:
+                j = index[d] = len(ids)
+                ids.append(d)
+            out[i] = j
+        return out
+
+    def decode(self, dense) -> list:
+        return [self.ids[j] for j in dense if j >= 0]
+
+
+@dataclass
+class Results:
+    """One retriever's results for a batch of queries, CSR style.
+
+    Query q owns `docs[indptr[q]:indptr[q + 1]]` (dense ids) and the matching
+    `values`: ranks for `rrf_batch`, raw scores for `z_fuse_batch`.
+    """
+
+    indptr: np.ndarray
+    docs: np.ndarray
+    values: np.ndarray
+
+    @classmethod
+    def from_dicts(cls, per_query: list[dict], ids: DocIds) -> "Results":
+        lens = np.fromiter((len(d) for d in per_query), dtype=np.int64, count=len(per_query))
+        indptr = np.zeros(len(per_query) + 1, dtype=np.int64)
+        np.cumsum(lens, out=indptr[1:])
+        docs = ids.encode([d for q in per_query for d in q])
+        values = np.fromiter((v for q in per_query for v in q.values()), np.float64, len(docs))
+        return cls(indptr, docs, values)
+
+    @property
+    def n_queries(self) -> int:
+        return len(self.indptr) - 1
+
+
+def _fuse(results: list[Results], contrib: list[np.ndarray], fill: list, top_k: int):
+    """Sum per-(query, doc) contributions and rank each query's docs, top `top_k` only.
+
+    `contrib[r]` is retriever r's term for each of its entries and `fill[r]` (per
+    query, or None for 0) its term for docs of the query it did not return. Terms
+    are added retriever by retriever, and ties keep the order in which docs first
+    appear, as in the dict-based `rrf` / `z_fuse`.
+
+    Queries are processed in blocks: each block's docs are laid out in a padded
+    (queries x entries) matrix whose columns follow first sighting, and the top
+    `top_k` per row come from a partial sort.
+    """
+    n_q = results[0].n_queries
+    n_docs = 1 + max((int(r.docs.max()) for r in results if r.docs.size), default=0)
+    per_query = sum(np.diff(r.indptr) for r in results)
+    width = max(int(per_query.max()) if n_q else 0, top_k)
+    block = max(1, BLOCK_CELLS // width)
+    out_docs = np.full((n_q, top_k), -1, dtype=np.int64)
+    out_scores = np.full((n_q, top_k), np.nan)
+    for lo in range(0, n_q, block):
+        hi = min(n_q, lo + block)
+        rows = hi - lo
+        # entries of the block, retriever by retriever; `col` = offset within the
+        # query's entries across retrievers, i.e. the order of sighting
+        qs, docs, cols, spans = [], [], [], []
+        seen = np.zeros(rows, dtype=np.int64)
+        for r in results:
+            ptr = r.indptr[lo : hi + 1]
+            cnt = np.diff(ptr)
+            q = np.repeat(np.arange(rows), cnt)
+            qs.append(q)
+            docs.append(r.docs[ptr[0] : ptr[-1]])
+            cols.append(seen[q] + np.arange(ptr[-1] - ptr[0]) - (ptr[:-1] - ptr[0])[q])
+            spans.append((ptr[0], ptr[-1]))
+            seen += cnt
+        q, d, c = np.concatenate(qs), np.concatenate(docs), np.concatenate(cols)
+        # `col` makes keys unique, so a plain sort puts each (query, doc) group's
+        # first sighting first without paying for a stable one
+        keys = q * n_docs + d
+        order = np.argsort(keys * width + c)
+        sk = keys[order]
+        new = np.r_[True, sk[1:] != sk[:-1]] if sk.size else np.zeros(0, dtype=bool)
+        group = np.empty(keys.size, dtype=np.int64)
+        group[order] = np.cumsum(new) - 1
+        heads = order[new]
+        uq, udoc = q[heads], d[heads]
+        score = np.zeros(heads.size)
+        pos = 0
+        for (a, b), con, f in zip(spans, contrib, fill):
+            term = np.zeros(heads.size) if f is None else f[lo:hi][uq]
+            term[group[pos : pos + b - a]] = con[a:b]
+            score += term
+            pos += b - a
+        cell = uq * width + c[heads]
+        mat = np.full((rows, width), -np.inf)
+        mat.ravel()[cell] = score
+        ids = np.full((rows, width), -1, dtype=np.int64)
+        ids.ravel()[cell] = udoc
+        # k-th best value per row; of the ties at that value keep the first-seen ones
+        kth = -np.partition(-mat, top_k - 1, axis=1)[:, top_k - 1 : top_k]
+        keep = mat >= kth
+        over = np.flatnonzero(keep.sum(axis=1) > top_k)
+        if over.size:
+            sub, th = mat[over], kth[over]
+            tied = sub == th
+            room = top_k - (sub > th).sum(axis=1, keepdims=True)
+            keep[over] = (sub > th) | (tied & (np.cumsum(tied, axis=1) <= room))
+        sel = np.nonzero(keep)[1].reshape(rows, top_k)
+        vals = np.take_along_axis(mat, sel, axis=1)
+        rank = np.argsort(-vals, axis=1, kind="stable")
+        sel = np.take_along_axis(sel, rank, axis=1)
+        vals = np.take_along_axis(vals, rank, axis=1)
+        top = np.take_along_axis(ids, sel, axis=1)
+        out_docs[lo:hi] = top
+        out_scores[lo:hi] = np.where(top >= 0, vals, np.nan)
+    return out_docs, out_scores
+
+
+def _weights(n: int, weights):
+    return weights or [1 / n] * n
+
+
+def rrf_batch(results: list[Results], k: int = 60, weights=None, top_k: int = 10):
+    """`rrf` for a batch of queries at once.
+
+    Returns `(docs, scores)`, both `(n_queries, top_k)`, best first; `docs` holds
+    dense ids (-1 past a query's last doc, with a NaN score).
+    """
+    ws = _weights(len(results), weights)
+    contrib = [w * (1.0 / (k + r.values)) for w, r in zip(ws, results)]
+    return _fuse(results, contrib, [None] * len(results), top_k)
+
+
+def z_fuse_batch(results: list[Results], weights=None, top_k: int = 10):
+    """`z_fuse` for a batch of queries at once; same return value as `rrf_batch`.
+
+    Per query, a doc missing from a retriever gets that retriever's lowest z-score.
+    """
+    ws = _weights(len(results), weights)
+    n_q = results[0].n_queries
+    contrib, fill = [], []
+    for w, r in zip(ws, results):
+        n = np.diff(r.indptr)
+        nz = n > 0
+        starts = r.indptr[:-1][nz]
+        mu, low, var = np.zeros(n_q), np.zeros(n_q), np.zeros(n_q)
+        if nz.any():
+            mu[nz] = np.add.reduceat(r.values, starts) / n[nz]
+            low[nz] = np.minimum.reduceat(r.values, starts)
+        mu_e = np.repeat(mu, n)
+        if nz.any():
+            var[nz] = np.add.reduceat((r.values - mu_e) ** 2, starts) / n[nz]
+        sigma = np.sqrt(var)
+        sigma[sigma == 0] = 1.0
+        # a retriever with no results for a query adds nothing to it
+        fill.append(np.where(nz, w * ((low - mu) / sigma), 0.0))
+        contrib.append(w * ((r.values - mu_e) / np.repeat(sigma, n)))
+    return _fuse(results, contrib, fill, top_k)
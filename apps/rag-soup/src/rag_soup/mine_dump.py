@@ -1,10 +1,19 @@
-import argparse, hashlib, mimetypes, os, shutil, time, re, json, unicodedata
+import argparse, hashlib, mimetypes, os, shutil, stat, time, re, json, threading, unicodedata
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
 from pathlib import Path
-from dataclasses import dataclass, asdict
-from typing import List, Dict, Tuple
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Dict, Tuple
 import chardet
 import pandas as pd
 
+from . import ann, bm25
+from .catalog import CHUNKS_SCHEMA, DOCS_SCHEMA, MANIFEST_SCHEMA, TableWriter
+from .chunking import chunk_text
+from .pack_store import PackStore, encode_record
+from .safety_adapter import SafetyAdapter
+
 ZONE_CFG = {
     "thresholds": {"nsfw": 0.55, "toxicity": 0.50, "illicit": 0.35, "pii": 0.60},
     "chunk_tokens_min": 120,
@@ -12,10 +21,6 @@ ZONE_CFG = {
 }
 
 
-def _tokens(s: str) -> int:
-    return max(1, len(s.split()))
-
-
 def sha256_hex(b: bytes) -> str:
     return hashlib.sha256(b).hexdigest()
 
@@ -26,19 +31,24 @@ def norm_text(txt: str) -> str:
     return txt.strip()
 
 
-def detect_encoding(path: Path) -> str:
-    with open(path, "rb") as f:
-        raw = f.read(100_000)
-    guess = chardet.detect(raw)
+def detect_encoding(path: Path, raw: bytes | None = None) -> str:
+    if raw is None:
+        with open(path, "rb") as f:
+            raw = f.read(100_000)
+    guess = chardet.detect(raw[:100_000])
     return guess.get("encoding") or "utf-8"
 
 
-def read_text_like(path: Path) -> str | None:
+def read_text_like(path: Path, raw: bytes | None = None) -> str | None:
+    """Decode + normalize a text-like file; pass `raw` (the file's bytes) to skip re-reading it."""
     mime, _ = mimetypes.guess_type(str(path))
     ext = (path.suffix or "").lower()
     try:
-        enc = detect_encoding(path)
-        text = path.read_text(encoding=enc, errors="ignore")
+        if raw is None:
+            raw = path.read_bytes()
+        enc = detect_encoding(path, raw)
+        # same newline handling as Path.read_text (universal newlines)
+        text = raw.decode(enc, errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
         if ext in {".html", ".htm"}:
             text = re.sub(r"<script[\s\S]*?</script>", " ", text, flags=re.I)
             text = re.sub(r"<style[\s\S]*?</style>", " ", text, flags=re.I)
@@ -50,52 +60,24 @@ def read_text_like(path: Path) -> str | None:
 
 def chunk_paragraphs(
     text: str, tmin=ZONE_CFG["chunk_tokens_min"], tmax=ZONE_CFG["chunk_tokens_max"]
-):
-    paras = re.split(r"\n\s*\n", text)
-    chunks, buf, start_off = [], [], 0
-    cur_tokens = 0
-    for p in paras:
-        if not p.strip():
-            start_off += len(p) + 2
-            continue
-        t = _tokens(p)
-        if cur_tokens + t <= tmax:
-            buf.append(p)
-            cur_tokens += t
-        else:
-            if cur_tokens >= tmin:
-                chunk_text = "\n\n".join(buf).strip()
-                end_off = start_off + len(chunk_text)
-                chunks.append((start_off, end_off, chunk_text))
-                start_off += len(chunk_text) + 2
-                buf, cur_tokens = [p], t
-            else:
-                buf.append(p)
-                chunk_text = "\n\n".join(buf).strip()
-                end_off = start_off + len(chunk_text)
-                chunks.append((start_off, end_off, chunk_text))
-                start_off += len(chunk_text) + 2
-                buf, cur_tokens = [], 0
-    if buf:
-        chunk_text = "\n\n".join(buf).strip()
-        end_off = start_off + len(chunk_text)
-        chunks.append((start_off, end_off, chunk_text))
-    return chunks
-
-
-# naive regex heuristics (swap with ML classifiers later)
-NSFW_PAT = re.compile(r"\b(nude|porn|xxx|explicit|nsfw|sexual|fetish)\b", re.I)
-TOX_PAT = re.compile(r"\b(idiot|stupid|hate|kill|slur)\b", re.I)
-ILL_PAT = re.compile(r"\b(how to make a bomb|credit card dump|exploit kit|c2 server)\b", re.I)
-PII_PAT = re.compile(r"\b(\d{3}-\d{2}-\d{4})\b")
+) -> List[Tuple[int, int, str]]:
+    """Paragraph-packed chunks of at most `tmax` tokens, as exact (start, end, text) spans.
+
+    A chunk ends at the last paragraph (else sentence) break that keeps it at least
+    `tmin` tokens long; `text[start:end]` is always the chunk text.
+    """
+    return list(chunk_text(text, target_tokens=tmax, min_tokens=tmin))
+
+
+_SAFETY = SafetyAdapter(ZONE_CFG["thresholds"])
 
 
 def safety_scores(text: str) -> Dict[str, float]:
-    nsfw = 1.0 if NSFW_PAT.search(text) else 0.0
-    tox = 1.0 if TOX_PAT.search(text) else 0.0
-    ill = 1.0 if ILL_PAT.search(text) else 0.0
-    pii = 1.0 if PII_PAT.search(text) else 0.0
-    return {"nsfw": nsfw, "toxicity": tox, "illicit": ill, "pii": pii, "conf": 0.5}
+    return _SAFETY.score_text(text)
+
+
+def safety_scores_batch(texts: List[str]) -> List[Dict[str, float]]:
+    return _SAFETY.score_batch(texts)
 
 
 def decide_zone(doc_scores: Dict[str, float], thresholds=ZONE_CFG["thresholds"]):
@@ -139,124 +121,384 @@ class ChunkRow:
     toxicity_score: float
     illicit_score: float
     pii_score: float
-    text: str
+    # where the chunk text lives: root/<zone>/chunks, a PackStore
+    zone: str
+    segment: int
+    offset: int
+    length: int
 
 
-def mine_dataset(input_dir: Path, root: Path, dataset_id: str):
-    bronze = root / "bronze_raw"
-    silver = root / "silver_normalized"
-    red = root / "red_quarantine"
-    catalog = root / "catalog"
-    for p in (bronze, silver, red, catalog, catalog / "dataset_cards"):
-        p.mkdir(parents=True, exist_ok=True)
+MANIFEST_COLUMNS = MANIFEST_SCHEMA.names
+ZONES = ("silver_normalized", "red_quarantine")
 
-    docs_rows: List[DocRow] = []
-    chunks_rows: List[ChunkRow] = []
 
-    all_files = [p for p in Path(input_dir).rglob("*") if p.is_file()]
-    for path in all_files:
+def read_chunk_texts(root: Path, chunks: pd.DataFrame) -> List[str]:
+    """Fetch the text of each row of a chunks.parquet frame from the zone pack stores."""
+    stores: Dict[str, PackStore] = {}
+    try:
+        out = []
+        for r in chunks.itertuples(index=False):
+            if r.zone not in stores:
+                stores[r.zone] = PackStore(Path(root) / r.zone / "chunks", read_only=True)
+            out.append(stores[r.zone].read(r.segment, r.offset, r.length).decode("utf-8"))
+        return out
+    finally:
+        for st in stores.values():
+            st.close()
+
+
+def _discover(input_dir: Path) -> Iterator[Tuple[Path, os.stat_result]]:
+    for p in Path(input_dir).rglob("*"):
         try:
-            raw = path.read_bytes()
-        except Exception:
+            st = p.stat()
+        except OSError:
             continue
-        checksum = sha256_hex(raw)
-        size = len(raw)
-        mime, _ = mimetypes.guess_type(str(path))
-        mime = mime or "application/octet-stream"
-
-        bronze_path = bronze / checksum[:2] / checksum
-        bronze_path.parent.mkdir(parents=True, exist_ok=True)
-        if not bronze_path.exists():
-            shutil.copy2(path, bronze_path)
-
-        text = read_text_like(path)
-        if not text:
-            zone_name = "red_quarantine"
-            reasons = ["non_text"]
-            doc_scores = {"nsfw": 0, "toxicity": 0, "illicit": 0, "pii": 0}
-            chunks = []
-        else:
-            chunks = chunk_paragraphs(text)
-            agg = {"nsfw": 0.0, "toxicity": 0.0, "illicit": 0.0, "pii": 0.0}
-            for s, e, txt in chunks:
-                sc = safety_scores(txt)
-                for k in agg:
-                    agg[k] = max(agg[k], sc[k])
-            zone_name, reasons = decide_zone(agg)
-            doc_scores = agg
-
-        zone = silver if zone_name == "silver_normalized" else red
-        norm_dir = zone / "docs" / checksum[:2]
-        norm_dir.mkdir(parents=True, exist_ok=True)
-        if text:
-            (norm_dir / f"{checksum}.txt").write_text(text, encoding="utf-8")
-
-        stat = path.stat()
-        doc = DocRow(
-            doc_uid=checksum[:24],
-            dataset_id=dataset_id,
-            source_path=str(path),
-            mime=mime,
-            bytes=size,
-            checksum=checksum,
-            created_ts=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(stat.st_ctime)),
-            modified_ts=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(stat.st_mtime)),
-            title=path.name,
-            author=None,
-            lang="und",
-            charset="utf-8",
-            chunk_count=len(chunks),
-            quarantine=(zone_name == "red_quarantine"),
-            nsfw_score=doc_scores["nsfw"],
-            toxicity_score=doc_scores["toxicity"],
-            illicit_score=doc_scores["illicit"],
-            pii_score=doc_scores["pii"],
-            risk_tags=reasons,
-        )
-        docs_rows.append(doc)
-
-        if text and chunks:
-            chunk_dir = zone / "chunks" / checksum[:2]
-            chunk_dir.mkdir(parents=True, exist_ok=True)
-            for idx, (s, e, txt) in enumerate(chunks):
-                chunk_id = f"{checksum[:24]}:{idx}"
-                (chunk_dir / f"{chunk_id}.txt").write_text(txt, encoding="utf-8")
-                sc = safety_scores(txt)
-                chunks_rows.append(
-                    ChunkRow(
-                        doc_uid=checksum[:24],
-                        chunk_id=chunk_id,
-                        idx=idx,
-                        offset_start=s,
-                        offset_end=e,
-                        lang="und",
-                        nsfw_score=sc["nsfw"],
-                        toxicity_score=sc["toxicity"],
-                        illicit_score=sc["illicit"],
-                        pii_score=sc["pii"],
-                        text=txt,
-                    )
+        if stat.S_ISREG(st.st_mode):
+            yield p, st
+
+
+def _imap_ordered(pool: Executor | None, fn: Callable, items: Iterable, depth: int) -> Iterator:
+    """map(fn, items) on `pool` with at most `depth` tasks in flight, yielding in input order.
+
+    Chaining these gives a pipeline whose stages run concurrently, with `depth` acting as
+    the bounded queue between one stage and the next.
+    """
+    if pool is None:
+        yield from map(fn, items)
+        return
+    pending = deque()
+    for it in items:
+        pending.append(pool.submit(fn, it))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _ingest_file(path: Path, bronze: Path) -> Dict | None:
+    """I/O stage: read the file once; the bytes feed the hash, bronze_raw and decoding."""
+    try:
+        raw = path.read_bytes()
+    except Exception:
+        return None
+    checksum = sha256_hex(raw)
+    mime, _ = mimetypes.guess_type(str(path))
+    bronze_path = bronze / checksum[:2] / checksum
+    bronze_path.parent.mkdir(parents=True, exist_ok=True)
+    if not bronze_path.exists():
+        # write then rename, so concurrent copies of the same content never clash
+        tmp = bronze_path.with_name(f"{checksum}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(raw)
+        shutil.copystat(path, tmp)
+        os.replace(tmp, bronze_path)
+    st = path.stat()
+    return {
+        "path": path,
+        "raw": raw,
+        "checksum": checksum,
+        "size": len(raw),
+        "mime": mime or "application/octet-stream",
+        "ctime": st.st_ctime,
+        "mtime": st.st_mtime,
+        "manifest": {
+            "source_path": str(path),
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "dev": st.st_dev,
+            "inode": st.st_ino,
+            "checksum": checksum,
+        },
+    }
+
+
+def analyze_file(path: Path, raw: bytes | None = None) -> Dict:
+    """CPU stage: decode, normalize, chunk and safety-score one file (each chunk scored once)."""
+    text = read_text_like(path, raw)
+    if not text:
+        return {
+            "text": None,
+            "chunks": [],
+            "chunk_scores": [],
+            "doc_scores": {"nsfw": 0, "toxicity": 0, "illicit": 0, "pii": 0},
+            "zone": "red_quarantine",
+            "reasons": ["non_text"],
+        }
+    chunks = chunk_paragraphs(text)
+    chunk_scores = safety_scores_batch([txt for _, _, txt in chunks])
+    agg = {"nsfw": 0.0, "toxicity": 0.0, "illicit": 0.0, "pii": 0.0}
+    for sc in chunk_scores:
+        for k in agg:
+            agg[k] = max(agg[k], sc[k])
+    zone_name, reasons = decide_zone(agg)
+    return {
+        "text": text,
+        "chunks": chunks,
+        "chunk_scores": chunk_scores,
+        "doc_scores": agg,
+        "zone": zone_name,
+        "reasons": reasons,
+    }
+
+
+def _analyze(meta: Dict) -> Tuple[Dict, Dict]:
+    # the raw bytes are not needed past this stage
+    meta = dict(meta)
+    return meta, analyze_file(meta["path"], meta.pop("raw"))
+
+
+def _record(text: str) -> Tuple[str, bytes]:
+    """(pack store key, record) of a text.
+
+    The key is the sha256 of the text itself, so a text that changes under the same
+    chunk_id (say, after a chunker change) is stored anew instead of served stale.
+    """
+    data = text.encode("utf-8")
+    return sha256_hex(data), encode_record(data)
+
+
+def _store_doc(
+    item: Tuple[Dict, Dict], dataset_id: str
+) -> Tuple[DocRow, List[ChunkRow], Dict, Dict[str, Tuple[str, bytes]]]:
+    """Compress the normalized doc + chunk records and build the catalog rows.
+
+    Records are returned by checksum (the doc) and chunk_id, as (pack store key, record).
+    They are appended to the zone's pack stores by the caller, in file order, so chunk
+    locations come out the same however this stage is parallelized.
+    """
+    meta, res = item
+    checksum, text, chunks = meta["checksum"], res["text"], res["chunks"]
+    zone_name, doc_scores = res["zone"], res["doc_scores"]
+    records = {}
+    if text:
+        records[checksum] = _record(text)
+
+    doc = DocRow(
+        doc_uid=checksum[:24],
+        dataset_id=dataset_id,
+        source_path=str(meta["path"]),
+        mime=meta["mime"],
+        bytes=meta["size"],
+        checksum=checksum,
+        created_ts=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(meta["ctime"])),
+        modified_ts=time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(meta["mtime"])),
+        title=meta["path"].name,
+        author=None,
+        lang="und",
+        charset="utf-8",
+        chunk_count=len(chunks),
+        quarantine=(zone_name == "red_quarantine"),
+        nsfw_score=doc_scores["nsfw"],
+        toxicity_score=doc_scores["toxicity"],
+        illicit_score=doc_scores["illicit"],
+        pii_score=doc_scores["pii"],
+        risk_tags=res["reasons"],
+    )
+
+    chunk_rows = []
+    if text and chunks:
+        for idx, ((s, e, txt), sc) in enumerate(zip(chunks, res["chunk_scores"])):
+            chunk_id = f"{checksum[:24]}:{idx}"
+            records[chunk_id] = _record(txt)
+            chunk_rows.append(
+                ChunkRow(
+                    doc_uid=checksum[:24],
+                    chunk_id=chunk_id,
+                    idx=idx,
+                    offset_start=s,
+                    offset_end=e,
+                    lang="und",
+                    nsfw_score=sc["nsfw"],
+                    toxicity_score=sc["toxicity"],
+                    illicit_score=sc["illicit"],
+                    pii_score=sc["pii"],
+                    zone=zone_name,
+                    segment=-1,  # filled in once appended
+                    offset=-1,
+                    length=-1,
                 )
+            )
+    return doc, chunk_rows, meta["manifest"], records
+
+
+def _reusable(
+    catalog: Path, discovered: List[Tuple[Path, os.stat_result]]
+) -> Tuple[pd.DataFrame | None, pd.DataFrame | None, pd.DataFrame | None, List[Path]]:
+    """Split discovered files into ones the existing catalog already covers and ones to mine.
+
+    A file is unchanged if the manifest has the same path with the same size and mtime,
+    or (for renames) the same device, inode, size and mtime. Returns the reused docs,
+    chunks and manifest rows (under their current paths) and the paths still to mine.
+    """
+    paths = [catalog / f for f in ("manifest.parquet", "docs.parquet", "chunks.parquet")]
+    if not all(p.exists() for p in paths):
+        return None, None, None, [p for p, _ in discovered]
+    manifest, docs, chunks = (pd.read_parquet(p) for p in paths)
+    docs = docs.drop_duplicates("source_path").set_index("source_path", drop=False)
+    manifest = manifest[manifest.source_path.isin(docs.index)]
+    by_path = {r.source_path: r for r in manifest.itertuples(index=False)}
+    by_inode = {(r.dev, r.inode, r.size, r.mtime_ns): r for r in manifest.itertuples(index=False)}
+
+    reused, todo = [], []
+    for p, st in discovered:
+        r = by_path.get(str(p))
+        if r is None or (r.size, r.mtime_ns) != (st.st_size, st.st_mtime_ns):
+            r = by_inode.get((st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns))
+        if r is None:
+            todo.append(p)
+        else:
+            reused.append((p, st, r))
+    if not reused:
+        return None, None, None, todo
+
+    kept = docs.loc[[r.source_path for _, _, r in reused]].reset_index(drop=True)
+    # path-derived fields follow renames
+    kept["source_path"] = [str(p) for p, _, _ in reused]
+    kept["title"] = [p.name for p, _, _ in reused]
+    kept["mime"] = [
+        mimetypes.guess_type(str(p))[0] or "application/octet-stream" for p, _, _ in reused
+    ]
+    kept["created_ts"] = [
+        time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(st.st_ctime)) for _, st, _ in reused
+    ]
+    kept_manifest = pd.DataFrame([r._asdict() for _, _, r in reused], columns=MANIFEST_COLUMNS)
+    kept_manifest["source_path"] = kept["source_path"]
+    # one copy of a doc's chunks per doc row, as a full run would produce
+    kept_chunks = kept[["doc_uid"]].merge(chunks.drop_duplicates("chunk_id"), on="doc_uid")
+    return kept, kept_chunks, kept_manifest, todo
+
+
+class _CardStats:
+    """Running aggregates over the doc rows, for the dataset card."""
+
+    def __init__(self):
+        self.quarantined = self.clean = 0
+        self.pii = self.nsfw = self.toxic = False
+
+    def add(self, doc: DocRow):
+        if doc.quarantine:
+            self.quarantined += 1
+        else:
+            self.clean += 1
+        self.pii = self.pii or doc.pii_score > 0
+        self.nsfw = self.nsfw or doc.nsfw_score > 0
+        self.toxic = self.toxic or doc.toxicity_score > 0
+
+    def add_frame(self, docs: pd.DataFrame):
+        q = int(docs.quarantine.astype(bool).sum())
+        self.quarantined += q
+        self.clean += len(docs) - q
+        self.pii = self.pii or bool((docs.pii_score > 0).any())
+        self.nsfw = self.nsfw or bool((docs.nsfw_score > 0).any())
+        self.toxic = self.toxic or bool((docs.toxicity_score > 0).any())
+
+
+def mine_dataset(
+    input_dir: Path,
+    root: Path,
+    dataset_id: str,
+    workers: int = 1,
+    io_threads: int | None = None,
+    queue_depth: int | None = None,
+    incremental: bool = False,
+):
+    """Mine every file under `input_dir` into the zones and catalog under `root`.
+
+    With `workers` > 1 files flow through a pipeline: a thread pool reads, hashes and
+    copies them to bronze, a process pool decodes, chunks and scores them, and the
+    thread pool compresses the zone records. Stages are joined by bounded windows of
+    `queue_depth` files and results are consumed in discovery order, so the catalog
+    is identical to a serial run.
+
+    Normalized docs and chunks are appended to per-zone pack stores (<zone>/docs and
+    <zone>/chunks, keyed by the sha256 of the text); chunks.parquet records each chunk's
+    (zone, segment, offset, length) instead of its text, see `read_chunk_texts`.
+
+    Every run records (path, size, mtime, inode, sha256) per file in
+    catalog/manifest.parquet. With `incremental`, files the manifest shows unchanged
+    are not read again: their catalog rows are carried over and only new or changed
+    files are mined and added; rows of deleted files are dropped.
+
+    Catalog rows are streamed to Parquet a row group at a time as files complete and
+    the dataset card is built from running totals, so memory does not grow with the
+    size of the dataset. The tables are replaced only once the run finishes.
+    """
+    bronze = root / "bronze_raw"
+    catalog = root / "catalog"
+    for p in (bronze, catalog, catalog / "dataset_cards"):
+        p.mkdir(parents=True, exist_ok=True)
 
-    docs_df = pd.DataFrame([asdict(r) for r in docs_rows])
-    chunks_df = pd.DataFrame([asdict(r) for r in chunks_rows])
-    (catalog / "docs.parquet").unlink(missing_ok=True)
-    (catalog / "chunks.parquet").unlink(missing_ok=True)
-    docs_df.to_parquet(catalog / "docs.parquet", index=False)
-    chunks_df.to_parquet(catalog / "chunks.parquet", index=False)
+    kept_docs = kept_chunks = kept_manifest = None
+    if incremental:
+        kept_docs, kept_chunks, kept_manifest, all_files = _reusable(
+            catalog, list(_discover(input_dir))
+        )
+    else:
+        all_files = (p for p, _ in _discover(input_dir))
+    io_pool = cpu_pool = None
+    if workers > 1:
+        io_pool = ThreadPoolExecutor(io_threads or min(32, 4 * workers))
+        cpu_pool = ProcessPoolExecutor(workers)
+    depth = queue_depth or 4 * max(1, workers)
+    stats = _CardStats()
+    reused = mined = 0
+    with ExitStack() as stack:
+        stack.callback(
+            lambda: [pool.shutdown(cancel_futures=True) for pool in (io_pool, cpu_pool) if pool]
+        )
+        stores = {
+            z: (
+                stack.enter_context(PackStore(root / z / "docs")),
+                stack.enter_context(PackStore(root / z / "chunks")),
+            )
+            for z in ZONES
+        }
+        docs_out = stack.enter_context(TableWriter(catalog / "docs.parquet", DOCS_SCHEMA))
+        chunks_out = stack.enter_context(TableWriter(catalog / "chunks.parquet", CHUNKS_SCHEMA))
+        manifest_out = stack.enter_context(
+            TableWriter(catalog / "manifest.parquet", MANIFEST_SCHEMA)
+        )
+        if kept_docs is not None:
+            reused = len(kept_docs)
+            kept_docs["dataset_id"] = dataset_id
+            docs_out.write_frame(kept_docs)
+            chunks_out.write_frame(kept_chunks)
+            manifest_out.write_frame(kept_manifest)
+            stats.add_frame(kept_docs)
+
+        def ingest(path):
+            return _ingest_file(path, bronze)
+
+        def store(item):
+            return _store_doc(item, dataset_id)
+
+        metas = (m for m in _imap_ordered(io_pool, ingest, all_files, depth) if m is not None)
+        analyzed = _imap_ordered(cpu_pool, _analyze, metas, depth)
+        for doc, rows, entry, records in _imap_ordered(io_pool, store, analyzed, depth):
+            zone = "red_quarantine" if doc.quarantine else "silver_normalized"
+            doc_store, chunk_store = stores[zone]
+            if doc.checksum in records:
+                doc_store.append(*records[doc.checksum])
+            for row in rows:
+                row.segment, row.offset, row.length = chunk_store.append(*records[row.chunk_id])
+                chunks_out.write(row)
+            docs_out.write(doc)
+            manifest_out.write_dict(entry)
+            stats.add(doc)
+            mined += 1
+        n_docs, n_chunks = docs_out.rows, chunks_out.rows
 
     card = {
         "id": dataset_id,
         "source": str(input_dir),
         "scope": "personal+work_mixed",
         "license_summary": "mixed/unknown (default restricted)",
-        "pii": "present-high" if (docs_df.pii_score > 0).any() else "unknown",
-        "nsfw": "present" if (docs_df.nsfw_score > 0).any() else "unknown",
-        "toxic": "present" if (docs_df.toxicity_score > 0).any() else "unknown",
+        "pii": "present-high" if stats.pii else "unknown",
+        "nsfw": "present" if stats.nsfw else "unknown",
+        "toxic": "present" if stats.toxic else "unknown",
         "provenance_notes": "auto-mined; manual review advised",
         "routing": {
-            "quarantine_docs": int(docs_df.quarantine.sum()),
-            "clean_docs": int((~docs_df.quarantine).sum()),
+            "quarantine_docs": stats.quarantined,
+            "clean_docs": stats.clean,
         },
         "retention": {
             "review_by": time.strftime("%Y-%m-%d", time.gmtime(time.time() + 365 * 24 * 3600))
@@ -264,10 +506,10 @@ def mine_dataset(input_dir: Path, root: Path, dataset_id: str):
         "intended_use": ["discovery", "filter_training", "research"],
     }
     (catalog / "dataset_cards" / f"{dataset_id}.yaml").write_text(json.dumps(card, indent=2))
-    print(f"Mining complete. Docs: {len(docs_rows)} | Chunks: {len(chunks_rows)}")
-    print(
-        f"Quarantined: {int(docs_df.quarantine.sum())} | Clean: {int((~docs_df.quarantine).sum())}"
-    )
+    print(f"Mining complete. Docs: {n_docs} | Chunks: {n_chunks}")
+    if incremental:
+        print(f"Unchanged (not re-read): {reused} | Mined: {mined}")
+    print(f"Quarantined: {stats.quarantined} | Clean: {stats.clean}")
     print(f"Catalog: {catalog/'docs.parquet'}  {catalog/'chunks.parquet'}")
 
 
@@ -276,8 +518,41 @@ def main():
     ap.add_argument("--input", required=True, help="directory to mine (recursively)")
     ap.add_argument("--root", required=True, help="data root (contains bronze/…/catalog)")
     ap.add_argument("--dataset-id", required=True, help="id for dataset card + catalog")
+    ap.add_argument(
+        "--workers", type=int, default=1, help="CPU processes (>1 enables the pipeline)"
+    )
+    ap.add_argument("--io-threads", type=int, default=None, help="I/O threads (default 4x workers)")
+    ap.add_argument(
+        "--incremental",
+        action="store_true",
+        help="skip files unchanged since the last run (catalog/manifest.parquet)",
+    )
+    ap.add_argument(
+        "--index",
+        action="store_true",
+        help="update each zone's BM25 index (<zone>/bm25), and with --embeddings its vector "
+        "index (<zone>/ann)",
+    )
+    ap.add_argument(
+        "--embeddings",
+        default=None,
+        help="embeddings table (obj_type, obj_id, dim, store, row) of the catalog's chunks",
+    )
     args = ap.parse_args()
-    mine_dataset(Path(args.input), Path(args.root), args.dataset_id)
+    mine_dataset(
+        Path(args.input),
+        Path(args.root),
+        args.dataset_id,
+        workers=args.workers,
+        io_threads=args.io_threads,
+        incremental=args.incremental,
+    )
+    if args.index:
+        for zone in ZONES:
+            print(f"BM25 {zone}: {bm25.update_zone_index(Path(args.root), zone)}")
+            if args.embeddings:
+                stats = ann.update_zone_index(Path(args.root), zone, Path(args.embeddings))
+                print(f"ANN {zone}: {stats}")
 
 
 if __name__ == "__main__":
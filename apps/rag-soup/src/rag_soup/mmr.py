@@ -1,22 +1,73 @@
-def mmr_select(items, scores, k=10, lam=0.7, sim=None, cap_per_doc=2):
-    sim = sim or (lambda a, b: 0.0)
-    selected, selected_ids, per_doc = [], set(), {}
-    cand = sorted(items, key=lambda x: -scores[x.chunk_id])
-    while cand and len(selected) < k:
-        best = None
-        best_score = -1
-        for it in cand:
-            if per_doc.get(it.doc_uid, 0) >= cap_per_doc:
-                continue
-            rel = scores[it.chunk_id]
-            div = max(sim(it, s) for s in selected) if selected else 0.0
-            sc = lam * rel - (1 - lam) * div
-            if sc > best_score:
-                best, best_score = it, sc
-        if not best:
+import numpy as np
+
+
+def mmr_indices(rel, emb=None, k=10, lam=0.7, groups=None, cap_per_doc=2, sim_to=None):
+    """Maximal marginal relevance: indices of up to `k` candidates, in pick order.
+
+    `rel` holds one relevance score per candidate and `emb` their embeddings (rows);
+    similarity is the dot product, so pass unit vectors for cosine. A running max of
+    each candidate's similarity to the picks so far is kept and updated with one
+    matrix-vector product per pick, instead of re-scanning every pick each round.
+    `groups` (one doc id per candidate) caps picks at `cap_per_doc` per group.
+    Instead of `emb`, `sim_to(i, mask)` may return the similarities of the masked
+    candidates to candidate `i` (zeros elsewhere). Ties go to the candidate ranked
+    higher by `rel`, as in a stable descending sort.
+    """
+    rel = np.asarray(rel, dtype=np.float64)
+    if cap_per_doc <= 0 or not rel.size:
+        return []
+    order = np.argsort(-rel, kind="stable")
+    base = lam * rel[order]
+    similar = None  # similar(i, mask): similarities to candidate i, in `order`
+    if emb is not None:
+        emb = np.asarray(emb)[order]
+        if emb.dtype != np.float64:
+            emb = emb.astype(np.float32, copy=False)
+
+        def similar(i, mask):
+            return emb @ emb[i]
+
+    elif sim_to is not None:
+
+        def similar(i, mask):
+            return sim_to(order[i], order[mask], mask)
+
+    if groups is not None:
+        _, groups = np.unique(np.asarray(groups, dtype=object)[order], return_inverse=True)
+        counts = np.zeros(groups.max() + 1, dtype=np.int64)
+    avail = np.ones(rel.size, dtype=bool)
+    div = None
+    picked = []
+    while len(picked) < k:
+        sc = base if div is None else base - (1 - lam) * div
+        sc = np.where(avail, sc, -np.inf)
+        i = int(np.argmax(sc))
+        # the original loop started from a best score of -1 and only took strictly better ones
+        if not sc[i] > -1:
             break
-        selected.append(best)
-        selected_ids.add(best.chunk_id)
-        per_doc[best.doc_uid] = per_doc.get(best.doc_uid, 0) + 1
-        cand = [c for c in cand if c.chunk_id not in selected_ids]
-    return selected
+        picked.append(int(order[i]))
+        avail[i] = False
+        if groups is not None:
+            g = groups[i]
+            counts[g] += 1
+            if counts[g] >= cap_per_doc:
+                avail &= groups != g
+        if similar is not None and avail.any():
+            s = similar(i, avail)
+            div = s if div is None else np.maximum(div, s)
+    return picked
+
+
+def mmr_select(items, scores, k=10, lam=0.7, sim=None, cap_per_doc=2, embeddings=None):
+    rel = [scores[it.chunk_id] for it in items]
+    groups = [it.doc_uid for it in items]
+    sim_to = None
+    if embeddings is None and sim is not None:
+
+        def sim_to(i, idx, mask):
+            out = np.zeros(mask.size)
+            out[mask] = [sim(items[j], items[i]) for j in idx]
+            return out
+
+    picked = mmr_indices(rel, embeddings, k, lam, groups, cap_per_doc, sim_to)
+    return [items[i] for i in picked]
@@ -0,0 +1,165 @@
+"""Append-only packed record store: zstd-compressed records in segment files.
+
+Each zone keeps its chunks (and normalized docs) in a handful of large segment files
+instead of one small file per record. A record is addressed by (segment, offset,
+length), which is what the catalog stores; `index.tsv` maps record keys (the sha256
+of the record's text) to those addresses for lookups by key.
+"""
+
+import io
+import os
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Tuple
+
+import pyarrow as pa
+
+SEGMENT_BYTES = 256 << 20
+_HEADER = struct.Struct("<I")  # uncompressed length
+_CODEC = pa.Codec("zstd", compression_level=3)
+
+Location = Tuple[int, int, int]
+
+
+def encode_record(data: bytes | str) -> bytes:
+    """Compress one record into its on-disk form (header + zstd frame); thread-safe."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return _HEADER.pack(len(data)) + _CODEC.compress(data, asbytes=True)
+
+
+def decode_record(rec: bytes) -> bytes:
+    (n,) = _HEADER.unpack_from(rec)
+    return _CODEC.decompress(rec[_HEADER.size :], decompressed_size=n, asbytes=True)
+
+
+class PackStore:
+    """Append-only segments `seg-NNNNN.pack` plus `index.tsv` under `directory`.
+
+    Records are immutable and content-addressed by key, so `append` of a key that is
+    already stored returns the existing location. Appends are serialized with a lock;
+    reads use pread and can run from any thread.
+
+    A writer repairs what an interrupted run left behind: a torn index line, or record
+    bytes (or whole segments) past the last indexed record. With `read_only` the store
+    only parses the index and preads, so it can be opened while another process is
+    appending.
+    """
+
+    def __init__(
+        self, directory: Path, segment_bytes: int = SEGMENT_BYTES, read_only: bool = False
+    ):
+        self.dir = Path(directory)
+        self.read_only = read_only
+        if not read_only:
+            self.dir.mkdir(parents=True, exist_ok=True)
+        self.segment_bytes = segment_bytes
+        self.index: Dict[str, Location] = {}
+        self._lock = threading.Lock()
+        self._readers: Dict[int, int] = {}
+        self._out = self._index_out = None
+        ends: Dict[int, int] = {}
+        index_path = self.dir / "index.tsv"
+        if index_path.exists():
+            sizes: Dict[int, int] = {}
+            dropped = False
+            with index_path.open("r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 4 or not line.endswith("\n"):
+                        dropped = True  # torn (or still being written) last line
+                        continue
+                    key, seg, off, length = parts[0], int(parts[1]), int(parts[2]), int(parts[3])
+                    if seg not in sizes:
+                        p = self._seg_path(seg)
+                        sizes[seg] = p.stat().st_size if p.exists() else 0
+                    if off + length > sizes[seg]:
+                        dropped = True  # index line written, record bytes lost
+                        continue
+                    self.index[key] = (seg, off, length)
+                    ends[seg] = max(ends.get(seg, 0), off + length)
+            if dropped and not read_only:
+                self._rewrite_index(index_path)
+        self._seg = max(ends, default=0)
+        if read_only:
+            return
+        # drop any bytes past the last indexed record (an interrupted append), including
+        # whole segments that were rolled over to but never reached the index
+        for p in self.dir.glob("seg-*.pack"):
+            if int(p.stem[len("seg-") :]) > self._seg:
+                p.unlink()
+        seg_path = self._seg_path(self._seg)
+        if seg_path.exists() and seg_path.stat().st_size > ends.get(self._seg, 0):
+            os.truncate(seg_path, ends.get(self._seg, 0))
+        self._out = open(seg_path, "ab")
+        self._index_out = index_path.open("a", encoding="utf-8")
+
+    def _rewrite_index(self, index_path: Path):
+        tmp = index_path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for key, (seg, off, length) in self.index.items():
+                f.write(f"{key}\t{seg}\t{off}\t{length}\n")
+        os.replace(tmp, index_path)
+
+    def _seg_path(self, seg: int) -> Path:
+        return self.dir / f"seg-{seg:05d}.pack"
+
+    def append(self, key: str, record: bytes) -> Location:
+        """Store an `encode_record` result under `key`; returns (segment, offset, length)."""
+        if self.read_only:
+            raise io.UnsupportedOperation(f"{self.dir} is opened read-only")
+        with self._lock:
+            loc = self.index.get(key)
+            if loc is not None:
+                return loc
+            off = self._out.tell()
+            if off and off + len(record) > self.segment_bytes:
+                self._out.close()
+                self._seg += 1
+                self._out = open(self._seg_path(self._seg), "ab")
+                off = self._out.tell()
+            self._out.write(record)
+            loc = (self._seg, off, len(record))
+            self.index[key] = loc
+            self._index_out.write(f"{key}\t{loc[0]}\t{loc[1]}\t{loc[2]}\n")
+            return loc
+
+    def put(self, key: str, data: bytes | str) -> Location:
+        if key in self.index:
+            return self.index[key]
+        return self.append(key, encode_record(data))
+
+    def read(self, segment: int, offset: int, length: int) -> bytes:
+        if segment == self._seg and not self.read_only:
+            with self._lock:
+                self._out.flush()
+        fd = self._readers.get(segment)
+        if fd is None:
+            fd = self._readers.setdefault(segment, os.open(self._seg_path(segment), os.O_RDONLY))
+        return decode_record(os.pread(fd, length, offset))
+
+    def get(self, key: str) -> bytes:
+        return self.read(*self.index[key])
+
+    def flush(self):
+        if self.read_only:
+            return
+        with self._lock:
+            self._out.flush()
+            self._index_out.flush()
+
+    def close(self):
+        self.flush()
+        if not self.read_only:
+            self._out.close()
+            self._index_out.close()
+        for fd in self._readers.values():
+            os.close(fd)
+        self._readers.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
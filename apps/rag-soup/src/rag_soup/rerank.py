@@ -1,9 +1,20 @@
+import heapq
 import math
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+import numpy as np
+
 from .schemas import Chunk
 
+DEFAULT_WEIGHTS = {"cross": 1.2, "dense": 0.6, "bm25": 0.3, "auth": 0.2, "len": 0.1, "rec": 0.2}
+# feature columns of the batch reranker: item attribute -> default when missing (None or 0)
+FEATURES = {"dense_sim": 0.0, "bm25": 0.0, "authority": 0.0, "length": 0.0, "recency_days": 365.0}
+
 
 def combine_scores(item, cross: float, w=None) -> float:
-    w = w or {"cross": 1.2, "dense": 0.6, "bm25": 0.3, "auth": 0.2, "len": 0.1, "rec": 0.2}
+    w = w or DEFAULT_WEIGHTS
     dense = getattr(item, "dense_sim", 0.0) or 0.0
     bm25 = getattr(item, "bm25", 0.0) or 0.0
     auth = getattr(item, "authority", 0.0) or 0.0
@@ -18,3 +29,114 @@ def combine_scores(item, cross: float, w=None) -> float:
         - w["rec"] * recency
     )
     return 1 / (1 + math.exp(-raw))
+
+
+def feature_columns(items) -> Dict[str, np.ndarray]:
+    """`FEATURES` columns read off `items` the way `combine_scores` reads one item."""
+    return {
+        name: np.array([getattr(it, name, dflt) or dflt for it in items], dtype=np.float64)
+        for name, dflt in FEATURES.items()
+    }
+
+
+def _column(features, name, n):
+    dflt = FEATURES[name]
+    col = features.get(name)
+    if col is None:
+        return np.full(n, dflt)
+    col = np.asarray(col, dtype=np.float64)
+    # None, NaN and 0 all mean "missing", as `or` does in `combine_scores`
+    return np.where(np.isnan(col) | (col == 0), dflt, col)
+
+
+def cheap_raw(features: Dict[str, np.ndarray], n: int, w=None) -> np.ndarray:
+    """The logit of `combine_scores` without its cross-encoder term, for `n` candidates."""
+    w = w or DEFAULT_WEIGHTS
+    return (
+        w["dense"] * _column(features, "dense_sim", n)
+        + w["bm25"] * _column(features, "bm25", n)
+        + w["auth"] * _column(features, "authority", n)
+        - w["len"] * _column(features, "length", n)
+        - w["rec"] * (_column(features, "recency_days", n) / 30.0)
+    )
+
+
+def _sigmoid(raw):
+    with np.errstate(over="ignore"):
+        return 1 / (1 + np.exp(-raw))
+
+
+def combine_scores_batch(cross, features: Dict[str, np.ndarray], w=None) -> np.ndarray:
+    """`combine_scores` for a column of cross-encoder scores and the `FEATURES` columns."""
+    w = w or DEFAULT_WEIGHTS
+    cross = np.asarray(cross, dtype=np.float64)
+    return _sigmoid(w["cross"] * cross + cheap_raw(features, cross.size, w))
+
+
+@dataclass
+class Reranked:
+    indices: List[int]  # candidate positions, best first
+    scores: List[float]  # `combine_scores` of each
+    cross_scored: int  # candidates sent to the cross-encoder
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+
+
+def rerank_topk(
+    features: Dict[str, np.ndarray],
+    cross_fn: Callable[[np.ndarray], np.ndarray],
+    n: int,
+    k: int = 10,
+    w=None,
+    cross_max: float | None = None,
+    batch_size: int = 32,
+) -> Reranked:
+    """Top `k` of `n` candidates by `combine_scores`, keeping a size-k min-heap.
+
+    `cross_fn(idx)` returns the cross-encoder scores of the candidates at positions
+    `idx`. Candidates go to it `batch_size` at a time, best cheap features first.
+    With `cross_max` (the largest score `cross_fn` can return) a candidate whose
+    upper bound cannot beat the current k-th best is never cross-scored, and the
+    scan stops at the first such one. Ties go to the earlier candidate.
+    """
+    w = w or DEFAULT_WEIGHTS
+    if cross_max is not None and w["cross"] < 0:
+        raise ValueError("cross_max needs a non-negative cross weight")
+    timings = {}
+    t0 = time.perf_counter()
+    cheap = cheap_raw(features, n, w)
+    if cross_max is None:
+        bound, order = None, np.arange(n)
+    else:
+        bound = cheap + w["cross"] * cross_max
+        order = np.argsort(-bound, kind="stable")
+    t1 = time.perf_counter()
+    timings["features"] = (t1 - t0) * 1e3
+    cross_s = heap_s = 0.0
+    heap = []  # (raw, -index): the root is the current k-th best
+    scored = 0
+    for lo in range(0, n if k > 0 else 0, batch_size):
+        idx = order[lo : lo + batch_size]
+        if bound is not None and len(heap) == k:
+            # keep candidates whose bound reaches the k-th best; `order` sorts bounds
+            # descending, so once none is left nothing later can enter either
+            idx = idx[bound[idx] >= heap[0][0]]
+            if not idx.size:
+                break
+        t = time.perf_counter()
+        cross = np.asarray(cross_fn(idx), dtype=np.float64)
+        cross_s += time.perf_counter() - t
+        scored += idx.size
+        t = time.perf_counter()
+        raw = w["cross"] * cross + cheap[idx]
+        for r, i in zip(raw.tolist(), idx.tolist()):
+            if len(heap) < k:
+                heapq.heappush(heap, (r, -i))
+            elif (r, -i) > heap[0]:
+                heapq.heapreplace(heap, (r, -i))
+        heap_s += time.perf_counter() - t
+    best = sorted(heap, reverse=True)
+    timings["cross"] = cross_s * 1e3
+    timings["heap"] = heap_s * 1e3
+    timings["total"] = (time.perf_counter() - t0) * 1e3
+    raw = np.array([r for r, _ in best])
+    return Reranked([-i for _, i in best], _sigmoid(raw).tolist(), scored, timings)
@@ -1,16 +1,120 @@
-from typing import Dict
+import re
+from bisect import bisect_right
+from typing import Dict, Iterable, List
+
 from .schemas import Chunk
 
+# naive term lists (swap with ML classifiers later); terms match whole words, any case
+DEFAULT_TERMS: Dict[str, List[str]] = {
+    "nsfw": ["nude", "porn", "xxx", "explicit", "nsfw", "sexual", "fetish"],
+    "toxicity": ["idiot", "stupid", "hate", "kill", "slur"],
+    "illicit": ["how to make a bomb", "credit card dump", "exploit kit", "c2 server"],
+    "pii": [],
+}
+# raw regexes for categories that are not plain term lists
+DEFAULT_PATTERNS: Dict[str, List[str]] = {"pii": [r"\d{3}-\d{2}-\d{4}"]}
+CATEGORIES = ("nsfw", "toxicity", "illicit", "pii")
+
+_SEP = "\x00"  # joins batch texts; never part of a match
+
+
+def _trie_regex(terms: Iterable[str]) -> str:
+    """One alternation for a term list, factored by common prefixes.
+
+    `re` tries alternatives one after another, so a flat `a|b|c|...` over thousands of
+    terms costs a comparison per term at every position; the trie form branches on
+    the next character instead.
+    """
+    trie: Dict = {}
+    for t in terms:
+        node = trie
+        for ch in t:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        end = "" in node
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if end:
+            return body + "?" if len(alts) == 1 and len(alts[0]) == 1 else f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+
+class TermScanner:
+    """Counts matches per category with a single compiled pattern.
+
+    All term lists (and extra regexes) are compiled into one regex with a named group
+    per category, so each text is scanned once no matter how many categories or terms
+    there are. Matches do not overlap: a span is counted for the first category that
+    matches it.
+    """
+
+    def __init__(
+        self,
+        terms: Dict[str, Iterable[str]],
+        patterns: Dict[str, Iterable[str]] | None = None,
+    ):
+        patterns = patterns or {}
+        self.categories = list(dict.fromkeys([*terms, *patterns]))
+        groups = []
+        for cat in self.categories:
+            words = {t.lower() for t in terms.get(cat, ()) if t}
+            alts = ([_trie_regex(words)] if words else []) + list(patterns.get(cat, ()))
+            if alts:
+                groups.append(f"(?P<{cat}>{'|'.join(alts)})")
+        # (?!) never matches: keeps an empty configuration valid
+        body = "|".join(groups) or "(?!)"
+        self.regex = re.compile(rf"(?<!\w)(?:{body})(?!\w)", re.I)
+
+    def count(self, text: str) -> Dict[str, int]:
+        counts = dict.fromkeys(self.categories, 0)
+        for m in self.regex.finditer(text):
+            counts[m.lastgroup] += 1
+        return counts
+
+    def count_batch(self, texts: List[str]) -> List[Dict[str, int]]:
+        """`count` over many (typically small) texts in one pass over their concatenation."""
+        out = [dict.fromkeys(self.categories, 0) for _ in texts]
+        if not texts:
+            return out
+        starts, pos = [], 0
+        for t in texts:
+            starts.append(pos)
+            pos += len(t) + len(_SEP)
+        for m in self.regex.finditer(_SEP.join(texts)):
+            out[bisect_right(starts, m.start()) - 1][m.lastgroup] += 1
+        return out
+
+
+DEFAULT_SCANNER = TermScanner(DEFAULT_TERMS, DEFAULT_PATTERNS)
+
 
 class SafetyAdapter:
-    """Pluggable scoring + routing. Swap regex with ML later."""
+    """Pluggable scoring + routing. Swap the term scanner with ML later."""
 
-    def __init__(self, thresholds: Dict[str, float]):
+    def __init__(self, thresholds: Dict[str, float], scanner: TermScanner | None = None):
         self.t = thresholds
+        self.scanner = scanner or DEFAULT_SCANNER
+
+    @staticmethod
+    def _scores(counts: Dict[str, int]) -> Dict[str, float]:
+        scores = {k: 1.0 if counts.get(k) else 0.0 for k in CATEGORIES}
+        scores["conf"] = 0.5
+        return scores
 
     def score_text(self, txt: str) -> Dict[str, float]:
-        # default noop; see mine_dump for the simple regex impl
-        return {"nsfw": 0.0, "toxicity": 0.0, "illicit": 0.0, "pii": 0.0, "conf": 0.0}
+        return self._scores(self.scanner.count(txt))
+
+    def score_batch(self, texts: List[str]) -> List[Dict[str, float]]:
+        return [self._scores(c) for c in self.scanner.count_batch(texts)]
+
+    def score_chunks(self, chunks: List[Chunk]) -> List[Dict[str, float]]:
+        return self.score_batch([c.text for c in chunks])
 
     def route(self, doc_scores: Dict[str, float]) -> Dict[str, str | list]:
         reasons = []
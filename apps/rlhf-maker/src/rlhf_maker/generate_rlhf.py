@@ -1,5 +1,10 @@
 #!/usr/bin/env python3
-import json, re, argparse, os
+import json, re, argparse, os, hashlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
+from itertools import chain, islice
 from pathlib import Path
 from datetime import datetime, timezone
 
@@ -9,6 +14,11 @@ CORRECTION_RE = re.compile(
     re.IGNORECASE,
 )
 APOLOGY_RE = re.compile(r"\b(sorry|my bad|apologize)\b", re.IGNORECASE)
+ACK_RE = re.compile(r"\b(thanks|ok|great|got it)\b", re.IGNORECASE)
+WS_RE = re.compile(r"[ \t\r\n]*")
+OUTPUTS = ("sft", "dpo_pairs", "tool_traces")
+STATE_FILE = "state.json"
+STATE_VERSION = 1
 
 def to_iso(ts):
     try:
@@ -16,169 +26,247 @@ def to_iso(ts):
     except Exception:
         return None
 
-def extract_urls(obj, urls):
-    if isinstance(obj, dict):
-        for v in obj.values():
-            extract_urls(v, urls)
-    elif isinstance(obj, list):
-        for v in obj:
-            extract_urls(v, urls)
-    elif isinstance(obj, str):
-        urls.update(URL_RE.findall(obj))
+TEXT_TYPES = ("text", "multimodal_text", "tool_result", "code", "json", "user_editable_context")
+
+def extract_urls(obj, urls, skip=None):
+    """Add every URL found in any string under `obj` to `urls` (the `skip` object is not entered)."""
+    stack = [obj]
+    while stack:
+        o = stack.pop()
+        if isinstance(o, str):
+            if "://" in o:  # cheap prefilter; URL_RE needs a scheme
+                urls.update(URL_RE.findall(o))
+        elif isinstance(o, dict):
+            stack.extend(o.values())
+        elif isinstance(o, list) and o is not skip:
+            stack.extend(o)
 
 def extract_text_from_content(content):
+    """(text, part_types) of a message's content; see scan_node, which also collects assets and URLs."""
     if not isinstance(content, dict):
         return "", []
-    ct = content.get("content_type")
-    parts = content.get("parts", [])
-    texts, types = [], []
-    if ct in ("text", "multimodal_text", "tool_result", "code", "json", "user_editable_context"):
-        for p in parts:
-            if isinstance(p, dict):
-                pt = p.get("content_type")
-                types.append(pt or "dict")
-                if "text" in p:
-                    texts.append(str(p["text"]))
-            elif isinstance(p, str):
-                texts.append(p); types.append("str")
-    return "\n".join(t for t in texts if t is not None).strip(), types
+    text, types, _, _ = scan_node({}, content, urls=False)
+    return text, types
+
+def part_assets(p, assets):
+    ct = p.get("content_type")
+    if ct and ct.endswith("_asset_pointer"):
+        assets.append({
+            "content_type": ct,
+            "format": p.get("format"),
+            "size_bytes": p.get("size_bytes"),
+            "asset_pointer": p.get("asset_pointer"),
+        })
+    if ct == "real_time_user_audio_video_asset_pointer":
+        ap = p.get("audio_asset_pointer") or {}
+        if ap.get("asset_pointer"):
+            assets.append({
+                "content_type": "audio_asset_pointer",
+                "format": ap.get("format"),
+                "size_bytes": ap.get("size_bytes"),
+                "asset_pointer": ap.get("asset_pointer"),
+            })
 
 def extract_assets(parts):
     assets = []
     for p in parts or []:
         if isinstance(p, dict):
-            ct = p.get("content_type")
-            if ct and ct.endswith("_asset_pointer"):
-                assets.append({
-                    "content_type": ct,
-                    "format": p.get("format"),
-                    "size_bytes": p.get("size_bytes"),
-                    "asset_pointer": p.get("asset_pointer"),
-                })
-            if ct == "real_time_user_audio_video_asset_pointer":
-                ap = p.get("audio_asset_pointer") or {}
-                if ap.get("asset_pointer"):
-                    assets.append({
-                        "content_type": "audio_asset_pointer",
-                        "format": ap.get("format"),
-                        "size_bytes": ap.get("size_bytes"),
-                        "asset_pointer": ap.get("asset_pointer"),
-                    })
+            part_assets(p, assets)
     return assets
 
-def sort_children(mapping, ids):
-    def key(cid):
-        msg = (mapping.get(cid) or {}).get("message") or {}
-        ts = msg.get("create_time")
-        try:
-            return (float(ts), cid)
-        except Exception:
-            return (1e300, cid)
-    return sorted(ids, key=key)
-
-def walk_conv(conv):
-    """Return ordered list of nodes (seq order) with normalized fields."""
+def scan_node(node, content, urls=True):
+    """
+    One pass over a node's payload collecting (text, part_types, assets, urls).
+    Content parts are visited once for text, assets and URLs together; the rest of
+    the message is only walked for URLs, and not at all when `urls` is False. The
+    tree bookkeeping (id/parent/children) holds node ids only and is not scanned.
+    """
+    parts = content.get("parts") if isinstance(content, dict) else None
+    if not isinstance(parts, list):
+        parts = None
+    found = set()
+    if urls:
+        extract_urls(node.get("message"), found, skip=parts)
+    want_text = isinstance(content, dict) and content.get("content_type") in TEXT_TYPES
+    texts, types, assets = [], [], []
+    for p in parts or []:
+        if isinstance(p, dict):
+            if want_text:
+                types.append(p.get("content_type") or "dict")
+                if "text" in p:
+                    texts.append(str(p["text"]))
+            part_assets(p, assets)
+            if urls:
+                extract_urls(p, found)
+        elif isinstance(p, str):
+            if want_text:
+                texts.append(p)
+                types.append("str")
+            if urls and "://" in p:
+                found.update(URL_RE.findall(p))
+        elif urls:
+            extract_urls(p, found)
+    return "\n".join(texts).strip(), types, assets, sorted(found)
+
+def parse_ts(ts):
+    try:
+        return float(ts)
+    except Exception:
+        return None
+
+def node_row(nid, node, depth, ts=None, urls=True):
+    """Normalize one mapping node into an `ordered` row (`ts` is its parsed create_time)."""
+    msg = node.get("message") or {}
+    author = msg.get("author") or {}
+    role = author.get("role")
+    author_name = author.get("name")
+    recipient = msg.get("recipient")
+    content = msg.get("content") or {}
+    text, part_types, assets, urls = scan_node(node, content, urls)
+
+    tool_call = (role == "assistant" and recipient not in (None, "all"))
+    tool_result = (role == "tool")
+    tool_name = None
+    if tool_call:
+        tool_name = recipient
+    elif tool_result and author_name:
+        tool_name = author_name
+
+    return {
+        "node_id": nid,
+        "parent_id": node.get("parent"),
+        "depth": depth,
+        "role": role,
+        "author_name": author_name,
+        "recipient": recipient,
+        "tool_call": tool_call,
+        "tool_result": tool_result,
+        "tool_name": tool_name,
+        "type": content.get("content_type"),
+        "part_types": part_types,
+        "text": text,
+        "assets": assets,
+        "urls": urls,
+        "create_time": msg.get("create_time"),
+        "create_time_iso": None if ts is None else to_iso(ts),
+        "status": msg.get("status"),
+        "end_turn": msg.get("end_turn"),
+        "raw_content": content,  # keep full for tools
+    }
+
+def walk_conv(conv, urls=True):
+    """
+    Return ordered list of nodes (seq order) with normalized fields.
+    Depth-first with an explicit stack, so arbitrarily deep trees are fine; each
+    node's create_time is parsed once and each child list is sorted once.
+    """
     mapping = conv.get("mapping", {})
     if not mapping:
         return []
 
+    times = {nid: parse_ts(((node or {}).get("message") or {}).get("create_time"))
+             for nid, node in mapping.items()}
+
+    def key(nid):
+        ts = times.get(nid)
+        return (1e300 if ts is None else ts, nid)
+
     roots = [nid for nid, node in mapping.items() if node.get("parent") is None]
     visited, ordered = set(), []
-
-    def walk(nid, depth):
-        if nid in visited: return
+    # children are pushed in reverse so they pop in create_time order
+    stack = [(r, 0) for r in sorted(roots, key=key, reverse=True)]
+    while stack:
+        nid, depth = stack.pop()
+        if nid in visited:
+            continue
         visited.add(nid)
         node = mapping.get(nid, {}) or {}
-        msg = node.get("message") or {}
-        author = msg.get("author") or {}
-        role = author.get("role")
-        author_name = author.get("name")
-        recipient = msg.get("recipient")
-        content = msg.get("content") or {}
-        text, part_types = extract_text_from_content(content)
-        assets = extract_assets(content.get("parts", []))
-        urls = set(); extract_urls(node, urls)
-
-        tool_call = (role == "assistant" and recipient not in (None, "all"))
-        tool_result = (role == "tool")
-        tool_name = None
-        if tool_call:
-            tool_name = recipient
-        elif tool_result and author_name:
-            tool_name = author_name
-
-        ordered.append({
-            "node_id": nid,
-            "parent_id": node.get("parent"),
-            "depth": depth,
-            "role": role,
-            "author_name": author_name,
-            "recipient": recipient,
-            "tool_call": tool_call,
-            "tool_result": tool_result,
-            "tool_name": tool_name,
-            "type": content.get("content_type"),
-            "part_types": part_types,
-            "text": text,
-            "assets": assets,
-            "urls": sorted(urls),
-            "create_time": msg.get("create_time"),
-            "create_time_iso": to_iso(msg.get("create_time")),
-            "status": msg.get("status"),
-            "end_turn": msg.get("end_turn"),
-            "raw_content": content,  # keep full for tools
-        })
-        for cid in sort_children(mapping, node.get("children") or []):
-            walk(cid, depth + 1)
-
-    for r in sort_children(mapping, roots):
-        walk(r, 0)
+        ordered.append(node_row(nid, node, depth, times.get(nid), urls))
+        children = node.get("children")
+        if children:
+            stack.extend((cid, depth + 1) for cid in sorted(children, key=key, reverse=True))
 
     # add seq
     for i, r in enumerate(ordered):
         r["seq"] = i
     return ordered
 
-def make_segments(ordered, max_exchanges=3):
+def msg_tokens(r):
+    """Rough token count of a row: whitespace-separated words of its text, at least 1."""
+    return max(1, len((r.get("text") or "").split()))
+
+def segment_ranges(ordered, max_exchanges=3, max_tokens=None, stride=0):
     """
-    Build SFT segments of up to `max_exchanges` (user->assistant pairs),
-    keeping tools in-between as messages.
+    Yield (start, end) index ranges of SFT segments: from a user anchor, up to
+    `max_exchanges` user->assistant exchanges (tools in-between included) and, if set,
+    no more than `max_tokens` (msg_tokens) in total. By default (stride=0) each segment
+    starts at the first anchor after the previous one ends, so segments never overlap;
+    stride=N > 0 starts one at every Nth user anchor instead (stride=1: every anchor,
+    so consecutive segments share all but one exchange).
     """
+    n = len(ordered)
+    tok = None
+    if max_tokens:
+        tok = [0] * (n + 1)
+        for i, r in enumerate(ordered):
+            tok[i + 1] = tok[i] + msg_tokens(r)
     # collect indices where user speaks (anchors)
     user_idxs = [i for i, r in enumerate(ordered) if r["role"] == "user"]
-    segments = []
-    for ui in user_idxs:
+    next_start = 0
+    for a, ui in enumerate(user_idxs):
+        if (stride and a % stride) or (not stride and ui < next_start):
+            continue
         # consume up to N exchanges from here
-        msgs = []
         exchanges = 0
-        # include context above if you want longer windows; here we start at ui
         i = ui
-        while i < len(ordered) and exchanges < max_exchanges:
+        while i < n and exchanges < max_exchanges:
+            if tok is not None and tok[i + 1] - tok[ui] > max_tokens:
+                break
             r = ordered[i]
-            msgs.append(r)
             if r["role"] == "assistant" and r.get("end_turn") in (True, None):
                 exchanges += 1
             i += 1
-        if len(msgs) >= 2:
-            segments.append(msgs)
-    return segments
+        next_start = i
+        if i - ui >= 2:
+            yield ui, i
+
+def make_segments(ordered, max_exchanges=3, max_tokens=None, stride=0):
+    """
+    Build SFT segments of up to `max_exchanges` (user->assistant pairs),
+    keeping tools in-between as messages. See segment_ranges for the other knobs.
+    """
+    return [ordered[s:e] for s, e in segment_ranges(ordered, max_exchanges, max_tokens, stride)]
+
+def to_chat_message(r):
+    """Chat-format message for an `ordered` row, or None for roles we ignore."""
+    if r["tool_call"]:
+        return {"role":"assistant", "tool_call":{
+            "name": r.get("tool_name") or (r.get("recipient") or "tool"),
+            "arguments": r.get("raw_content")  # raw content JSON as args
+        }}
+    if r["tool_result"]:
+        return {"role":"tool", "name": r.get("tool_name") or "tool",
+                "content": r.get("raw_content")}
+    if r["role"] in ("system","user","assistant"):
+        return {"role": r["role"], "content": r.get("text") or ""}
+    return None  # ignore other roles silently
+
+def chat_index(ordered):
+    """
+    Chat messages of a whole conversation plus `before`, where before[t] is how many
+    come from rows < t, so rows [s, e) map to chat[before[s]:before[e]].
+    """
+    chat, before = [], [0] * (len(ordered) + 1)
+    for t, r in enumerate(ordered):
+        m = to_chat_message(r)
+        if m is not None:
+            chat.append(m)
+        before[t + 1] = len(chat)
+    return chat, before
 
 def msgs_to_sft(messages, conv_id=None):
-    out = []
-    for r in messages:
-        if r["tool_call"]:
-            out.append({"role":"assistant", "tool_call":{
-                "name": r.get("tool_name") or (r.get("recipient") or "tool"),
-                "arguments": r.get("raw_content")  # raw content JSON as args
-            }})
-        elif r["tool_result"]:
-            out.append({"role":"tool", "name": r.get("tool_name") or "tool",
-                        "content": r.get("raw_content")})
-        else:
-            if r["role"] in ("system","user","assistant"):
-                content = r["text"] or ""
-                out.append({"role": r["role"], "content": content})
-            # ignore other roles silently
+    """One SFT row for a segment of `ordered` rows (conv_rows builds these in bulk)."""
+    out = [m for m in map(to_chat_message, messages) if m is not None]
     return {
         "messages": out,
         "meta": {
@@ -189,118 +277,395 @@ def msgs_to_sft(messages, conv_id=None):
         }
     }
 
-def make_pairs(ordered, lookahead=6):
+def make_pairs(ordered, lookahead=6, context=6, chat=None):
     """
     Produce (prompt, rejected, chosen) triples using simple heuristics:
     - If a user correction follows an assistant, pair the assistant reply (rejected)
       with the *next* assistant reply after that correction (chosen).
     - If an assistant apologizes and then produces a new answer, first is rejected, second is chosen.
+
+    Every message is classified once and next-hit indexes are built right to left, so
+    each assistant turn is resolved in O(1); prompts are slices of one shared list of
+    chat messages (the same dicts are reused across pairs). Pass a precomputed
+    chat_index(ordered) as `chat` to share it with other outputs.
     """
-    pairs = []
     n = len(ordered)
-    for i, r in enumerate(ordered):
-        # assistant -> user correction
-        if r["role"] == "assistant" and (r.get("text") or ""):
-            # find next few turns
-            j_end = min(n, i + 1 + lookahead)
-            # look for immediate user correction
-            corr_j = None
-            for j in range(i+1, j_end):
-                if ordered[j]["role"] == "user":
-                    txt = (ordered[j].get("text") or "").strip()
-                    if CORRECTION_RE.search(txt):
-                        corr_j = j; break
-                    # if user says "ok/thanks", likely NOT a correction
-                    if re.search(r"\b(thanks|ok|great|got it)\b", txt, re.I):
-                        break
-            if corr_j is not None:
-                # find the next assistant after the correction
-                chosen_k = None
-                for k in range(corr_j+1, j_end):
-                    if ordered[k]["role"] == "assistant" and (ordered[k].get("text") or ""):
-                        chosen_k = k; break
-                if chosen_k is not None:
-                    # prompt is context up to correction's user message
-                    ctx = []
-                    for t in range(max(0, i-6), corr_j+1):
-                        rr = ordered[t]
-                        # include plain roles + tools if you want tool-aware RM
-                        if rr["tool_call"]:
-                            ctx.append({"role":"assistant","tool_call":{
-                                "name": rr.get("tool_name") or (rr.get("recipient") or "tool"),
-                                "arguments": rr.get("raw_content")
-                            }})
-                        elif rr["tool_result"]:
-                            ctx.append({"role":"tool","name": rr.get("tool_name") or "tool",
-                                        "content": rr.get("raw_content")})
-                        elif rr["role"] in ("system","user","assistant"):
-                            ctx.append({"role": rr["role"], "content": rr.get("text") or ""})
-                    pairs.append({
-                        "prompt_messages": ctx,
-                        "rejected": ordered[i]["text"],
-                        "chosen": ordered[chosen_k]["text"],
-                        "signals": {"user_correction": True},
-                        "meta": {"rejected_seq": i, "chosen_seq": chosen_k}
-                    })
-            # assistant apology -> next assistant
-            txta = (r.get("text") or "")
-            if APOLOGY_RE.search(txta):
-                next_ass = None
-                for k in range(i+1, j_end):
-                    if ordered[k]["role"] == "assistant" and (ordered[k].get("text") or ""):
-                        next_ass = k; break
-                if next_ass is not None:
-                    ctx = []
-                    # prompt is context up to the *previous* user message
-                    up_to = i
-                    for t in range(max(0, i-6), up_to+1):
-                        rr = ordered[t]
-                        if rr["tool_call"]:
-                            ctx.append({"role":"assistant","tool_call":{
-                                "name": rr.get("tool_name") or (rr.get("recipient") or "tool"),
-                                "arguments": rr.get("raw_content")
-                            }})
-                        elif rr["tool_result"]:
-                            ctx.append({"role":"tool","name": rr.get("tool_name") or "tool",
-                                        "content": rr.get("raw_content")})
-                        elif rr["role"] in ("system","user","assistant"):
-                            ctx.append({"role": rr["role"], "content": rr.get("text") or ""})
-                    pairs.append({
-                        "prompt_messages": ctx,
-                        "rejected": r["text"],
-                        "chosen": ordered[next_ass]["text"],
-                        "signals": {"apology_followup": True},
-                        "meta": {"rejected_seq": i, "chosen_seq": next_ass}
-                    })
+    # next_user[j]: first user turn >= j that is a correction or an ack ("ok/thanks"),
+    # which ends the search for a correction; is_corr tells which one it was.
+    # next_reply[j]: first assistant turn >= j with text.
+    next_user, next_reply = [n] * (n + 1), [n] * (n + 1)
+    is_corr = [False] * n
+    for j in range(n - 1, -1, -1):
+        r = ordered[j]
+        next_user[j], next_reply[j] = next_user[j + 1], next_reply[j + 1]
+        if r["role"] == "user":
+            txt = (r.get("text") or "").strip()
+            if CORRECTION_RE.search(txt):
+                is_corr[j] = True
+                next_user[j] = j
+            elif ACK_RE.search(txt):
+                next_user[j] = j
+        elif r["role"] == "assistant" and (r.get("text") or ""):
+            next_reply[j] = j
+
+    chat, before = chat or chat_index(ordered)
+
+    def prompt(lo, hi):
+        return chat[before[max(0, lo)]:before[hi + 1]]
+
+    pairs = []
+    for i in range(n):
+        if next_reply[i] != i:  # assistant turns with text only
+            continue
+        r = ordered[i]
+        j_end = min(n, i + 1 + lookahead)
+        # assistant -> user correction -> next assistant
+        corr_j = next_user[i + 1]
+        if corr_j < j_end and is_corr[corr_j]:
+            chosen_k = next_reply[corr_j + 1]
+            if chosen_k < j_end:
+                # prompt is context up to correction's user message
+                pairs.append({
+                    "prompt_messages": prompt(i - context, corr_j),
+                    "rejected": r["text"],
+                    "chosen": ordered[chosen_k]["text"],
+                    "signals": {"user_correction": True},
+                    "meta": {"rejected_seq": i, "chosen_seq": chosen_k}
+                })
+        # assistant apology -> next assistant
+        if APOLOGY_RE.search(r["text"]):
+            next_ass = next_reply[i + 1]
+            if next_ass < j_end:
+                pairs.append({
+                    "prompt_messages": prompt(i - context, i),
+                    "rejected": r["text"],
+                    "chosen": ordered[next_ass]["text"],
+                    "signals": {"apology_followup": True},
+                    "meta": {"rejected_seq": i, "chosen_seq": next_ass}
+                })
     return pairs
 
+def write_rows(f, rows):
+    for r in rows:
+        f.write(json.dumps(r, ensure_ascii=False) + "\n")
+
 def write_jsonl(path, rows):
     path.parent.mkdir(parents=True, exist_ok=True)
     with path.open("w", encoding="utf-8") as f:
-        for r in rows:
-            f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        write_rows(f, rows)
+
+def iter_json_array(f, bufsize=1 << 20):
+    """
+    Yield the elements of a top-level JSON array one at a time from a text stream.
+    Only the element being decoded (plus one read buffer) is held in memory; when an
+    element spans the buffer the read size doubles, so large elements stay linear.
+    A top-level object is yielded as a single element.
+    """
+    dec = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def fill(n):
+        nonlocal buf, pos, eof
+        chunk = f.read(n)
+        eof = not chunk
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    def skip_ws():
+        nonlocal pos
+        pos = WS_RE.match(buf, pos).end()
+        while pos == len(buf) and not eof:
+            fill(bufsize)
+            pos = WS_RE.match(buf, pos).end()
+
+    skip_ws()
+    if pos == len(buf):
+        return
+    if buf[pos] != "[":
+        yield json.loads(buf[pos:] + f.read())
+        return
+    pos += 1
+    skip_ws()
+    if buf.startswith("]", pos):
+        return
+    while True:
+        want = bufsize
+        while True:
+            try:
+                obj, end = dec.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                end = None
+            # a scalar cut by the buffer edge can still decode ("-4." as -4, "tr" fails):
+            # only trust a value once the ',' or ']' after it is in the buffer
+            if end is not None:
+                nxt = WS_RE.match(buf, end).end()
+                if eof or (nxt < len(buf) and buf[nxt] in ",]"):
+                    break
+            if eof:
+                raise ValueError(f"truncated or invalid JSON array element at offset {pos}")
+            fill(want)
+            want *= 2
+        pos = end
+        yield obj
+        skip_ws()
+        if pos == len(buf):
+            raise ValueError("unterminated JSON array")
+        if buf[pos] == "]":
+            return
+        if buf[pos] != ",":
+            raise ValueError(f"expected ',' or ']' in JSON array, got {buf[pos]!r}")
+        pos += 1
+        skip_ws()
 
-def parse_dump(obj):
+def parse_dump(obj, urls=True):
     """Accept a single conversation dict or a list (export that contains one)."""
     convs = obj if isinstance(obj, list) else [obj]
     out = []
     for conv in convs:
         cid = conv.get("conversation_id") or conv.get("title")
-        ordered = walk_conv(conv)
+        ordered = walk_conv(conv, urls=urls)
         for r in ordered:
             r["conv_id"] = cid
         out.append((cid, ordered))
     return out
 
+def iter_convs(path, stream=False):
+    """
+    Yield every raw conversation dict in a dump file. With `stream` the top-level
+    array is decoded one conversation at a time instead of json.load.
+    """
+    with path.open("r", encoding="utf-8") as f:
+        if not stream:
+            obj = json.load(f)
+            yield from (obj if isinstance(obj, list) else [obj])
+            return
+        yield from iter_json_array(f)
+
+def conv_rows(conv_id, ordered, max_exchanges=3, max_tokens=None, stride=0):
+    """Return (sft, pairs, tools) rows mined from one walked conversation."""
+    chat, before = chat_index(ordered)
+    # SFT windows are index ranges over the shared chat list; nothing is re-converted
+    tools_upto = [0] * (len(ordered) + 1)
+    for t, r in enumerate(ordered):
+        tools_upto[t + 1] = tools_upto[t] + bool(r.get("tool_call") or r.get("tool_result"))
+    sft = [{
+        "messages": chat[before[s]:before[e]],
+        "meta": {
+            "conv_id": conv_id,
+            "start_seq": ordered[s]["seq"],
+            "end_seq": ordered[e - 1]["seq"],
+            "has_tools": tools_upto[e] > tools_upto[s],
+        }
+    } for s, e in segment_ranges(ordered, max_exchanges, max_tokens, stride)]
+    pairs = make_pairs(ordered, chat=(chat, before))
+    for pr in pairs:
+        pr["meta"]["conv_id"] = conv_id
+    tools = []
+    for r in ordered:
+        if r.get("tool_call") or r.get("tool_result"):
+            tools.append({
+                "conv_id": conv_id,
+                "seq": r["seq"],
+                "tool_name": r.get("tool_name") or (r.get("recipient") or "tool"),
+                "direction": "call" if r.get("tool_call") else "result",
+                "payload": r.get("raw_content"),
+                "text_preview": (r.get("text") or "")[:200],
+                "urls": r.get("urls", []),
+                "time": r.get("create_time_iso")
+            })
+    return sft, pairs, tools
+
+def mine_conv(conv, max_exchanges=3, urls=True, max_tokens=None, stride=0):
+    """Walk one raw conversation and return its (sft, pairs, tools) rows."""
+    [(conv_id, ordered)] = parse_dump(conv, urls=urls)
+    return conv_rows(conv_id, ordered, max_exchanges, max_tokens, stride)
+
+def mine_conv_jsonl(conv, max_exchanges=3, urls=True, max_tokens=None, stride=0):
+    """Like mine_conv, but each output is returned as (jsonl_bytes, n_rows) so pool
+    workers also do the encoding and ship back plain bytes."""
+    return [("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows).encode("utf-8"), len(rows))
+            for rows in mine_conv(conv, max_exchanges, urls, max_tokens, stride)]
+
+def mine_conv_parquet(conv, max_exchanges=3, urls=True, max_tokens=None, stride=0, raw=True):
+    """Like mine_conv, but rows are reshaped for the Parquet schemas (see parquet_out)."""
+    from rlhf_maker.parquet_out import flatten
+    return [[flatten(name, r, raw) for r in rows]
+            for name, rows in zip(OUTPUTS, mine_conv(conv, max_exchanges, urls, max_tokens, stride))]
+
+def _mine_job(job, max_exchanges=3, urls=True, max_tokens=None, stride=0, fmt="jsonl", raw=True):
+    cid, stamp, conv = job
+    if conv is None:
+        return cid, stamp, None
+    if fmt == "parquet":
+        return cid, stamp, mine_conv_parquet(conv, max_exchanges, urls, max_tokens, stride, raw)
+    return cid, stamp, mine_conv_jsonl(conv, max_exchanges, urls, max_tokens, stride)
+
+def conv_stamp(conv):
+    """Change marker for a conversation: its update_time, else a hash of its content."""
+    ut = conv.get("update_time")
+    if ut is not None:
+        return f"t:{ut}"
+    blob = json.dumps(conv, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return "h:" + hashlib.sha1(blob).hexdigest()
+
+def load_state(outdir, params):
+    """
+    Per-conversation entries {conv_id: {"stamp", <output>: [offset, length, rows]}}
+    from the previous run, or {} if it used other params or its outputs changed since.
+    """
+    try:
+        state = json.loads((outdir / STATE_FILE).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if state.get("version") != STATE_VERSION or state.get("params") != params:
+        return {}
+    sizes = state.get("sizes") or {}
+    for name in OUTPUTS:
+        p = outdir / f"{name}.jsonl"
+        if name not in sizes or not p.exists() or p.stat().st_size != sizes[name]:
+            return {}
+    return state.get("convs") or {}
+
+def imap_ordered(fn, items, workers=1, batch_size=16, window=None):
+    """
+    map(fn, items) spread over a process pool. Items are shipped in batches, results
+    come back in input order, and at most `window` batches are in flight so memory
+    stays bounded on streamed input.
+    """
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+    window = window or workers * 4
+    it = iter(items)
+    batches = iter(lambda: list(islice(it, batch_size)), [])
+    with ProcessPoolExecutor(workers) as ex:
+        pending = deque()
+        for batch in batches:
+            pending.append(ex.submit(_map_batch, fn, batch))
+            if len(pending) >= window:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def _map_batch(fn, batch):
+    return [fn(x) for x in batch]
+
+def generate(dump_paths, outdir, max_exchanges=3, stream=False, workers=1, urls=True, incremental=False,
+             fmt="jsonl", raw=True, max_tokens=None, stride=0):
+    """
+    Mine `dump_paths` into OUTPUTS under `outdir`; returns (row counts, reused convs).
+
+    With `incremental`, conversations whose conv_id and stamp match the previous
+    run's state file are not re-mined: their rows are copied from the old outputs by
+    byte range. Outputs are rebuilt in export order and swapped in atomically.
+
+    `fmt="parquet"` writes <name>.parquet files row group by row group instead of
+    JSONL; `raw=False` leaves out the raw_content/payload columns. `max_tokens` and
+    `stride` are the SFT segmenting knobs (see segment_ranges).
+    """
+    if fmt == "parquet" and incremental:
+        raise ValueError("incremental runs need the jsonl format")
+    ext = "parquet" if fmt == "parquet" else "jsonl"
+    outdir.mkdir(parents=True, exist_ok=True)
+    params = {"max_exchanges": max_exchanges, "urls": urls, "max_tokens": max_tokens, "stride": stride}
+    prev = load_state(outdir, params) if incremental else {}
+    state, seen, dups = {}, set(), set()
+
+    def jobs(convs):
+        for conv in convs:
+            cid = conv.get("conversation_id") or conv.get("title")
+            stamp = conv_stamp(conv) if incremental else None
+            old = prev.get(cid)
+            if cid in seen:
+                dups.add(cid)
+            reuse = old is not None and old["stamp"] == stamp and cid not in seen
+            seen.add(cid)
+            yield cid, stamp, None if reuse else conv
+
+    # rows go straight to disk as each conversation is mined
+    counts, reused = dict.fromkeys(OUTPUTS, 0), 0
+    with ExitStack() as stack:
+        olds = {name: stack.enter_context((outdir / f"{name}.jsonl").open("rb"))
+                for name in OUTPUTS} if prev else {}
+        if fmt == "parquet":
+            from rlhf_maker.parquet_out import ParquetSink
+            outs = {name: stack.enter_context(ParquetSink(outdir / f"{name}.parquet.tmp", name, raw=raw))
+                    for name in OUTPUTS}
+        else:
+            outs = {name: stack.enter_context((outdir / f"{name}.jsonl.tmp").open("wb"))
+                    for name in OUTPUTS}
+        convs = chain.from_iterable(iter_convs(p, stream=stream) for p in dump_paths)
+        mine = partial(_mine_job, max_exchanges=max_exchanges, urls=urls, max_tokens=max_tokens,
+                       stride=stride, fmt=fmt, raw=raw)
+        for cid, stamp, conv_out in imap_ordered(mine, jobs(convs), workers=workers):
+            if fmt == "parquet":
+                for name, rows in zip(OUTPUTS, conv_out):
+                    outs[name].write(rows)
+                    counts[name] += len(rows)
+                continue
+            entry = {"stamp": stamp}
+            for k, name in enumerate(OUTPUTS):
+                f = outs[name]
+                off = f.tell()
+                if conv_out is None:
+                    o_off, o_len, n = prev[cid][name]
+                    olds[name].seek(o_off)
+                    f.write(olds[name].read(o_len))
+                else:
+                    data, n = conv_out[k]
+                    f.write(data)
+                entry[name] = [off, f.tell() - off, n]
+                counts[name] += n
+            reused += conv_out is None
+            if incremental and cid is not None:
+                state[cid] = entry
+
+    for name in OUTPUTS:
+        os.replace(outdir / f"{name}.{ext}.tmp", outdir / f"{name}.{ext}")
+    state_path = outdir / STATE_FILE
+    if incremental:
+        for cid in dups:
+            state.pop(cid, None)
+        tmp = state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({
+            "version": STATE_VERSION,
+            "params": params,
+            "sizes": {name: (outdir / f"{name}.jsonl").stat().st_size for name in OUTPUTS},
+            "convs": state,
+        }), encoding="utf-8")
+        os.replace(tmp, state_path)
+    else:
+        state_path.unlink(missing_ok=True)
+    return counts, reused
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--input", "-i", required=True, help="Path to a single JSON export or a directory of dumps")
     ap.add_argument("--outdir", "-o", default="out_rlhf", help="Where to write datasets")
     ap.add_argument("--max-exchanges", type=int, default=3, help="SFT: number of user->assistant exchanges per sample")
+    ap.add_argument("--max-tokens", type=int, default=None,
+                    help="SFT: token budget per sample (whitespace words; no limit by default)")
+    ap.add_argument("--stride", type=int, default=1,
+                    help="SFT: start a sample at every Nth user turn (1 = overlapping samples); "
+                         "0 (default) = non-overlapping samples")
+    ap.add_argument("--stream", action="store_true",
+                    help="Decode exports one conversation at a time (memory bounded by the largest conversation)")
+    ap.add_argument("--workers", "-j", type=int, default=1,
+                    help="Mine conversations in a pool of N processes (output order is unchanged)")
+    ap.add_argument("--no-urls", dest="urls", action="store_false",
+                    help="Skip URL scanning; tool rows get an empty `urls` list")
+    ap.add_argument("--incremental", action="store_true",
+                    help=f"Only re-mine conversations that are new or changed since the last run ({STATE_FILE} in outdir)")
+    ap.add_argument("--format", dest="fmt", choices=("jsonl", "parquet"), default="jsonl",
+                    help="Output format; parquet needs pyarrow (pip install 'rlhf-maker[parquet]')")
+    ap.add_argument("--no-raw-content", dest="raw", action="store_false",
+                    help="parquet: leave out the raw_content / payload columns")
     args = ap.parse_args()
+    if args.fmt == "parquet" and args.incremental:
+        ap.error("--incremental only supports --format jsonl")
 
     inp = Path(args.input)
-    outdir = Path(args.outdir); outdir.mkdir(parents=True, exist_ok=True)
+    outdir = Path(args.outdir)
 
     dump_paths = []
     if inp.is_dir():
@@ -308,41 +673,12 @@ def main():
     else:
         dump_paths = [inp]
 
-    all_sft, all_pairs, all_tools = [], [], []
-
-    for p in dump_paths:
-        with p.open("r", encoding="utf-8") as f:
-            obj = json.load(f)
-        for conv_id, ordered in parse_dump(obj):
-            # SFT segments
-            segs = make_segments(ordered, max_exchanges=args.max_exchanges)
-            for seg in segs:
-                all_sft.append(msgs_to_sft(seg, conv_id=conv_id))
-            # Pairs
-            pairs = make_pairs(ordered)
-            for pr in pairs:
-                pr["meta"]["conv_id"] = conv_id
-            all_pairs.extend(pairs)
-            # Tools
-            for r in ordered:
-                if r.get("tool_call") or r.get("tool_result"):
-                    all_tools.append({
-                        "conv_id": conv_id,
-                        "seq": r["seq"],
-                        "tool_name": r.get("tool_name") or (r.get("recipient") or "tool"),
-                        "direction": "call" if r.get("tool_call") else "result",
-                        "payload": r.get("raw_content"),
-                        "text_preview": (r.get("text") or "")[:200],
-                        "urls": r.get("urls", []),
-                        "time": r.get("create_time_iso")
-                    })
-
-    # Write files
-    write_jsonl(outdir / "sft.jsonl", all_sft)
-    write_jsonl(outdir / "dpo_pairs.jsonl", all_pairs)
-    write_jsonl(outdir / "tool_traces.jsonl", all_tools)
-
-    print(f"Wrote: {len(all_sft)} SFT segments, {len(all_pairs)} pairs, {len(all_tools)} tool rows to {outdir}/")
+    counts, reused = generate(dump_paths, outdir, max_exchanges=args.max_exchanges, stream=args.stream,
+                              workers=args.workers, urls=args.urls, incremental=args.incremental,
+                              fmt=args.fmt, raw=args.raw, max_tokens=args.max_tokens, stride=args.stride)
+    print(f"Wrote: {counts['sft']} SFT segments, {counts['dpo_pairs']} pairs, {counts['tool_traces']} tool rows to {outdir}/")
+    if args.incremental:
+        print(f"Reused {reused} unchanged conversations from the previous run")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,138 @@
+"""Columnar (Parquet/Arrow) writers for the generate_rlhf outputs."""
+
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+ROW_GROUP_SIZE = 8192
+DICT = pa.dictionary(pa.int32(), pa.string())
+MESSAGE = pa.struct([("role", DICT), ("content", pa.string()), ("tool_name", DICT)])
+
+# raw_content payloads live in their own (optional) column so loaders can skip them
+SCHEMAS = {
+    "sft": pa.schema(
+        [
+            ("conv_id", pa.string()),
+            ("start_seq", pa.int64()),
+            ("end_seq", pa.int64()),
+            ("has_tools", pa.bool_()),
+            ("messages", pa.list_(MESSAGE)),
+            ("raw_content", pa.list_(pa.string())),
+        ]
+    ),
+    "dpo_pairs": pa.schema(
+        [
+            ("conv_id", pa.string()),
+            ("rejected_seq", pa.int64()),
+            ("chosen_seq", pa.int64()),
+            ("signal", DICT),
+            ("prompt_messages", pa.list_(MESSAGE)),
+            ("prompt_raw_content", pa.list_(pa.string())),
+            ("rejected", pa.string()),
+            ("chosen", pa.string()),
+        ]
+    ),
+    "tool_traces": pa.schema(
+        [
+            ("conv_id", pa.string()),
+            ("seq", pa.int64()),
+            ("tool_name", DICT),
+            ("direction", DICT),
+            ("text_preview", pa.string()),
+            ("urls", pa.list_(pa.string())),
+            ("time", pa.string()),
+            ("payload", pa.string()),
+        ]
+    ),
+}
+RAW_COLUMNS = {
+    "sft": "raw_content",
+    "dpo_pairs": "prompt_raw_content",
+    "tool_traces": "payload",
+}
+
+
+def schema(name, raw=True):
+    s = SCHEMAS[name]
+    return s if raw else s.remove(s.get_field_index(RAW_COLUMNS[name]))
+
+
+def _json(v):
+    return None if v is None else json.dumps(v, ensure_ascii=False)
+
+
+def _messages(msgs):
+    """Split chat messages into MESSAGE structs and their JSON-encoded raw payloads."""
+    out, raws = [], []
+    for m in msgs:
+        if "tool_call" in m:
+            tc = m["tool_call"]
+            out.append({"role": m["role"], "content": None, "tool_name": tc["name"]})
+            raws.append(_json(tc["arguments"]))
+        elif m["role"] == "tool":
+            out.append({"role": "tool", "content": None, "tool_name": m.get("name")})
+            raws.append(_json(m.get("content")))
+        else:
+            out.append({"role": m["role"], "content": m["content"], "tool_name": None})
+            raws.append(None)
+    return out, raws
+
+
+def flatten(name, row, raw=True):
+    """Reshape one JSONL-style output row to match `schema(name, raw)`."""
+    if name == "sft":
+        msgs, raws = _messages(row["messages"])
+        out = dict(row["meta"], messages=msgs)
+        if raw:
+            out["raw_content"] = raws
+    elif name == "dpo_pairs":
+        msgs, raws = _messages(row["prompt_messages"])
+        meta = row["meta"]
+        out = {
+            "conv_id": meta.get("conv_id"),
+            "rejected_seq": meta["rejected_seq"],
+            "chosen_seq": meta["chosen_seq"],
+            "signal": next(iter(row["signals"]), None),
+            "prompt_messages": msgs,
+            "rejected": row["rejected"],
+            "chosen": row["chosen"],
+        }
+        if raw:
+            out["prompt_raw_content"] = raws
+    else:
+        out = dict(row)
+        payload = out.pop("payload")
+        if raw:
+            out["payload"] = _json(payload)
+    return out
+
+
+class ParquetSink:
+    """Buffer flattened rows and write them to `path` one row group at a time."""
+
+    def __init__(self, path, name, raw=True, row_group_size=ROW_GROUP_SIZE):
+        self.schema = schema(name, raw)
+        self.row_group_size = row_group_size
+        self.buf = []
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows):
+        self.buf.extend(rows)
+        if len(self.buf) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if self.buf:
+            self.writer.write_table(pa.Table.from_pylist(self.buf, schema=self.schema))
+            self.buf = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
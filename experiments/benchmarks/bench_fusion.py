@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Time fusing --retrievers rankings of --depth docs for --queries queries: the
+per-query dict rrf / z_fuse against rag_soup.fusion.rrf_batch / z_fuse_batch.
+The dict versions run on the first --dict-queries queries only and are scaled up.
+
+    python experiments/benchmarks/bench_fusion.py --queries 100000 --retrievers 4 --depth 100
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+
+from rag_soup.fusion import Results, rrf, rrf_batch, z_fuse, z_fuse_batch
+
+
+def _results(rng, n_q, depth, pool, scores):
+    indptr = np.arange(n_q + 1, dtype=np.int64) * depth
+    # docs per query drawn from a shared pool, distinct within a query
+    docs = np.argsort(rng.random((n_q, pool)), axis=1)[:, :depth].ravel()
+    if scores:
+        values = -np.sort(-rng.random((n_q, depth)), axis=1).ravel()
+    else:
+        values = np.tile(np.arange(1, depth + 1, dtype=np.float64), n_q)
+    return Results(indptr, docs, values)
+
+
+def _dicts(results, q):
+    a, b = results.indptr[q], results.indptr[q + 1]
+    return dict(zip(results.docs[a:b].tolist(), results.values[a:b].tolist()))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--queries", type=int, default=100_000)
+    ap.add_argument("--retrievers", type=int, default=4)
+    ap.add_argument("--depth", type=int, default=100)
+    ap.add_argument("--pool", type=int, default=300)
+    ap.add_argument("--top-k", type=int, default=10)
+    ap.add_argument("--dict-queries", type=int, default=2_000)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    n_dict = min(args.dict_queries, args.queries)
+    for name, dict_fn, batch_fn, scores in (
+        ("rrf", rrf, rrf_batch, False),
+        ("z_fuse", z_fuse, z_fuse_batch, True),
+    ):
+        results = [
+            _results(rng, args.queries, args.depth, args.pool, scores)
+            for _ in range(args.retrievers)
+        ]
+        per_query = [[_dicts(r, q) for r in results] for q in range(n_dict)]
+        t0 = time.perf_counter()
+        want = [dict_fn(p)[: args.top_k] for p in per_query]
+        t_dict = (time.perf_counter() - t0) * args.queries / n_dict
+        t0 = time.perf_counter()
+        docs, fused = batch_fn(results, top_k=args.top_k)
+        t_batch = time.perf_counter() - t0
+        print(f"{name:7s} dict (est.) {t_dict:8.2f} s   batch {t_batch:8.2f} s")
+        for q, w in enumerate(want):
+            np.testing.assert_allclose(fused[q], [s for _, s in w], atol=1e-12)
+        del results, docs, fused
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Measure rag_soup.mine_dump's per-file cost on a synthetic corpus: the old path
+(read_bytes for the hash, then detect_encoding + read_text re-opening the file,
+and safety_scores run twice per chunk) against the single-read, single-score
+path. Reports wall time, bytes read (Linux /proc/self/io rchar) and the number
+of texts safety-scored.
+
+    python experiments/benchmarks/bench_mine_dump.py --files 2000 --kb 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from rag_soup import mine_dump
+
+WORDS = "data mining pipeline chunk zone bronze silver catalog parquet hello world idiot".split()
+
+
+def make_corpus(root: Path, files: int, kb: int, seed: int = 0) -> list[Path]:
+    rng = random.Random(seed)
+    paths = []
+    for i in range(files):
+        paras, size = [], 0
+        while size < kb * 1024:
+            para = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 200)))
+            paras.append(para)
+            size += len(para) + 2
+        p = root / f"d{i % 16}" / f"f{i}.txt"
+        p.parent.mkdir(parents=True, exist_ok=True)
+        p.write_text("\n\n".join(paras), encoding="utf-8")
+        paths.append(p)
+    return paths
+
+
+def rchar() -> int | None:
+    try:
+        for line in Path("/proc/self/io").read_text().splitlines():
+            if line.startswith("rchar:"):
+                return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class CountingScores:
+    """Counts texts scored through safety_scores and safety_scores_batch."""
+
+    def __init__(self):
+        self.calls = 0
+        self.fn = mine_dump.safety_scores
+        self.batch_fn = mine_dump.safety_scores_batch
+
+    def __call__(self, text):
+        self.calls += 1
+        return self.fn(text)
+
+    def batch(self, texts):
+        self.calls += len(texts)
+        return self.batch_fn(texts)
+
+
+def legacy(path: Path) -> None:
+    raw = path.read_bytes()
+    mine_dump.sha256_hex(raw)
+    enc = mine_dump.detect_encoding(path)  # second open
+    text = mine_dump.norm_text(
+        path.read_text(encoding=enc, errors="ignore")
+    )  # third read
+    chunks = mine_dump.chunk_paragraphs(text)
+    for _, _, txt in chunks:  # zone aggregation
+        mine_dump.safety_scores(txt)
+    for _, _, txt in chunks:  # ChunkRow scores
+        mine_dump.safety_scores(txt)
+
+
+def single_pass(path: Path) -> None:
+    raw = path.read_bytes()
+    mine_dump.sha256_hex(raw)
+    mine_dump.analyze_file(path, raw)
+
+
+def run(fn, paths: list[Path]) -> tuple[float, int | None, int]:
+    counter = CountingScores()
+    mine_dump.safety_scores, mine_dump.safety_scores_batch = counter, counter.batch
+    try:
+        r0, t0 = rchar(), time.perf_counter()
+        for p in paths:
+            fn(p)
+        dt, r1 = time.perf_counter() - t0, rchar()
+    finally:
+        mine_dump.safety_scores, mine_dump.safety_scores_batch = (
+            counter.fn,
+            counter.batch_fn,
+        )
+    return dt, None if r0 is None else r1 - r0, counter.calls
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    ap.add_argument("--files", type=int, default=500)
+    ap.add_argument("--kb", type=int, default=32, help="approximate size of each file")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = make_corpus(Path(tmp), args.files, args.kb)
+        total = sum(p.stat().st_size for p in paths)
+        print(f"corpus: {len(paths)} files, {total / 2**20:.1f} MiB")
+        print(f"{'path':<12} {'seconds':>8} {'MiB read':>9} {'score calls':>12}")
+        for name, fn in (("legacy", legacy), ("single-pass", single_pass)):
+            dt, nread, calls = run(fn, paths)
+            read_s = "n/a" if nread is None else f"{nread / 2**20:.1f}"
+            print(f"{name:<12} {dt:8.2f} {read_s:>9} {calls:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Time MMR diversification of --n candidates down to --k: the previous mmr_select
+loop (a Python sim callback per candidate per selected item per round) against
+rag_soup.mmr with the same callback and with an embedding matrix.
+
+    python experiments/benchmarks/bench_mmr.py --n 2000 --k 50 --dim 384
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+
+from rag_soup.mmr import mmr_indices, mmr_select
+from rag_soup.schemas import Chunk
+
+
+def legacy_mmr_select(items, scores, k=10, lam=0.7, sim=None, cap_per_doc=2):
+    sim = sim or (lambda a, b: 0.0)
+    selected, selected_ids, per_doc = [], set(), {}
+    cand = sorted(items, key=lambda x: -scores[x.chunk_id])
+    while cand and len(selected) < k:
+        best = None
+        best_score = -1
+        for it in cand:
+            if per_doc.get(it.doc_uid, 0) >= cap_per_doc:
+                continue
+            rel = scores[it.chunk_id]
+            div = max(sim(it, s) for s in selected) if selected else 0.0
+            sc = lam * rel - (1 - lam) * div
+            if sc > best_score:
+                best, best_score = it, sc
+        if not best:
+            break
+        selected.append(best)
+        selected_ids.add(best.chunk_id)
+        per_doc[best.doc_uid] = per_doc.get(best.doc_uid, 0) + 1
+        cand = [c for c in cand if c.chunk_id not in selected_ids]
+    return selected
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--n", type=int, default=2000)
+    ap.add_argument("--k", type=int, default=50)
+    ap.add_argument("--dim", type=int, default=384)
+    ap.add_argument("--docs", type=int, default=300)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    emb = rng.normal(size=(args.n, args.dim)).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    rel = rng.random(args.n)
+    items = [
+        Chunk(
+            doc_uid=f"d{i % args.docs}",
+            chunk_id=f"c{i}",
+            text="",
+            offset=(0, 0),
+            lang="en",
+        )
+        for i in range(args.n)
+    ]
+    scores = {it.chunk_id: float(r) for it, r in zip(items, rel)}
+    row = {it.chunk_id: i for i, it in enumerate(items)}
+
+    def sim(a, b):
+        return float(emb[row[a.chunk_id]] @ emb[row[b.chunk_id]])
+
+    runs = {
+        "legacy (callback)": lambda: legacy_mmr_select(items, scores, args.k, 0.7, sim),
+        "mmr_select (callback)": lambda: mmr_select(items, scores, args.k, 0.7, sim),
+        "mmr_select (embeddings)": lambda: mmr_select(
+            items, scores, args.k, 0.7, embeddings=emb
+        ),
+        "mmr_indices": lambda: mmr_indices(
+            rel, emb, args.k, 0.7, [it.doc_uid for it in items]
+        ),
+    }
+    picks = {}
+    for name, fn in runs.items():
+        t0 = time.perf_counter()
+        out = fn()
+        picks[name] = [x if isinstance(x, int) else row[x.chunk_id] for x in out]
+        print(f"{name:26s} {(time.perf_counter() - t0) * 1e3:10.1f} ms")
+    assert len({tuple(p) for p in picks.values()}) == 1, "strategies disagree"
+
+
+if __name__ == "__main__":
+    main()
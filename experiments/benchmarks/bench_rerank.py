@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Time reranking --n candidates to the top --k: combine_scores per item plus a full
+sort against rag_soup.rerank.rerank_topk, with and without the early cutoff. The
+cross-encoder is simulated at --cross-us microseconds per candidate.
+
+    python experiments/benchmarks/bench_rerank.py --n 5000 --k 20 --cross-us 200
+"""
+
+from __future__ import annotations
+
+import argparse
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from rag_soup.rerank import combine_scores, feature_columns, rerank_topk
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--n", type=int, default=5000)
+    ap.add_argument("--k", type=int, default=20)
+    ap.add_argument("--cross-us", type=float, default=200.0)
+    ap.add_argument("--batch-size", type=int, default=32)
+    args = ap.parse_args()
+
+    rng = np.random.default_rng(0)
+    items = [
+        SimpleNamespace(
+            dense_sim=float(rng.random()),
+            bm25=float(rng.random() * 10),
+            authority=float(rng.random()),
+            length=int(rng.integers(0, 3)),
+            recency_days=float(rng.integers(1, 900)),
+        )
+        for _ in range(args.n)
+    ]
+    cross = rng.random(args.n)
+
+    def cross_fn(idx):
+        time.sleep(len(idx) * args.cross_us * 1e-6)
+        return cross[idx]
+
+    t0 = time.perf_counter()
+    scores = [
+        combine_scores(it, c) for it, c in zip(items, cross_fn(np.arange(args.n)))
+    ]
+    legacy = sorted(range(args.n), key=lambda i: -scores[i])[: args.k]
+    print(
+        f"{'legacy':18s} {(time.perf_counter() - t0) * 1e3:10.1f} ms   cross {args.n}"
+    )
+
+    features = feature_columns(items)
+    for name, cross_max in (("rerank_topk", None), ("rerank_topk+cutoff", 1.0)):
+        t0 = time.perf_counter()
+        res = rerank_topk(
+            features, cross_fn, args.n, args.k, None, cross_max, args.batch_size
+        )
+        ms = (time.perf_counter() - t0) * 1e3
+        stages = "  ".join(f"{s} {v:.1f}" for s, v in res.timings_ms.items())
+        print(f"{name:18s} {ms:10.1f} ms   cross {res.cross_scored}   ({stages})")
+        assert res.indices == legacy, "rerankers disagree"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Compare safety scanning strategies on synthetic chunks: one flat regex per
+category (the old mine_dump approach) against rag_soup.safety_adapter's single
+trie-compiled pattern, per text and batched. Term lists are padded with random
+words to --terms entries per category.
+
+    python experiments/benchmarks/bench_safety_scan.py --terms 2000 --chunks 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import string
+import time
+
+from rag_soup.safety_adapter import DEFAULT_PATTERNS, DEFAULT_TERMS, TermScanner
+
+
+def rand_word(rng: random.Random) -> str:
+    return "".join(
+        rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10))
+    )
+
+
+def make_terms(n: int, rng: random.Random) -> dict[str, list[str]]:
+    terms = {}
+    for cat, base in DEFAULT_TERMS.items():
+        extra = [rand_word(rng) for _ in range(max(0, n - len(base)))] if base else []
+        terms[cat] = list(base) + extra
+    return terms
+
+
+def make_chunks(n: int, terms: dict[str, list[str]], rng: random.Random) -> list[str]:
+    vocab = [rand_word(rng) for _ in range(5000)]
+    hits = [t for ts in terms.values() for t in ts]
+    chunks = []
+    for _ in range(n):
+        words = [rng.choice(vocab) for _ in range(rng.randint(50, 400))]
+        if rng.random() < 0.2:
+            words.insert(rng.randrange(len(words)), rng.choice(hits))
+        chunks.append(" ".join(words))
+    return chunks
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    ap.add_argument("--terms", type=int, default=1000, help="terms per category")
+    ap.add_argument("--chunks", type=int, default=2000)
+    args = ap.parse_args()
+
+    rng = random.Random(0)
+    terms = make_terms(args.terms, rng)
+    chunks = make_chunks(args.chunks, terms, rng)
+
+    flat = {
+        cat: re.compile(
+            r"\b("
+            + "|".join([*map(re.escape, ts), *DEFAULT_PATTERNS.get(cat, [])])
+            + r")\b",
+            re.I,
+        )
+        for cat, ts in terms.items()
+    }
+    scanner = TermScanner(terms, DEFAULT_PATTERNS)
+
+    def per_category():
+        return [{c: len(p.findall(t)) for c, p in flat.items()} for t in chunks]
+
+    runs = (
+        ("regex per category", per_category),
+        ("combined, per text", lambda: [scanner.count(t) for t in chunks]),
+        ("combined, batch", lambda: scanner.count_batch(chunks)),
+    )
+    mib = sum(map(len, chunks)) / 2**20
+    print(f"{args.chunks} chunks ({mib:.1f} MiB), {args.terms} terms/category")
+    for name, fn in runs:
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        print(f"{name:<20} {dt:7.2f}s {mib / dt:7.1f} MiB/s")
+
+
+if __name__ == "__main__":
+    main()
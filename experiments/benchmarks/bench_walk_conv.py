@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Compare rlhf_maker's iterative walk_conv with the old recursive walker on
+synthetic deep (single chain) and wide (bushy, branching) conversation trees.
+
+    python experiments/benchmarks/bench_walk_conv.py --nodes 1000 10000 100000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import sys
+import time
+from datetime import datetime, timezone
+
+from rlhf_maker import generate_rlhf
+
+# ---- baseline reference --------------------------------------------------------------
+# The recursive walker and its row helpers as they were before the iterative rewrite
+# (the repo's first commit), copied verbatim apart from formatting, so the comparison
+# does not share any code with the walker under test.
+
+URL_RE = re.compile(r'https?://[^\s")]+', re.IGNORECASE)
+
+
+def to_iso(ts):
+    try:
+        return datetime.fromtimestamp(float(ts), tz=timezone.utc).isoformat()
+    except Exception:
+        return None
+
+
+def extract_urls(obj, urls):
+    if isinstance(obj, dict):
+        for v in obj.values():
+            extract_urls(v, urls)
+    elif isinstance(obj, list):
+        for v in obj:
+            extract_urls(v, urls)
+    elif isinstance(obj, str):
+        urls.update(URL_RE.findall(obj))
+
+
+def extract_text_from_content(content):
+    if not isinstance(content, dict):
+        return "", []
+    ct = content.get("content_type")
+    parts = content.get("parts", [])
+    texts, types = [], []
+    if ct in (
+        "text",
+        "multimodal_text",
+        "tool_result",
+        "code",
+        "json",
+        "user_editable_context",
+    ):
+        for p in parts:
+            if isinstance(p, dict):
+                pt = p.get("content_type")
+                types.append(pt or "dict")
+                if "text" in p:
+                    texts.append(str(p["text"]))
+            elif isinstance(p, str):
+                texts.append(p)
+                types.append("str")
+    return "\n".join(t for t in texts if t is not None).strip(), types
+
+
+def extract_assets(parts):
+    assets = []
+    for p in parts or []:
+        if isinstance(p, dict):
+            ct = p.get("content_type")
+            if ct and ct.endswith("_asset_pointer"):
+                assets.append(
+                    {
+                        "content_type": ct,
+                        "format": p.get("format"),
+                        "size_bytes": p.get("size_bytes"),
+                        "asset_pointer": p.get("asset_pointer"),
+                    }
+                )
+            if ct == "real_time_user_audio_video_asset_pointer":
+                ap = p.get("audio_asset_pointer") or {}
+                if ap.get("asset_pointer"):
+                    assets.append(
+                        {
+                            "content_type": "audio_asset_pointer",
+                            "format": ap.get("format"),
+                            "size_bytes": ap.get("size_bytes"),
+                            "asset_pointer": ap.get("asset_pointer"),
+                        }
+                    )
+    return assets
+
+
+def sort_children(mapping, ids):
+    def key(cid):
+        msg = (mapping.get(cid) or {}).get("message") or {}
+        ts = msg.get("create_time")
+        try:
+            return (float(ts), cid)
+        except Exception:
+            return (1e300, cid)
+
+    return sorted(ids, key=key)
+
+
+def walk_conv(conv):
+    """Return ordered list of nodes (seq order) with normalized fields."""
+    mapping = conv.get("mapping", {})
+    if not mapping:
+        return []
+
+    roots = [nid for nid, node in mapping.items() if node.get("parent") is None]
+    visited, ordered = set(), []
+
+    def walk(nid, depth):
+        if nid in visited:
+            return
+        visited.add(nid)
+        node = mapping.get(nid, {}) or {}
+        msg = node.get("message") or {}
+        author = msg.get("author") or {}
+        role = author.get("role")
+        author_name = author.get("name")
+        recipient = msg.get("recipient")
+        content = msg.get("content") or {}
+        text, part_types = extract_text_from_content(content)
+        assets = extract_assets(content.get("parts", []))
+        urls = set()
+        extract_urls(node, urls)
+
+        tool_call = role == "assistant" and recipient not in (None, "all")
+        tool_result = role == "tool"
+        tool_name = None
+        if tool_call:
+            tool_name = recipient
+        elif tool_result and author_name:
+            tool_name = author_name
+
+        ordered.append(
+            {
+                "node_id": nid,
+                "parent_id": node.get("parent"),
+                "depth": depth,
+                "role": role,
+                "author_name": author_name,
+                "recipient": recipient,
+                "tool_call": tool_call,
+                "tool_result": tool_result,
+                "tool_name": tool_name,
+                "type": content.get("content_type"),
+                "part_types": part_types,
+                "text": text,
+                "assets": assets,
+                "urls": sorted(urls),
+                "create_time": msg.get("create_time"),
+                "create_time_iso": to_iso(msg.get("create_time")),
+                "status": msg.get("status"),
+                "end_turn": msg.get("end_turn"),
+                "raw_content": content,  # keep full for tools
+            }
+        )
+        for cid in sort_children(mapping, node.get("children") or []):
+            walk(cid, depth + 1)
+
+    for r in sort_children(mapping, roots):
+        walk(r, 0)
+
+    # add seq
+    for i, r in enumerate(ordered):
+        r["seq"] = i
+    return ordered
+
+
+# ---- benchmark -----------------------------------------------------------------------
+
+
+def make_tree(n: int, shape: str, seed: int = 0) -> dict:
+    rng = random.Random(seed)
+    mapping = {"root": {"id": "root", "message": None, "parent": None, "children": []}}
+    ids = ["root"]
+    for i in range(n):
+        nid = f"n{i}"
+        if shape == "deep":
+            parent = ids[-1]
+        else:  # wide: attach to a random earlier node, giving a bushy, shallow tree
+            parent = ids[rng.randrange(len(ids))]
+        mapping[nid] = {
+            "id": nid,
+            "parent": parent,
+            "children": [],
+            "message": {
+                "author": {"role": "user" if i % 2 else "assistant"},
+                "recipient": "all",
+                "content": {"content_type": "text", "parts": [f"message {i}"]},
+                "create_time": 1_700_000_000 + rng.random() * n,
+            },
+        }
+        mapping[parent]["children"].append(nid)
+        ids.append(nid)
+    return {"conversation_id": f"{shape}-{n}", "mapping": mapping}
+
+
+def bench(fn, conv, repeat: int) -> float | None:
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        try:
+            fn(conv)
+        except RecursionError:
+            return None
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    ap.add_argument("--nodes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    print(f"recursion limit: {sys.getrecursionlimit()}")
+    print(
+        f"{'shape':<6} {'nodes':>8} {'recursive':>12} {'iterative':>12} {'speedup':>8}"
+    )
+    for shape in ("deep", "wide"):
+        for n in args.nodes:
+            conv = make_tree(n, shape)
+            rec = bench(walk_conv, conv, args.repeat)
+            it = bench(generate_rlhf.walk_conv, conv, args.repeat)
+            rec_s = "RecursionError" if rec is None else f"{rec * 1e3:9.1f} ms"
+            speed = "-" if rec is None else f"{rec / it:6.2f}x"
+            print(f"{shape:<6} {n:>8} {rec_s:>12} {it * 1e3:9.1f} ms {speed:>8}")
+
+
+if __name__ == "__main__":
+    main()
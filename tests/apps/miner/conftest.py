@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the miner scripts import their siblings as top-level modules (``import utils``)
+sys.path.insert(0, str(Path(__file__).resolve().parents[3] / "apps" / "miner"))
@@ -0,0 +1,44 @@
+from pathlib import Path
+
+import pandas as pd
+
+import chunk
+
+
+def test_iter_chunks_offsets_point_into_normalized_text(tmp_path: Path):
+    texts = {
+        "n0": "\n\n".join(" ".join(f"a{p}w{i}." for i in range(30)) for p in range(5)),
+        "n1": "",
+        "n2": "copy",
+    }
+    src = tmp_path / "normalized_extractions.parquet"
+    pd.DataFrame({"norm_cid": list(texts), "text": list(texts.values())}).to_parquet(
+        src
+    )
+
+    rows = list(
+        chunk.iter_chunks(
+            src, "v1", target_tokens=40, overlap_tokens=5, seen={"n2"}, batch_rows=2
+        )
+    )
+    assert {r["norm_cid"] for r in rows} == {"n0"}
+    for r in rows:
+        assert texts[r["norm_cid"]][r["span_start"] : r["span_end"]] == r["text"]
+    ids = [r["chunk_id"] for r in rows]
+    assert len(set(ids)) == len(ids)
+    again = chunk.iter_chunks(src, "v2", target_tokens=40, overlap_tokens=5)
+    assert next(again)["chunk_id"] != ids[0]  # recipe_v is part of the id
+
+
+def test_iter_chunks_chunks_one_copy_of_exact_duplicates(tmp_path: Path):
+    # normalize writes norm_cid = blake3(text + recipe_v), so exact copies share it
+    src = tmp_path / "normalized_extractions.parquet"
+    pd.DataFrame(
+        {"norm_cid": ["d", "u", "d"], "text": ["same text", "unique text", "same text"]}
+    ).to_parquet(src)
+
+    rows = list(chunk.iter_chunks(src, "v1", batch_rows=1))
+    assert [(r["norm_cid"], r["text"]) for r in rows] == [
+        ("d", "same text"),
+        ("u", "unique text"),
+    ]
@@ -0,0 +1,101 @@
+import random
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import dedupe
+
+
+def _doc(rng: random.Random, n: int = 300) -> list[str]:
+    return [f"w{rng.randrange(5000)}" for _ in range(n)]
+
+
+def test_dedupe_table_maps_exact_and_near_duplicates(tmp_path: Path):
+    rng = random.Random(0)
+    base = _doc(rng)
+    near = list(base)
+    near[150] = "changed"  # one word out of 300
+    texts = [" ".join(_doc(rng)) for _ in range(40)]
+    texts[5] = " ".join(base)
+    texts[17] = " ".join(base)  # exact copy
+    texts[30] = " ".join(near)
+    texts.append("")
+    rows = [{"norm_cid": f"n{i}", "text": t} for i, t in enumerate(texts)]
+    src = tmp_path / "normalized_extractions.parquet"
+    pd.DataFrame(rows).to_parquet(src)
+
+    stats = dedupe.dedupe_table(
+        src,
+        tmp_path / "dedupe_map.parquet",
+        tmp_path / "work",
+        batch_rows=7,
+        partitions=3,
+    )
+    assert stats == {"rows": 41, "exact": 1, "near": 1}
+    out = pd.read_parquet(tmp_path / "dedupe_map.parquet").set_index("norm_cid")
+    assert out.loc["n17", ["canonical_norm_cid", "match"]].tolist() == ["n5", "exact"]
+    assert out.loc["n30", ["canonical_norm_cid", "match"]].tolist() == ["n5", "near"]
+    assert out.loc["n30", "jaccard"] >= 0.88
+    dups = out[out.match != "self"].index
+    assert sorted(dups) == ["n17", "n30"]
+    assert not (tmp_path / "work").exists()
+
+
+def test_exact_copies_are_labeled_and_joined_past_the_leader_cap(
+    tmp_path: Path, monkeypatch
+):
+    rng = random.Random(1)
+    a, b = _doc(rng), _doc(rng)
+    near_a = list(a)
+    near_a[10] = "changed"
+    # n3 is an exact copy of n2, and both are near duplicates of the canonical n0
+    texts = [" ".join(t) for t in (a, b, near_a, near_a, a)]
+    src = tmp_path / "normalized_extractions.parquet"
+    pd.DataFrame({"norm_cid": [f"n{i}" for i in range(5)], "text": texts}).to_parquet(
+        src
+    )
+
+    def run():
+        dedupe.dedupe_table(src, tmp_path / "map.parquet", tmp_path / "work")
+        out = pd.read_parquet(tmp_path / "map.parquet").set_index("norm_cid")
+        return out[["canonical_norm_cid", "match"]].values.tolist()
+
+    assert run() == [
+        ["n0", "self"],
+        ["n1", "self"],
+        ["n0", "near"],
+        ["n0", "near"],
+        ["n0", "exact"],
+    ]
+    # with no leaders at all nothing is verified, but exact copies are still joined
+    monkeypatch.setattr(dedupe, "MAX_LEADERS", 0)
+    assert run() == [
+        ["n0", "self"],
+        ["n1", "self"],
+        ["n2", "self"],
+        ["n2", "exact"],
+        ["n0", "exact"],
+    ]
+
+
+def test_verify_bucket_leader_cap(monkeypatch):
+    # with one leader, a member unlike it is not compared with later members
+    monkeypatch.setattr(dedupe, "MAX_LEADERS", 1)
+    sigs = np.array([[1] * 10, [2] * 10, [2] * 9 + [3]], dtype=np.uint32)
+    uf = dedupe.UnionFind(3)
+    dedupe._verify_bucket(np.arange(3), sigs, uf, 0.8)
+    assert uf.roots().tolist() == [0, 1, 2]
+    monkeypatch.setattr(dedupe, "MAX_LEADERS", 2)
+    dedupe._verify_bucket(np.arange(3), sigs, uf, 0.8)
+    assert uf.roots().tolist() == [0, 1, 1]
+
+
+def test_signatures_do_not_depend_on_batching():
+    signer = dedupe.Signer(64)
+    texts = ["a b c d e f", "", "one two", "a b c d e f g"]
+    sig, sim = signer.sign(texts)
+    for i, t in enumerate(texts):
+        s1, h1 = signer.sign([t])
+        assert (s1[0] == sig[i]).all() and h1[0] == sim[i]
+    assert (sig[0] == sig[3]).mean() > 0.3
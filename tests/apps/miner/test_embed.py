@@ -0,0 +1,59 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import embed
+
+
+class CountingEmbedder(embed.HashEmbedder):
+    def __init__(self):
+        super().__init__(32)
+        self.seen: list[str] = []
+
+    def embed(self, texts):
+        self.seen.extend(texts)
+        return super().embed(texts)
+
+
+def _chunks(path: Path, texts: dict[str, str]) -> None:
+    pd.DataFrame({"chunk_id": list(texts), "text": list(texts.values())}).to_parquet(
+        path
+    )
+
+
+def test_embed_chunks_only_embeds_uncached_chunks(tmp_path: Path):
+    src, dst, cache = (
+        tmp_path / "chunks.parquet",
+        tmp_path / "emb.parquet",
+        tmp_path / "vec",
+    )
+    first = {f"c{i}": f"text number {i}" for i in range(7)}
+    _chunks(src, first)
+    model = CountingEmbedder()
+    stats = embed.embed_chunks(src, dst, cache, model, batch_size=3, batch_rows=4)
+    assert stats == {"rows": 7, "embedded": 7, "cached": 0}
+
+    second = {**{k: first[k] for k in ("c1", "c4")}, "c9": "a changed chunk"}
+    _chunks(src, second)
+    model.seen.clear()
+    stats = embed.embed_chunks(src, dst, cache, model, batch_size=3)
+    assert stats == {"rows": 3, "embedded": 1, "cached": 2}
+    assert model.seen == ["a changed chunk"]
+
+    out = pd.read_parquet(dst)
+    vecs = embed.load_vectors(Path(out.store[0]))
+    assert vecs.dtype == np.float16 and vecs.shape == (8, 32)
+    expected = model.embed(list(second.values())).astype(np.float16)
+    assert np.array_equal(vecs[out.row.to_numpy()], expected)
+
+
+def test_vector_cache_drops_rows_without_keys(tmp_path: Path):
+    with embed.VectorCache(tmp_path, "m", 4) as cache:
+        cache.add(["a", "b"], np.ones((2, 4)))
+    with open(tmp_path / "vectors.bin", "ab") as f:
+        f.write(b"\0" * 5)  # torn write of a third row
+    with embed.VectorCache(tmp_path, "m", 4) as cache:
+        assert len(cache) == 2 and "b" in cache
+        cache.add(["c"], np.full((1, 4), 2.0))
+        assert cache.vectors()[cache.row("c")].tolist() == [2.0] * 4
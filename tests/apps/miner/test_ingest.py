@@ -0,0 +1,94 @@
+import random
+from pathlib import Path
+
+import cdc
+import ingest
+
+
+def _fragments(data: bytes, avg: int, step: int) -> list[bytes]:
+    chunker = cdc.ContentChunker(avg)
+    out = []
+    for i in range(0, len(data), step):
+        out += chunker.feed(data[i : i + step])
+    return out + chunker.finish()
+
+
+def test_cdc_cuts_are_content_defined():
+    data = random.Random(0).randbytes(300_000)
+    frags = _fragments(data, 4096, 1 << 20)
+    assert b"".join(frags) == data
+    assert all(1024 <= len(f) <= 16384 for f in frags[:-1])
+    assert _fragments(data, 4096, 777) == frags  # independent of read size
+    assert _fragments(data, 4096, 5) == frags
+
+    # an edit near the front only changes the fragments around it
+    edited = _fragments(b"inserted" + data, 4096, 1 << 16)
+    assert len(set(edited) & set(frags)) >= len(frags) - 2
+
+
+def test_store_blob_roundtrip_and_dedup(tmp_path: Path):
+    data = random.Random(1).randbytes(200_000)
+    (tmp_path / "a.bin").write_bytes(data)
+    (tmp_path / "b.bin").write_bytes(data[:150_000] + b"tail")
+    objects = tmp_path / "objects"
+    for sub in ("blobs", "frags", "manifests"):
+        (objects / sub).mkdir(parents=True)
+
+    whole = ingest.store_blob(tmp_path / "a.bin", objects)
+    assert Path(whole["storage_uri"]) == objects / "blobs" / f"{whole['blob_cid']}.zst"
+    assert ingest.read_blob(objects, whole["blob_cid"]) == data
+
+    a = ingest.store_blob(tmp_path / "a.bin", objects, cdc_avg=8192)
+    n_frags = len(list((objects / "frags").iterdir()))
+    b = ingest.store_blob(tmp_path / "b.bin", objects, cdc_avg=8192)
+    assert a["blob_cid"] == whole["blob_cid"] and a["sha256"] == whole["sha256"]
+    assert ingest.read_blob(objects, b["blob_cid"]) == data[:150_000] + b"tail"
+    # the shared prefix is stored once
+    assert len(list((objects / "frags").iterdir())) - n_frags <= 3
+    assert not list((objects / "tmp").iterdir())
+
+
+def test_iter_files_prunes_excluded_dirs(tmp_path: Path, monkeypatch):
+    for rel in (
+        "a.txt",
+        "b.bin",
+        "docs/c.md",
+        "docs/.git/d.txt",
+        "x/node_modules/y/e.txt",
+    ):
+        (tmp_path / rel).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / rel).write_text(rel)
+
+    scanned = []
+    scandir = ingest.os.scandir
+    monkeypatch.setattr(ingest.os, "scandir", lambda p: scanned.append(p) or scandir(p))
+    found = ingest.iter_files(
+        tmp_path, ["**/*.txt", "**/*.md"], ["**/.git/**", "**/node_modules/**"]
+    )
+    assert [p.relative_to(tmp_path).as_posix() for p in found] == ["a.txt", "docs/c.md"]
+    assert not any(".git" in p or "node_modules" in p for p in scanned)
+
+
+def test_main_writes_tables_in_batches(tmp_path: Path, monkeypatch):
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    src = tmp_path / "in"
+    (src / "sub").mkdir(parents=True)
+    for i in range(7):
+        (src / ("sub" if i % 2 else "") / f"f{i}.txt").write_text(f"doc {i % 5}")
+    cfg = tmp_path / "cfg.yaml"
+    cfg.write_text(
+        f"paths:\n  input_dirs: ['{src}']\n  object_store: '{tmp_path}/objects'\n"
+        f"  processed_dir: '{tmp_path}/processed'\n  logs_dir: '{tmp_path}/logs'\n"
+        "ingest:\n  include_globs: ['**/*.txt']\n  workers: 3\n  batch_rows: 2\n"
+    )
+    monkeypatch.setattr("sys.argv", ["ingest.py", "--config", str(cfg)])
+    ingest.main()
+
+    processed = tmp_path / "processed"
+    sources = pd.read_parquet(processed / "sources.parquet")
+    assert sorted(Path(u).name for u in sources.uri) == [f"f{i}.txt" for i in range(7)]
+    assert pq.ParquetFile(processed / "sources.parquet").metadata.num_row_groups == 4
+    blobs = pd.read_parquet(processed / "blobs.parquet")
+    assert len(blobs) == 5 and set(blobs.blob_cid) == set(sources.blob_cid)
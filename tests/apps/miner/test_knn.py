@@ -0,0 +1,41 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import embed
+import knn
+
+
+def test_build_knn_follows_the_embeddings(tmp_path: Path):
+    texts = {f"c{i}": f"topic {i % 5} words {i} and more {i % 3}" for i in range(40)}
+    chunks = tmp_path / "chunks.parquet"
+    pd.DataFrame({"chunk_id": list(texts), "text": list(texts.values())}).to_parquet(
+        chunks
+    )
+    emb = tmp_path / "embeddings.parquet"
+    model = embed.HashEmbedder(32)
+    embed.embed_chunks(chunks, emb, tmp_path / "vectors", model)
+    paths = (tmp_path / "ann", tmp_path / "edges.parquet", tmp_path / "density.parquet")
+
+    stats = knn.build_knn(emb, *paths, k=4)
+    assert stats == {"chunks": 40, "added": 40, "deleted": 0, "edges": 160}
+    edges = pd.read_parquet(paths[1])
+    vecs = model.embed(list(texts.values())).astype(np.float16).astype(np.float32)
+    sims = vecs @ vecs.T
+    np.fill_diagonal(sims, -np.inf)
+    ids = np.array(list(texts))
+    first = edges[edges.src_chunk_id == "c0"]
+    assert set(first.dst_chunk_id) == set(ids[np.argsort(-sims[0])[:4]])
+    density = pd.read_parquet(paths[2]).set_index("chunk_id").knn_density
+    assert np.isclose(density["c0"], first.score.mean())
+
+    del texts["c7"]
+    pd.DataFrame({"chunk_id": list(texts), "text": list(texts.values())}).to_parquet(
+        chunks
+    )
+    embed.embed_chunks(chunks, emb, tmp_path / "vectors", model)
+    stats = knn.build_knn(emb, *paths, k=4)
+    assert stats["deleted"] == 1 and stats["added"] == 0 and stats["chunks"] == 39
+    edges = pd.read_parquet(paths[1])
+    assert "c7" not in set(edges.src_chunk_id) | set(edges.dst_chunk_id)
@@ -0,0 +1,125 @@
+import os
+import signal
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+import pytest
+
+import pandas as pd
+import pyarrow as pa
+
+import chunk
+import pipeline
+
+
+def _cfg(tmp_path: Path, inputs: Path) -> dict:
+    return {
+        "paths": {
+            "input_dirs": [str(inputs)],
+            "object_store": str(tmp_path / "objects"),
+            "processed_dir": str(tmp_path / "processed"),
+            "logs_dir": str(tmp_path / "logs"),
+        },
+        "ingest": {"include_globs": ["**/*.txt"], "workers": 2},
+        "chunk": {"target_tokens": 20, "overlap_tokens": 4},
+        "embed": {"backend": "hash", "dim": 16},
+    }
+
+
+def _run(cfg: dict, resume: bool = False) -> dict:
+    processed = Path(cfg["paths"]["processed_dir"])
+    with ExitStack() as stack:
+        stages = pipeline.build_stages(cfg, stack, batch_rows=3)
+        pipe = pipeline.Pipeline(stages, processed, processed / "_pipeline", depth=2)
+        return pipe.run(resume=resume)
+
+
+def _tables(cfg: dict) -> dict:
+    processed = Path(cfg["paths"]["processed_dir"])
+    names = ["blobs", "extractions", "normalized_extractions", "chunks", "embeddings"]
+    return {n: pd.read_parquet(processed / f"{n}.parquet") for n in names}
+
+
+def test_pipeline_streams_all_stages_and_resumes(tmp_path: Path, monkeypatch):
+    inputs = tmp_path / "in"
+    inputs.mkdir()
+    for i in range(10):
+        body = " ".join(f"word{i}_{j}." for j in range(50))
+        (inputs / f"f{i}.txt").write_text(body, encoding="utf-8")
+    (inputs / "copy.txt").write_text((inputs / "f0.txt").read_text())
+
+    cfg = _cfg(tmp_path / "clean", inputs)
+    stats = _run(cfg)
+    clean = _tables(cfg)
+    assert len(clean["blobs"]) == 10  # copy.txt shares f0's blob
+    assert stats["ingest"]["rows"] == {"sources": 11, "blobs": 10}
+    assert stats["dedupe"]["rows"]["rows"] == 10
+    assert len(clean["embeddings"]) == len(clean["chunks"]) > 10
+    assert not (Path(cfg["paths"]["processed_dir"]) / "_pipeline").exists()
+
+    cfg = _cfg(tmp_path / "crash", inputs)
+    real, calls = chunk.chunk_document, []
+
+    def flaky(*args, **kwargs):
+        calls.append(args[0])
+        if len(calls) == 5:
+            raise RuntimeError("boom")
+        return real(*args, **kwargs)
+
+    monkeypatch.setattr(chunk, "chunk_document", flaky)
+    with pytest.raises(RuntimeError, match="boom"):
+        _run(cfg)
+    done = pipeline.Pipeline(
+        [], Path("."), Path(cfg["paths"]["processed_dir"]) / "_pipeline"
+    )
+    assert done._load_state("ingest").batches >= 2
+    assert done._load_state("chunk").batches == 1  # the first 2 docs
+
+    def counting(*args, **kwargs):
+        calls.append(args[0])
+        return real(*args, **kwargs)
+
+    calls.clear()
+    monkeypatch.setattr(chunk, "chunk_document", counting)
+    _run(cfg, resume=True)
+    assert len(calls) == 8  # checkpointed docs are not chunked again
+    resumed = _tables(cfg)
+    assert resumed["blobs"].blob_cid.tolist() == clean["blobs"].blob_cid.tolist()
+    for name in ("extractions", "normalized_extractions", "chunks"):
+        pd.testing.assert_frame_equal(resumed[name], clean[name])
+    cols = ["obj_id", "row"]
+    pd.testing.assert_frame_equal(
+        resumed["embeddings"][cols], clean["embeddings"][cols]
+    )
+
+
+def test_ctrl_c_stops_the_stages_before_run_returns(tmp_path: Path):
+    done = []
+
+    def slow(batch):
+        time.sleep(0.05)
+        done.append(batch)
+        return {"a": batch}
+
+    schema = pa.schema([("x", pa.int64())])
+    stage = pipeline.Stage(
+        "a",
+        slow,
+        [pipeline.Output("a", schema)],
+        source=lambda: ([{"x": i}] for i in range(40)),
+    )
+    pipe = pipeline.Pipeline([stage], tmp_path, tmp_path / "work")
+    timer = threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGINT))  # a real Ctrl-C
+    timer.start()
+    try:
+        with pytest.raises(KeyboardInterrupt):
+            pipe.run()
+    finally:
+        timer.cancel()
+    assert pipe._abort.is_set()
+    n = len(done)
+    time.sleep(0.2)
+    assert len(done) == n < 40  # nothing runs once run() has returned
+    assert (tmp_path / "work").exists()  # checkpoints kept for resume
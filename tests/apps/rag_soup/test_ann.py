@@ -0,0 +1,179 @@
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from rag_soup import ann, mine_dump
+from rag_soup.ann import ANNIndex, update_zone_index
+from rag_soup.mine_dump import mine_dataset
+
+
+def _unit(x):
+    return (x / np.linalg.norm(x, axis=1, keepdims=True)).astype(np.float32)
+
+
+def _blobs(n, dim=32, centers=40, seed=0):
+    rng = np.random.default_rng(seed)
+    c = rng.normal(size=(centers, dim))
+    return _unit(c[rng.integers(0, centers, n)] + 0.35 * rng.normal(size=(n, dim)))
+
+
+def _brute(index, q, k):
+    v = np.asarray(index.vectors, dtype=np.float32)
+    s = q @ v.T
+    s[:, ~index.live] = -np.inf
+    return np.argsort(-s, axis=1, kind="stable")[:, :k]
+
+
+def test_exact_search_is_brute_force(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(ann, "ROW_BLOCK", 64)  # merge top-k across row blocks
+    x = _blobs(300)
+    index = ANNIndex(tmp_path / "idx", 32)
+    index.add([f"c{i}" for i in range(300)], x)
+    index.delete(["c0", "c5"])
+    q = _blobs(20, seed=1)
+    idx, val = index.search(q, 7)  # untrained: exact
+    np.testing.assert_array_equal(idx, _brute(index, q, 7))
+    assert not np.isin(idx, [0, 5]).any()
+    idx, _ = index.exact_search(q[:1], 500)
+    assert (idx[0, :298] >= 0).all() and (idx[0, 298:] == -1).all()
+
+
+def test_ivf_recall_and_incremental_inserts(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(ann, "MIN_TRAIN", 1000)
+    x = _blobs(4000)
+    index = ANNIndex(tmp_path / "idx", 32)
+    index.add([f"c{i}" for i in range(2000)], x[:2000])
+    assert index.trained and index.meta["trained_on"] == 2000
+    index.add([f"c{i}" for i in range(2000, 4000)], x[2000:])  # joins the lists, no retrain
+    assert index.meta["trained_on"] == 2000 and len(index) == 4000
+    q = _blobs(200, seed=2)
+    assert index.recall(q, k=10, nprobe=8) >= 0.9
+    assert index.recall(q, k=10, nprobe=index.meta["lists"]) == 1.0
+
+    reopened = ANNIndex(tmp_path / "idx")
+    np.testing.assert_array_equal(reopened.search(q, 10)[0], index.search(q, 10)[0])
+    # an inserted vector is its own nearest neighbour
+    top, _ = reopened.search(x[3990:], 1)
+    assert [reopened.keys[i] for i in top[:, 0]] == [f"c{i}" for i in range(3990, 4000)]
+
+
+def test_knn_graph_and_density(tmp_path: Path):
+    x = _blobs(200)
+    index = ANNIndex(tmp_path / "idx", 32)
+    index.add([f"c{i}" for i in range(200)], x)
+    src, dst, score = index.knn_graph(k=5)
+    assert len(src) == 200 * 5 and not (src == dst).any()
+    want = _brute(index, np.asarray(index.vectors, dtype=np.float32), 6)[:, 1:]
+    np.testing.assert_array_equal(dst.reshape(200, 5), want)
+    density = index.knn_density(src, score)
+    np.testing.assert_allclose(density, score.reshape(200, 5).mean(axis=1), rtol=1e-6)
+
+
+def _embeddings(tmp_path, chunks):
+    """An embeddings table in the store + row layout the miner's embed stage writes."""
+    store = tmp_path / "vectors" / "m"
+    store.mkdir(parents=True)
+    (store / "meta.json").write_text(json.dumps({"model": "m", "dim": 32, "dtype": "fp16"}))
+    x = _blobs(len(chunks)).astype(np.float16)
+    x.tofile(store / "vectors.bin")
+    emb = pd.DataFrame(
+        {
+            "obj_type": "chunk",
+            "obj_id": chunks.chunk_id,
+            "model": "m",
+            "dim": 32,
+            "dtype": "fp16",
+            "store": str(store),
+            "row": np.arange(len(chunks)),
+        }
+    )
+    emb.to_parquet(tmp_path / "embeddings.parquet")
+    return x
+
+
+def _mine(tmp_path):
+    src = tmp_path / "input"
+    src.mkdir()
+    (src / "a.txt").write_text("hello world\n\nthis is clean.", encoding="utf-8")
+    (src / "b.txt").write_text("another clean file", encoding="utf-8")
+    (src / "c.txt").write_text("explicit content nude nsfw", encoding="utf-8")
+    root = tmp_path / "data"
+    mine_dataset(src, root, "ds")
+    return src, root, pd.read_parquet(root / "catalog" / "chunks.parquet")
+
+
+def test_zone_indexes_follow_the_catalog(tmp_path: Path):
+    src, root, chunks = _mine(tmp_path)
+    x = _embeddings(tmp_path, chunks)
+
+    for zone in ("silver_normalized", "red_quarantine"):
+        stats = update_zone_index(root, zone, tmp_path / "embeddings.parquet")
+        assert stats["chunks"] == stats["added"] == (chunks.zone == zone).sum()
+        index = ANNIndex(ann.index_dir(root, zone))
+        assert set(index.live_keys()) == set(chunks.chunk_id[chunks.zone == zone])
+        row = int(np.flatnonzero(chunks.zone == zone)[0])
+        top, _ = index.search(x[row : row + 1].astype(np.float32), 1)
+        assert index.keys[top[0, 0]] == chunks.chunk_id[row]
+    assert (
+        update_zone_index(root, "silver_normalized", tmp_path / "embeddings.parquet")["added"] == 0
+    )
+
+    (src / "b.txt").unlink()
+    mine_dataset(src, root, "ds", incremental=True)
+    stats = update_zone_index(root, "silver_normalized", tmp_path / "embeddings.parquet")
+    assert stats["deleted"] == 1
+
+
+def test_changed_embeddings_replace_the_indexed_vector(tmp_path: Path):
+    _, root, chunks = _mine(tmp_path)
+    x = _embeddings(tmp_path, chunks)
+    emb_path = tmp_path / "embeddings.parquet"
+    update_zone_index(root, "silver_normalized", emb_path)
+    row = int(np.flatnonzero(chunks.zone == "silver_normalized")[0])
+    chunk_id = chunks.chunk_id[row]
+
+    # the chunk was re-chunked and re-embedded: same chunk_id, a new row in the store
+    emb = pd.read_parquet(emb_path)
+    store = Path(emb.store[0])
+    new = _blobs(1, seed=1).astype(np.float16)
+    with open(store / "vectors.bin", "ab") as f:
+        f.write(new.tobytes())
+    emb.loc[row, "row"] = len(chunks)
+    emb.to_parquet(emb_path)
+
+    stats = update_zone_index(root, "silver_normalized", emb_path)
+    assert stats["replaced"] == stats["added"] == 1
+    index = ANNIndex(ann.index_dir(root, "silver_normalized"))
+    assert len(index) == (chunks.zone == "silver_normalized").sum()
+    top, _ = index.search(new.astype(np.float32), 1)
+    assert index.keys[top[0, 0]] == chunk_id
+    top, _ = index.search(x[row : row + 1].astype(np.float32), 1)
+    assert index.keys[top[0, 0]] != chunk_id
+    assert update_zone_index(root, "silver_normalized", emb_path)["added"] == 0
+
+
+def test_mine_index_flag_builds_the_vector_indexes(tmp_path: Path, monkeypatch):
+    src, root, chunks = _mine(tmp_path)
+    _embeddings(tmp_path, chunks)
+    argv = ["rag-mine", "--input", str(src), "--root", str(root), "--dataset-id", "ds"]
+    monkeypatch.setattr(sys, "argv", argv + ["--index"])
+    mine_dump.main()
+    assert not ann.index_dir(root, "silver_normalized").exists()  # no embeddings given
+
+    monkeypatch.setattr(
+        sys, "argv", argv + ["--index", "--embeddings", str(tmp_path / "embeddings.parquet")]
+    )
+    mine_dump.main()
+    for zone in ("silver_normalized", "red_quarantine"):
+        index = ANNIndex(ann.index_dir(root, zone))
+        assert set(index.live_keys()) == set(chunks.chunk_id[chunks.zone == zone])
+
+
+def test_dim_mismatch_is_an_error(tmp_path: Path):
+    ANNIndex(tmp_path / "idx", 8)
+    with pytest.raises(ValueError):
+        ANNIndex(tmp_path / "idx", 16)
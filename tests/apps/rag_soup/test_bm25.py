@@ -0,0 +1,162 @@
+import math
+import random
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from rag_soup import bm25
+from rag_soup.bm25 import BM25Index, decode_varints, encode_varints, tokenize, update_zone_index
+from rag_soup.mine_dump import mine_dataset
+
+WORDS = [f"w{i}" for i in range(60)]
+
+
+def _corpus(n, seed):
+    rng = random.Random(seed)
+    # a skewed vocabulary, so some terms have long postings and some short
+    return {
+        f"c{seed}_{i}": " ".join(rng.choices(WORDS, weights=range(60, 0, -1), k=rng.randint(0, 40)))
+        for i in range(n)
+    }
+
+
+def _brute(docs, query, k1=1.2, b=0.75):
+    toks = {c: Counter(tokenize(t)) for c, t in docs.items()}
+    lens = {c: sum(tf.values()) for c, tf in toks.items()}
+    avgdl = sum(lens.values()) / len(lens)
+    out = {}
+    for term in dict.fromkeys(tokenize(query)):
+        df = sum(term in tf for tf in toks.values())
+        if not df:
+            continue
+        idf = math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for c, tf in toks.items():
+            if term in tf:
+                f = tf[term]
+                s = idf * f * (k1 + 1) / (f + k1 * (1 - b + b * lens[c] / avgdl))
+                out[c] = out.get(c, 0.0) + s
+    return out
+
+
+def _check(index, docs, queries, k=5):
+    for q in queries:
+        want = _brute(docs, q)
+        got = index.search(q, k)
+        assert all(c in want for c, _ in got)
+        best = sorted(want.values(), reverse=True)[:k]
+        np.testing.assert_allclose([s for _, s in got], best, rtol=1e-9)
+        np.testing.assert_allclose([s for _, s in got], [want[c] for c, _ in got], rtol=1e-9)
+
+
+QUERIES = ["w0 w1", "w5 w40 w59", "w30", "w2 w2 w3 w4 w50", "nothing here"]
+
+
+def test_varints_round_trip():
+    vals = np.array([0, 1, 127, 128, 300, 16383, 16384, 2**31, 2**40], dtype=np.int64)
+    data, offsets = encode_varints(vals)
+    assert offsets.tolist()[:5] == [0, 1, 2, 3, 5]
+    assert decode_varints(data).tolist() == vals.tolist()
+
+
+def test_search_matches_brute_force(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(bm25, "BLOCK", 4)  # many blocks per term
+    docs = _corpus(300, 0)
+    index = BM25Index(tmp_path / "idx")
+    assert index.add(list(docs), list(docs.values())) == 300
+    _check(index, docs, QUERIES)
+    _check(BM25Index(tmp_path / "idx"), docs, QUERIES)  # reopened from disk
+    ids = list(docs)[:50] + ["missing"]
+    want = _brute(docs, "w3 w7")
+    np.testing.assert_allclose(
+        index.scores("w3 w7", ids), [want.get(c, 0.0) for c in ids], rtol=1e-9
+    )
+
+
+def test_incremental_updates_and_merge(tmp_path: Path, monkeypatch):
+    monkeypatch.setattr(bm25, "BLOCK", 8)
+    monkeypatch.setattr(bm25, "MAX_SEGMENTS", 3)
+    index = BM25Index(tmp_path / "idx")
+    docs = {}
+    for seed in range(3):
+        part = _corpus(80, seed)
+        index.add(list(part), list(part.values()))
+        docs.update(part)
+    assert len(index.segments) == 3
+    gone = list(docs)[::7]
+    assert index.delete(gone) == len(gone)
+    for c in gone:
+        del docs[c]
+    assert all(c in docs for q in QUERIES for c, _ in index.search(q, 10))
+
+    part = _corpus(80, 3)
+    index.add(list(part), list(part.values()))  # a 4th segment triggers the merge
+    docs.update(part)
+    assert len(index.segments) == 1 and len(index) == len(docs)
+    _check(index, docs, QUERIES)
+    _check(BM25Index(tmp_path / "idx"), docs, QUERIES)
+
+    # a term whose only doc was deleted has no postings left to merge
+    index.add(["a", "b"], ["alpha common", "beta common"])
+    index.delete(["a"])
+    index.merge()
+    assert index.search("alpha") == [] and [c for c, _ in index.search("beta")] == ["b"]
+    assert "alpha" not in index.segments[0].terms
+
+
+def test_chunks_without_tokens(tmp_path: Path):
+    index = BM25Index(tmp_path / "idx")
+    assert index.add(["c1", "c2"], ["--- ...", ""]) == 2
+    assert len(index) == 2 and index.search("anything") == []
+    index.add(["c3"], ["some words"])
+    index.merge()
+    assert [c for c, _ in index.search("words")] == ["c3"] and len(index) == 3
+
+
+def test_zone_index_follows_the_catalog(tmp_path: Path):
+    src = tmp_path / "input"
+    src.mkdir()
+    (src / "a.txt").write_text("the quick brown fox\n\njumps over the lazy dog", encoding="utf-8")
+    (src / "b.txt").write_text("a slow green turtle", encoding="utf-8")
+    root = tmp_path / "data"
+    mine_dataset(src, root, "ds")
+    stats = update_zone_index(root, "silver_normalized")
+    assert stats["added"] == stats["chunks"] > 0
+    assert update_zone_index(root, "silver_normalized")["added"] == 0
+
+    (src / "b.txt").unlink()
+    mine_dataset(src, root, "ds", incremental=True)
+    stats = update_zone_index(root, "silver_normalized")
+    assert stats["deleted"] == 1
+    index = BM25Index(bm25.index_dir(root, "silver_normalized"))
+    assert index.search("turtle") == []
+    assert len(index.search("fox")) == 1
+
+
+def test_rechunked_chunks_are_reindexed(tmp_path: Path, monkeypatch):
+    from rag_soup import mine_dump
+
+    src = tmp_path / "input"
+    src.mkdir()
+    (src / "a.txt").write_text("old fox\n\nnew turtle", encoding="utf-8")
+    root = tmp_path / "data"
+    mine_dataset(src, root, "ds")
+    update_zone_index(root, "silver_normalized")
+    index = BM25Index(bm25.index_dir(root, "silver_normalized"))
+    ((chunk_id, _),) = index.search("turtle")
+    assert [c for c, _ in index.search("fox")] == [chunk_id]
+
+    # a chunker change: the doc's chunk 0 keeps its id but now holds only "old fox"
+    monkeypatch.setattr(
+        mine_dump, "chunk_paragraphs", lambda t: [(0, 7, t[:7]), (9, len(t), t[9:])]
+    )
+    mine_dataset(src, root, "ds")
+    stats = update_zone_index(root, "silver_normalized")
+    assert stats["replaced"] == 1 and stats["added"] == 2 and stats["chunks"] == 2
+    index = BM25Index(bm25.index_dir(root, "silver_normalized"))
+    assert [c for c, _ in index.search("fox")] == [chunk_id]
+    assert chunk_id not in [c for c, _ in index.search("turtle")]
+    assert len(index.search("turtle")) == 1
+    assert update_zone_index(root, "silver_normalized")["added"] == 0
+    index.merge()
+    assert update_zone_index(root, "silver_normalized")["added"] == 0
@@ -0,0 +1,34 @@
+from pathlib import Path
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from rag_soup.catalog import MANIFEST_SCHEMA, TableWriter
+
+
+def _entry(i):
+    return {"source_path": f"f{i}", "size": i, "mtime_ns": i, "dev": 1, "inode": i, "checksum": "x"}
+
+
+def test_table_writer_flushes_row_groups_in_order(tmp_path: Path):
+    path = tmp_path / "manifest.parquet"
+    with TableWriter(path, MANIFEST_SCHEMA, row_group_size=2) as w:
+        w.write_frame(pd.DataFrame([_entry(0)]))
+        for i in range(1, 6):
+            w.write_dict(_entry(i))
+        assert not path.exists()  # only published on close
+    assert pq.ParquetFile(path).metadata.num_row_groups == 4
+    assert pd.read_parquet(path).source_path.tolist() == [f"f{i}" for i in range(6)]
+
+
+def test_table_writer_keeps_old_table_on_error(tmp_path: Path):
+    path = tmp_path / "manifest.parquet"
+    with TableWriter(path, MANIFEST_SCHEMA) as w:
+        w.write_dict(_entry(0))
+    with pytest.raises(RuntimeError):
+        with TableWriter(path, MANIFEST_SCHEMA) as w:
+            w.write_dict(_entry(1))
+            raise RuntimeError("boom")
+    assert pd.read_parquet(path).source_path.tolist() == ["f0"]
+    assert [p.name for p in tmp_path.iterdir()] == ["manifest.parquet"]
@@ -0,0 +1,39 @@
+import pytest
+
+from rag_soup.chunking import chunk_spans, chunk_text
+
+
+def _text(n_paras=12, words=40):
+    paras = []
+    for p in range(n_paras):
+        sents = [" ".join(f"w{p}_{s}_{i}" for i in range(9)) + "." for s in range(words // 10)]
+        paras.append(" ".join(sents))
+    return "\n\n".join(paras)
+
+
+@pytest.mark.parametrize("splitter", ["semantic", "fixed"])
+def test_spans_are_exact_and_cover_every_token(splitter):
+    text = _text()
+    spans = list(chunk_spans(text, target_tokens=50, overlap_tokens=10, splitter=splitter))
+    assert spans[0].start == 0 and spans[-1].end == len(text)
+    for a, b in zip(spans, spans[1:]):
+        assert a.start < b.start <= a.end or not text[a.end : b.start].strip()
+    for s in spans:
+        assert s.tokens == len(text[s.start : s.end].split()) <= 50
+
+
+def test_semantic_cuts_at_paragraphs_and_overlaps_at_sentences():
+    text = _text()
+    chunks = list(chunk_text(text, target_tokens=90, overlap_tokens=15))
+    first, second = chunks[0], chunks[1]
+    assert first[2].endswith(".") and text[first[1] : first[1] + 2] == "\n\n"
+    # the next chunk starts at the last sentence of the previous one
+    assert first[0] < second[0] < first[1]
+    assert text[second[0] - 2 : second[0]] == ". "
+
+
+def test_max_chars_splits_long_runs():
+    text = "short words here " + "x" * 250 + " tail"
+    spans = list(chunk_spans(text, target_tokens=100, max_chars=100))
+    assert max(s.end - s.start for s in spans) <= 100
+    assert "".join(text[s.start : s.end] for s in spans).replace(" ", "") == text.replace(" ", "")
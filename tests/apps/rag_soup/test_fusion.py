@@ -0,0 +1,59 @@
+import random
+
+import numpy as np
+
+from rag_soup import fusion
+from rag_soup.fusion import DocIds, Results, rrf, rrf_batch, z_fuse, z_fuse_batch
+
+
+def _rankings(rng, n_queries, n_retrievers, pool=40, depth=15):
+    out = []
+    for _ in range(n_queries):
+        per = []
+        for _ in range(n_retrievers):
+            docs = rng.sample(range(pool), rng.randint(0, depth))
+            per.append({f"d{d}": rank + 1 for rank, d in enumerate(docs)})
+        out.append(per)
+    return out
+
+
+def _batch(per_query, ids):
+    return [Results.from_dicts([q[r] for q in per_query], ids) for r in range(len(per_query[0]))]
+
+
+def test_rrf_batch_matches_rrf(monkeypatch):
+    monkeypatch.setattr(fusion, "BLOCK_CELLS", 64)  # many small query blocks
+    per_query = _rankings(random.Random(0), 50, 3)
+    ids = DocIds()
+    docs, scores = rrf_batch(_batch(per_query, ids), weights=[0.5, 0.3, 0.2], top_k=8)
+    for q, rankings in enumerate(per_query):
+        want = rrf(rankings, weights=[0.5, 0.3, 0.2])[:8]
+        assert ids.decode(docs[q]) == [d for d, _ in want]
+        assert scores[q, : len(want)].tolist() == [s for _, s in want]
+        assert np.isnan(scores[q, len(want) :]).all()
+        assert (docs[q, len(want) :] == -1).all()
+
+
+def test_z_fuse_batch_matches_z_fuse():
+    rng = random.Random(1)
+    per_query = [
+        [{d: rng.random() for d in ranking} for ranking in q] for q in _rankings(rng, 40, 4)
+    ]
+    ids = DocIds()
+    docs, scores = z_fuse_batch(_batch(per_query, ids), top_k=5)
+    for q, dicts in enumerate(per_query):
+        want = dict(z_fuse(dicts))
+        got = ids.decode(docs[q])
+        assert len(got) == min(5, len(want))
+        np.testing.assert_allclose(scores[q, : len(got)], [want[d] for d in got], atol=1e-12)
+        # the kept docs are a best top-k of the dict version
+        best = sorted(want.values(), reverse=True)[: len(got)]
+        np.testing.assert_allclose(sorted(scores[q, : len(got)], reverse=True), best, atol=1e-12)
+
+
+def test_ties_keep_first_sighting():
+    ids = DocIds()
+    a = Results.from_dicts([{"x": 1, "y": 2}], ids)
+    b = Results.from_dicts([{"y": 1, "x": 2}], ids)
+    docs, _ = rrf_batch([a, b], top_k=2)
+    assert ids.decode(docs[0]) == ["x", "y"]
@@ -24,3 +24,140 @@ def test_mining_end_to_end(tmp_path: Path):
     # zones
     assert (root / "silver_normalized").exists()
     assert (root / "red_quarantine").exists()
+
+
+def test_pipelined_mining_matches_serial(tmp_path: Path):
+    import pandas as pd
+
+    src = tmp_path / "input"
+    (src / "sub").mkdir(parents=True)
+    for i in range(12):
+        body = "\n\n".join(f"para {j} of doc {i} " * (i + 1) for j in range(i % 4 + 1))
+        (src / ("sub" if i % 2 else "") / f"f{i}.txt").write_text(body, encoding="utf-8")
+    (src / "hate.txt").write_text("you idiot", encoding="utf-8")
+
+    mine_dataset(src, tmp_path / "serial", "ds")
+    mine_dataset(src, tmp_path / "piped", "ds", workers=2, queue_depth=3)
+    for table in ("docs", "chunks"):
+        a = pd.read_parquet(tmp_path / "serial" / "catalog" / f"{table}.parquet")
+        b = pd.read_parquet(tmp_path / "piped" / "catalog" / f"{table}.parquet")
+        pd.testing.assert_frame_equal(a, b)
+
+
+def test_incremental_mining_skips_unchanged(tmp_path: Path, monkeypatch):
+    import pandas as pd
+    from rag_soup import mine_dump
+
+    src = tmp_path / "input"
+    src.mkdir()
+    (src / "a.txt").write_text("alpha\n\nbeta", encoding="utf-8")
+    (src / "b.txt").write_text("gamma", encoding="utf-8")
+    (src / "c.txt").write_text("delta", encoding="utf-8")
+    root = tmp_path / "data"
+    mine_dataset(src, root, "ds")
+
+    (src / "b.txt").write_text("gamma changed", encoding="utf-8")
+    (src / "c.txt").unlink()
+    (src / "d.txt").write_text("you idiot", encoding="utf-8")
+    (src / "a.txt").rename(src / "renamed.txt")
+
+    read = []
+    ingest = mine_dump._ingest_file
+    monkeypatch.setattr(mine_dump, "_ingest_file", lambda p, b: read.append(p.name) or ingest(p, b))
+    mine_dataset(src, root, "ds", incremental=True)
+    assert sorted(read) == ["b.txt", "d.txt"]
+
+    docs = pd.read_parquet(root / "catalog" / "docs.parquet")
+    assert sorted(docs.title) == ["b.txt", "d.txt", "renamed.txt"]
+    chunks = pd.read_parquet(root / "catalog" / "chunks.parquet")
+    texts = mine_dump.read_chunk_texts(root, chunks)
+    assert sorted(texts) == ["alpha\n\nbeta", "gamma changed", "you idiot"]
+
+
+def test_pack_store_reopen_and_random_access(tmp_path: Path):
+    from rag_soup.pack_store import PackStore
+
+    with PackStore(tmp_path, segment_bytes=64) as st:
+        locs = {f"k{i}": st.put(f"k{i}", f"record {i} " * 8) for i in range(10)}
+        assert st.put("k3", "ignored") == locs["k3"]  # keys are immutable
+    assert len({seg for seg, _, _ in locs.values()}) > 1
+
+    # an interrupted append leaves unindexed bytes at the tail; reopening drops them
+    last = max(locs.values())
+    with open(tmp_path / f"seg-{last[0]:05d}.pack", "ab") as f:
+        f.write(b"torn")
+    with PackStore(tmp_path, segment_bytes=64) as st:
+        assert st.get("k7").decode() == "record 7 " * 8
+        assert st.read(*locs["k2"]).decode() == "record 2 " * 8
+        loc = st.put("new", "x")
+        assert st.get("new") == b"x" and loc not in locs.values()
+
+
+def test_pack_store_rollover_after_a_crash(tmp_path: Path):
+    import hashlib
+
+    from rag_soup.pack_store import PackStore
+
+    def text(i):  # ~64 incompressible bytes, so a few records fill a segment
+        return hashlib.sha256(str(i).encode()).hexdigest()
+
+    with PackStore(tmp_path, segment_bytes=200) as st:
+        for i in range(6):
+            st.put(f"k{i}", text(i))
+    last = max(seg for seg, _, _ in st.index.values())
+    assert last > 0
+    # a crash after the rollover: the last segment's bytes are on disk, its index lines not
+    index = tmp_path / "index.tsv"
+    lines = index.read_text().splitlines(keepends=True)
+    index.write_text("".join(line for line in lines if line.split("\t")[1] != str(last)))
+
+    with PackStore(tmp_path, segment_bytes=200) as st:
+        for i in range(6, 12):
+            st.put(f"k{i}", text(i))
+    with PackStore(tmp_path, segment_bytes=200) as st:
+        assert len(st.index) == 12 - sum(line.split("\t")[1] == str(last) for line in lines)
+        for key in st.index:
+            assert st.get(key).decode() == text(int(key[1:]))
+
+
+def test_read_only_pack_store_leaves_a_writer_alone(tmp_path: Path):
+    import io
+
+    import pytest
+    from rag_soup.pack_store import PackStore
+
+    with PackStore(tmp_path) as st:
+        loc = st.put("k", "kept")
+        st.flush()
+        seg = tmp_path / f"seg-{loc[0]:05d}.pack"
+        with open(seg, "ab") as f:
+            f.write(b"in-flight")  # record bytes whose index line is not written yet
+        with open(tmp_path / "index.tsv", "a", encoding="utf-8") as f:
+            f.write("half\t0\t1")
+        size, index = seg.stat().st_size, (tmp_path / "index.tsv").read_text()
+        with PackStore(tmp_path, read_only=True) as ro:
+            assert ro.read(*loc) == b"kept" and list(ro.index) == ["k"]
+            with pytest.raises(io.UnsupportedOperation):
+                ro.put("other", "x")
+        assert seg.stat().st_size == size and (tmp_path / "index.tsv").read_text() == index
+
+
+def test_rechunked_text_is_not_served_stale(tmp_path: Path, monkeypatch):
+    import pandas as pd
+    from rag_soup import mine_dump
+
+    src = tmp_path / "input"
+    src.mkdir()
+    (src / "a.txt").write_text("first part\n\nsecond part", encoding="utf-8")
+    root = tmp_path / "data"
+    mine_dataset(src, root, "ds")
+    chunks = pd.read_parquet(root / "catalog" / "chunks.parquet")
+    assert mine_dump.read_chunk_texts(root, chunks) == ["first part\n\nsecond part"]
+
+    # a chunker change: same doc, same chunk_id for chunk 0, different text
+    monkeypatch.setattr(
+        mine_dump, "chunk_paragraphs", lambda t: [(0, 10, t[:10]), (12, len(t), t[12:])]
+    )
+    mine_dataset(src, root, "ds")
+    chunks = pd.read_parquet(root / "catalog" / "chunks.parquet")
+    assert mine_dump.read_chunk_texts(root, chunks) == ["first part", "second part"]
@@ -0,0 +1,37 @@
+import numpy as np
+
+from rag_soup.mmr import mmr_indices, mmr_select
+from rag_soup.schemas import Chunk
+
+
+def _items(docs):
+    return [
+        Chunk(doc_uid=d, chunk_id=f"c{i}", text="", offset=(0, 0), lang="en")
+        for i, d in enumerate(docs)
+    ]
+
+
+def test_embeddings_and_callback_pick_the_same_diverse_items():
+    # c0 and c1 are near copies; c2 is less relevant but different
+    emb = np.array([[1.0, 0.0], [0.99, 0.14], [0.0, 1.0], [0.7, 0.7]])
+    items = _items(["a", "b", "c", "d"])
+    scores = {"c0": 0.9, "c1": 0.88, "c2": 0.6, "c3": 0.1}
+    by_emb = mmr_select(items, scores, k=2, lam=0.5, embeddings=emb)
+    by_sim = mmr_select(
+        items,
+        scores,
+        k=2,
+        lam=0.5,
+        sim=lambda a, b: float(emb[int(a.chunk_id[1:])] @ emb[int(b.chunk_id[1:])]),
+    )
+    assert [it.chunk_id for it in by_emb] == ["c0", "c2"]
+    assert by_sim == by_emb
+
+
+def test_cap_per_doc_and_relevance_order_without_similarity():
+    items = _items(["a", "a", "a", "b", "b"])
+    scores = {"c0": 0.5, "c1": 0.9, "c2": 0.8, "c3": 0.1, "c4": 0.3}
+    picked = mmr_select(items, scores, k=4, cap_per_doc=2)
+    assert [it.chunk_id for it in picked] == ["c1", "c2", "c4", "c3"]
+    assert mmr_select(items, scores, k=4, cap_per_doc=0) == []
+    assert mmr_indices([0.2, 0.2, 0.1], k=2) == [0, 1]  # ties keep input order
@@ -0,0 +1,25 @@
+from rag_soup.safety_adapter import SafetyAdapter, TermScanner
+
+
+def test_scanner_counts_whole_words_per_category():
+    scanner = TermScanner(
+        {"toxicity": ["kill", "killer", "Hate"], "illicit": ["exploit kit"]},
+        {"pii": [r"\d{3}-\d{2}-\d{4}"]},
+    )
+    text = "KILL the killer; hated skill. exploit kit at 123-45-6789, not 1234-45-6789"
+    assert scanner.count(text) == {"toxicity": 2, "illicit": 1, "pii": 1}
+
+
+def test_batch_matches_per_text():
+    scanner = TermScanner({"nsfw": ["nsfw", "xxx"], "toxicity": ["idiot"]})
+    texts = ["nsfw", "", "idiot idiot", "xx x", "xxx nsfw", "the idiot"]
+    assert scanner.count_batch(texts) == [scanner.count(t) for t in texts]
+    assert scanner.count_batch([]) == []
+
+
+def test_adapter_scores_and_routes():
+    adapter = SafetyAdapter({"toxicity": 0.5, "pii": 0.6})
+    scores = adapter.score_batch(["you idiot", "fine text"])
+    assert scores[0]["toxicity"] == 1.0 and scores[1]["toxicity"] == 0.0
+    assert adapter.route(scores[0]) == {"zone": "red_quarantine", "reasons": ["toxicity"]}
+    assert adapter.route(scores[1])["zone"] == "silver_normalized"
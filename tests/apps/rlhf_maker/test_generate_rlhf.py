@@ -0,0 +1,233 @@
+import io
+import json
+from pathlib import Path
+
+import pytest
+
+from rlhf_maker.generate_rlhf import (
+    conv_rows,
+    extract_assets,
+    extract_text_from_content,
+    generate,
+    imap_ordered,
+    iter_json_array,
+    make_segments,
+    mine_conv,
+    msgs_to_sft,
+    parse_dump,
+    scan_node,
+    segment_ranges,
+    walk_conv,
+)
+
+
+def _conv(cid, turns):
+    mapping = {"root": {"id": "root", "message": None, "parent": None, "children": []}}
+    parent = "root"
+    for i, (role, text) in enumerate(turns):
+        nid = f"{cid}-{i}"
+        mapping[nid] = {
+            "id": nid,
+            "parent": parent,
+            "children": [],
+            "message": {
+                "author": {"role": role},
+                "recipient": "all",
+                "content": {"content_type": "text", "parts": [text]},
+                "create_time": 1000.0 + i,
+                "end_turn": True,
+            },
+        }
+        mapping[parent]["children"].append(nid)
+        parent = nid
+    return {"conversation_id": cid, "mapping": mapping}
+
+
+def test_iter_json_array_small_buffer() -> None:
+    convs = [
+        _conv(f"c{i}", [("user", "hi " * i), ("assistant", "hello")]) for i in range(20)
+    ]
+    raw = json.dumps(convs, indent=1)
+    assert list(iter_json_array(io.StringIO(raw), bufsize=7)) == convs
+    assert list(iter_json_array(io.StringIO(" [ ] "))) == []
+    assert list(iter_json_array(io.StringIO(json.dumps(convs[0])))) == [convs[0]]
+
+
+def test_iter_json_array_scalars_split_at_the_buffer_edge() -> None:
+    # "-4." decodes as -4 and "1.0e" as 1.0 if the buffer ends there
+    values = [
+        1,
+        22,
+        333,
+        "x",
+        True,
+        None,
+        {"a": [1, 2]},
+        -4.5e3,
+        12345678901234567890,
+        1.0e-5,
+    ]
+    raw = json.dumps(values)
+    for bufsize in range(1, len(raw) + 1):
+        assert list(iter_json_array(io.StringIO(raw), bufsize=bufsize)) == values
+        assert list(iter_json_array(io.StringIO(" -4.5e3 "), bufsize=bufsize)) == [
+            -4.5e3
+        ]
+
+
+def test_conv_rows_correction_pair() -> None:
+    conv = _conv(
+        "c1",
+        [
+            ("user", "what is 2+2?"),
+            ("assistant", "5"),
+            ("user", "no, that's wrong"),
+            ("assistant", "4"),
+        ],
+    )
+    [(cid, ordered)] = parse_dump(conv)
+    sft, pairs, tools = conv_rows(cid, ordered)
+    assert [len(s["messages"]) for s in sft] == [4]
+    assert len(pairs) == 1
+    assert pairs[0]["rejected"] == "5" and pairs[0]["chosen"] == "4"
+    assert pairs[0]["meta"]["conv_id"] == "c1"
+    assert tools == []
+
+
+def test_imap_ordered_matches_serial() -> None:
+    convs = [
+        _conv(
+            f"c{i}",
+            [("user", "q"), ("assistant", "a"), ("user", "wrong"), ("assistant", "b")],
+        )
+        for i in range(10)
+    ]
+    serial = [mine_conv(c) for c in convs]
+    assert (
+        list(imap_ordered(mine_conv, convs, workers=2, batch_size=3, window=2))
+        == serial
+    )
+
+
+def test_walk_conv_deep_chain() -> None:
+    conv = _conv(
+        "deep", [("user" if i % 2 else "assistant", f"m{i}") for i in range(5000)]
+    )
+    ordered = walk_conv(conv)
+    assert len(ordered) == 5001
+    assert ordered[-1]["depth"] == 5000
+    assert [r["seq"] for r in ordered[:3]] == [0, 1, 2]
+
+
+def test_scan_node_single_pass() -> None:
+    content = {
+        "content_type": "multimodal_text",
+        "parts": [
+            "see https://a.example/x",
+            {
+                "content_type": "image_asset_pointer",
+                "asset_pointer": "file-service://f1",
+                "size_bytes": 3,
+            },
+        ],
+    }
+    node = {"message": {"content": content, "metadata": {"ref": "http://b.example/y"}}}
+    text, types, assets, urls = scan_node(node, content)
+    assert text == "see https://a.example/x"
+    assert types == ["str", "image_asset_pointer"]
+    assert [a["asset_pointer"] for a in assets] == ["file-service://f1"]
+    assert urls == ["http://b.example/y", "https://a.example/x"]
+    assert scan_node(node, content, urls=False)[3] == []
+    assert extract_text_from_content(content) == (text, types)
+    assert extract_assets(content["parts"]) == assets
+
+
+def test_generate_incremental_matches_full_run(tmp_path: Path) -> None:
+    convs = [
+        _conv(
+            f"c{i}",
+            [
+                ("user", "q"),
+                ("assistant", f"a{i}"),
+                ("user", "wrong"),
+                ("assistant", "b"),
+            ],
+        )
+        for i in range(5)
+    ]
+    for i, c in enumerate(convs):
+        c["update_time"] = 100 + i
+    dump = tmp_path / "dump.json"
+    dump.write_text(json.dumps(convs), encoding="utf-8")
+    out = tmp_path / "out"
+    assert generate([dump], out, incremental=True)[1] == 0
+
+    changed = _conv(
+        "c2", [("user", "q"), ("assistant", "sorry, new"), ("assistant", "fixed")]
+    )
+    changed["update_time"] = 999
+    convs = (
+        convs[:2]
+        + [changed]
+        + convs[3:]
+        + [_conv("c9", [("user", "hi"), ("assistant", "yo")])]
+    )
+    dump.write_text(json.dumps(convs), encoding="utf-8")
+    counts, reused = generate([dump], out, incremental=True, stream=True)
+    assert reused == 4
+
+    fresh = tmp_path / "fresh"
+    assert generate([dump], fresh)[0] == counts
+    for name in ("sft", "dpo_pairs", "tool_traces"):
+        assert (out / f"{name}.jsonl").read_bytes() == (
+            fresh / f"{name}.jsonl"
+        ).read_bytes()
+
+
+def test_generate_parquet(tmp_path: Path) -> None:
+    pq = pytest.importorskip("pyarrow.parquet")
+    conv = _conv(
+        "c1",
+        [("user", "q"), ("assistant", "5"), ("user", "no, wrong"), ("assistant", "4")],
+    )
+    dump = tmp_path / "dump.json"
+    dump.write_text(json.dumps([conv]), encoding="utf-8")
+    counts, _ = generate([dump], tmp_path / "out", fmt="parquet", raw=False)
+    sft = pq.read_table(tmp_path / "out" / "sft.parquet")
+    assert sft.num_rows == counts["sft"] == 1
+    assert "raw_content" not in sft.column_names
+    assert sft.column("messages")[0].as_py()[1] == {
+        "role": "assistant",
+        "content": "5",
+        "tool_name": None,
+    }
+    pairs = pq.read_table(tmp_path / "out" / "dpo_pairs.parquet").to_pylist()
+    assert [(p["signal"], p["rejected"], p["chosen"]) for p in pairs] == [
+        ("user_correction", "5", "4")
+    ]
+
+
+def test_segment_ranges_budget_and_stride() -> None:
+    turns = [("user", "one two"), ("assistant", "three four five")] * 4
+    [(_, ordered)] = parse_dump(_conv("c", turns))
+    # row 0 is the empty root; user anchors at 1, 3, 5, 7
+    # non-overlapping by default; stride=1 starts a segment at every user turn
+    assert list(segment_ranges(ordered, max_exchanges=2)) == [(1, 5), (5, 9)]
+    assert list(segment_ranges(ordered, max_exchanges=2, stride=1)) == [
+        (1, 5),
+        (3, 7),
+        (5, 9),
+        (7, 9),
+    ]
+    assert [(seg[0]["seq"], seg[-1]["seq"]) for seg in make_segments(ordered, 2)] == [
+        (1, 4),
+        (5, 8),
+    ]
+    sft, _, _ = conv_rows("c", ordered, max_exchanges=2)
+    assert [msgs_to_sft(seg, "c") for seg in make_segments(ordered, 2)] == sft
+    assert list(segment_ranges(ordered, max_exchanges=3, max_tokens=6)) == [
+        (1, 3),
+        (3, 5),
+        (5, 7),
+        (7, 9),
+    ]